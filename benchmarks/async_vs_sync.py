@@ -0,0 +1,152 @@
+"""Sync threadpool routes vs AsyncSession routes under concurrent reads
+
+    python -m benchmarks.async_vs_sync --requests 2000 --concurrency 64
+
+Both stacks are served in-process through httpx's ASGI transport against the
+same seeded SQLite file (`sqlite` / `sqlite+aiosqlite`), so the numbers compare
+request handling overhead rather than network or Postgres latency.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from shame import async_route, models, route
+from shame.auth.models import User
+from shame.database import Base, get_async_database, get_database
+
+
+def seed(url: str, stories: int) -> None:
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(
+            insert(User),
+            [{"id": 0, "username": "bench", "password_hashed": "-", "rating": 0}],
+        )
+        connection.execute(
+            insert(models.Address),
+            [{"id": 0, "country": "UA", "state": "Lviv", "city": "Lviv", "street": "-"}],
+        )
+        connection.execute(
+            insert(models.ShameStory),
+            [
+                {
+                    "title": f"Story {i}",
+                    "text": "Lorem ipsum dolor sit amet " * 8,
+                    "agree": i % 97,
+                    "author_id": 0,
+                    "address_id": 0,
+                }
+                for i in range(stories)
+            ],
+        )
+    engine.dispose()
+
+
+def sync_app(url: str) -> FastAPI:
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    Session = sessionmaker(engine, autocommit=False, autoflush=False)
+
+    def get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(route.router)
+    app.dependency_overrides[get_database] = get_db
+    return app
+
+
+def async_app(url: str) -> FastAPI:
+    engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+    Session = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+    async def get_db():
+        async with Session() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(async_route.router)
+    app.dependency_overrides[get_async_database] = get_db
+    return app
+
+
+async def drive(app: FastAPI, paths: list[str], concurrency: int) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    queue: asyncio.Queue[str] = asyncio.Queue()
+    for path in paths:
+        queue.put_nowait(path)
+
+    transport = httpx.ASGITransport(app=app)  # type: ignore[arg-type]
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                path = queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.get(path)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "req_per_sec": len(latencies) / elapsed,
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stories", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        seed(url, args.stories)
+
+        paths = [
+            f"/shamestories/{i % args.stories + 1}"
+            if i % 2
+            else "/shamestories/feed?limit=20"
+            for i in range(args.requests)
+        ]
+        for name, app in (("sync", sync_app(url)), ("async", async_app(url))):
+            result = asyncio.run(drive(app, paths, args.concurrency))
+            print(
+                f"{name:>5}: {result['req_per_sec']:8.1f} req/s"
+                f"  p50={result['p50_ms']:.2f}ms"
+                f"  p95={result['p95_ms']:.2f}ms"
+                f"  p99={result['p99_ms']:.2f}ms"
+                f"  errors={result['errors']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
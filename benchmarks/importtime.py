@@ -0,0 +1,68 @@
+"""Import cost of `shame.app`, from `python -X importtime`
+
+    python -m benchmarks.importtime --repeat 10 --top 15
+
+Imports `shame.app` in `--repeat` fresh interpreters and reports the median
+cumulative time of the module and of the heaviest top-level packages it pulls
+in. `--budget` (milliseconds) makes the exit status 1 when the median of
+`shame.app` goes over it; `tests/test_import_time.py` holds the same budget.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+
+def import_times(module: str = "shame.app") -> dict[str, float]:
+    """Cumulative import time in milliseconds of every module `module` loads"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    times = {}
+    # import time: self [us] | cumulative | imported package
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="shame.app")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget", type=float, help="milliseconds")
+    args = parser.parse_args(argv)
+
+    runs: dict[str, list[float]] = defaultdict(list)
+    for _ in range(args.repeat):
+        times = import_times(args.module)
+        runs[args.module].append(times[args.module])
+        for name, cumulative in times.items():
+            # a top-level package, by the time of its outermost import
+            if "." not in name and name != args.module:
+                runs[name].append(cumulative)
+
+    medians = {name: statistics.median(timings) for name, timings in runs.items()}
+    total = medians.pop(args.module)
+    print(f"{args.module:>24}: {total:8.1f}ms  (median of {args.repeat})")
+    for name, median in sorted(medians.items(), key=lambda item: -item[1])[: args.top]:
+        print(f"{name:>24}: {median:8.1f}ms")
+
+    if args.budget is not None and total > args.budget:
+        print(f"OVER BUDGET {total:.1f}ms > {args.budget:.1f}ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
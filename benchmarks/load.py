@@ -0,0 +1,280 @@
+"""In-process load test of `shame.app.app` with a weighted request mix
+
+    python -m benchmarks.load --requests 5000 --concurrency 64 \\
+        --mix feed=90,post=5,login=4,update=1
+
+Requests go straight into the ASGI app through httpx's ASGI transport, no
+sockets involved, with the database dependency pointed at a seeded SQLite
+file (or `--url`). Each request picks an operation by weight; the report
+gives throughput, error rate and p50/p95/p99 latency per operation and in
+total, optionally as JSON with `--output`.
+
+Logins verify a real bcrypt hash, so their latency is `BCRYPT_ROUNDS` bound
+just like in production.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+import httpx
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from shame.app import app
+from shame.auth.hashing import hasher
+from shame.auth.models import User
+from shame.database import Base, get_database
+
+from .repository import Dataset, seed
+
+
+PASSWORD = "load-test"
+LOGIN_USERS = 20
+
+DEFAULT_MIX = "feed=90,post=5,login=4,update=1"
+
+
+@dataclass
+class Context:
+    dataset: Dataset
+    tokens: list[str]
+    rng: random.Random = field(default_factory=random.Random)
+
+    def headers(self) -> dict[str, str]:
+        return {"Authorization": f"Bearer {self.rng.choice(self.tokens)}"}
+
+    def story_id(self) -> int:
+        return self.rng.randrange(self.dataset.stories) + 1
+
+    def username(self) -> str:
+        return f"load{self.rng.randrange(LOGIN_USERS)}"
+
+
+Operation = Callable[[httpx.AsyncClient, Context], Awaitable[httpx.Response]]
+
+
+def story_body(ctx: Context) -> dict:
+    street = ctx.rng.randrange(ctx.dataset.addresses) + 1
+    return {
+        "shamestory": {"title": "Load test", "text": "Posted under load"},
+        "address": {
+            "country": "Ukraine",
+            "state": f"State {street % 25}",
+            "city": f"City {street % 500}",
+            "street": f"Street {street}",
+        },
+    }
+
+
+OPERATIONS: dict[str, Operation] = {
+    "feed": lambda client, ctx: client.get("/shamestories/feed", params={"limit": 20}),
+    "list": lambda client, ctx: client.get(
+        "/shamestories/", params={"skip": ctx.rng.randrange(100) * 20}
+    ),
+    "story": lambda client, ctx: client.get(f"/shamestories/{ctx.story_id()}"),
+    "search": lambda client, ctx: client.get(
+        "/shamestories/search", params={"q": "lorem"}
+    ),
+    "post": lambda client, ctx: client.post(
+        "/shamestories/", json=story_body(ctx), headers=ctx.headers()
+    ),
+    "update": lambda client, ctx: client.put(
+        f"/shamestories/{ctx.story_id()}",
+        json={"title": "Updated", "text": "Updated under load"},
+        headers=ctx.headers(),
+    ),
+    "agree": lambda client, ctx: client.post(
+        f"/shamestories/{ctx.story_id()}/agree", headers=ctx.headers()
+    ),
+    "login": lambda client, ctx: client.post(
+        "/login", data={"username": ctx.username(), "password": PASSWORD}
+    ),
+}
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise argparse.ArgumentTypeError(
+                f"Unknown operation {name!r}, expected one of {', '.join(OPERATIONS)}"
+            )
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def prepare_database(url: str, stories: int) -> Dataset:
+    engine = create_engine(url)
+    dataset = seed(engine, stories)
+    # one hash for everybody: the cost of login stays bcrypt, not the seeding
+    password_hashed = hasher.hash(PASSWORD)
+    with engine.begin() as connection:
+        connection.execute(
+            insert(User),
+            [
+                {"username": f"load{i}", "password_hashed": password_hashed}
+                for i in range(LOGIN_USERS)
+            ],
+        )
+    engine.dispose()
+    return dataset
+
+
+def use_database(url: str) -> None:
+    connect_args = {}
+    if url.startswith("sqlite"):
+        # writers queue on SQLite's single lock instead of failing at once
+        connect_args = {"check_same_thread": False, "timeout": 30}
+    engine = create_engine(url, connect_args=connect_args)
+    Session = sessionmaker(engine, autocommit=False, autoflush=False)
+
+    def get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_database] = get_db
+
+
+async def login_tokens(client: httpx.AsyncClient) -> list[str]:
+    tokens = []
+    for i in range(LOGIN_USERS):
+        response = await client.post(
+            "/login", data={"username": f"load{i}", "password": PASSWORD}
+        )
+        response.raise_for_status()
+        tokens.append(response.json()["access_token"])
+    return tokens
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    quantiles = (
+        statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    )
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "error_rate": errors / len(latencies) if latencies else 0.0,
+        "req_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": quantiles[49] * 1000 if quantiles else 0.0,
+        "p95_ms": quantiles[94] * 1000 if quantiles else 0.0,
+        "p99_ms": quantiles[98] * 1000 if quantiles else 0.0,
+    }
+
+
+async def run_load(
+    dataset: Dataset,
+    mix: dict[str, float],
+    requests: int,
+    concurrency: int,
+    random_seed: int = 0,
+) -> dict:
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    statuses: dict[str, dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    rng = random.Random(random_seed)
+    plan = rng.choices(list(mix), weights=list(mix.values()), k=requests)
+    plan.reverse()
+
+    transport = httpx.ASGITransport(app=app)  # type: ignore[arg-type]
+    async with httpx.AsyncClient(transport=transport, base_url="http://load") as client:
+        ctx = Context(dataset=dataset, tokens=await login_tokens(client), rng=rng)
+
+        async def worker():
+            while plan:
+                name = plan.pop()
+                start = time.perf_counter()
+                try:
+                    response = await OPERATIONS[name](client, ctx)
+                    status = response.status_code
+                except Exception:
+                    status = 599
+                latencies[name].append(time.perf_counter() - start)
+                statuses[name][status] += 1
+                if status >= 400:
+                    errors[name] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    routes = {
+        name: {
+            **summarize(latencies[name], errors[name], elapsed),
+            "statuses": dict(statuses[name]),
+        }
+        for name in mix
+        if latencies[name]
+    }
+    return {
+        "total": summarize(
+            [latency for values in latencies.values() for latency in values],
+            sum(errors.values()),
+            elapsed,
+        ),
+        "routes": routes,
+    }
+
+
+def print_report(report: dict) -> None:
+    rows = [*report["routes"].items(), ("total", report["total"])]
+    for name, result in rows:
+        print(
+            f"{name:>8}: {result['requests']:7d} req {result['req_per_sec']:9.1f} req/s"
+            f"  errors={result['error_rate']:6.2%}"
+            f"  p50={result['p50_ms']:.2f}ms"
+            f"  p95={result['p95_ms']:.2f}ms"
+            f"  p99={result['p99_ms']:.2f}ms"
+        )
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stories", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--url", help="database to seed instead of a temporary SQLite")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = args.url or f"sqlite:///{os.path.join(directory, 'load.db')}"
+        dataset = prepare_database(url, args.stories)
+        use_database(url)
+        try:
+            report = asyncio.run(
+                run_load(dataset, args.mix, args.requests, args.concurrency, args.seed)
+            )
+        finally:
+            app.dependency_overrides.pop(get_database, None)
+            Base.metadata.drop_all(bind=create_engine(url))
+            hasher.shutdown()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(
+                {"mix": args.mix, "concurrency": args.concurrency, **report},
+                file,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
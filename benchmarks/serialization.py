@@ -0,0 +1,125 @@
+"""List responses rendered by FastAPI vs `shame.responses.render`
+
+    python -m benchmarks.serialization --sizes 20 200 2000 --iterations 200
+
+Renders a page of `--sizes` ORM stories both ways, in process and with no
+database: `fastapi` is what a route returning the rows under
+`response_model=list[schemas.ShameStory]` costs (response validation,
+`jsonable_encoder`, `json.dumps`), `render` is the `TypeAdapter` path. Reports
+p50/p95 per response and the p50 speedup; both bodies must decode equal.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from typing import Awaitable, Callable, Sequence
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from shame import models, responses, schemas
+from shame.auth import models as auth_models  # noqa: F401, registers `Users`
+
+
+SIZES = [20, 200, 2000]
+
+StoryList = list[schemas.ShameStory]
+
+
+def stories(size: int) -> list[models.ShameStory]:
+    return [
+        models.ShameStory(
+            id=i,
+            title=f"Story {i}",
+            text="Lorem ipsum dolor sit amet, ąęłńóśźż " * 8,
+            agree=i % 97,
+            author_id=i % 13,
+            address_id=i % 7,
+        )
+        for i in range(size)
+    ]
+
+
+def fastapi_renderer() -> Callable[[Sequence[models.ShameStory]], Awaitable[bytes]]:
+    field = create_response_field(name="Response_get_shamestories", type_=StoryList)
+
+    async def render(page: Sequence[models.ShameStory]) -> bytes:
+        content = await serialize_response(field=field, response_content=page)
+        return JSONResponse(content).body
+
+    return render
+
+
+async def adapter_renderer(page: Sequence[models.ShameStory]) -> bytes:
+    return responses.render(StoryList, page).body
+
+
+async def timings(
+    render: Callable[[Sequence[models.ShameStory]], Awaitable[bytes]],
+    page: Sequence[models.ShameStory],
+    iterations: int,
+    warmup: int,
+) -> list[float]:
+    for _ in range(warmup):
+        await render(page)
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await render(page)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def percentile(samples: list[float], q: int) -> float:
+    return statistics.quantiles(samples, n=100)[q - 1]
+
+
+async def run(sizes: list[int], iterations: int, warmup: int) -> list[dict]:
+    renderers = {"fastapi": fastapi_renderer(), "render": adapter_renderer}
+    results = []
+    for size in sizes:
+        page = stories(size)
+        bodies = [json.loads(await render(page)) for render in renderers.values()]
+        assert all(body == bodies[0] for body in bodies), "bodies differ"
+
+        p50 = {}
+        for name, render in renderers.items():
+            samples = await timings(render, page, iterations, warmup)
+            p50[name] = percentile(samples, 50)
+            results.append(
+                {
+                    "case": name,
+                    "size": size,
+                    "p50_ms": p50[name] * 1000,
+                    "p95_ms": percentile(samples, 95) * 1000,
+                }
+            )
+        results[-1]["speedup"] = p50["fastapi"] / p50["render"]
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    encoder = "orjson" if responses.orjson is not None else "pydantic-core"
+    print(f"default response encoder: {encoder}")
+    for result in asyncio.run(run(args.sizes, args.iterations, args.warmup)):
+        speedup = result.get("speedup")
+        print(
+            f"{result['case']:>8} {result['size']:>5} stories: "
+            f"p50 {result['p50_ms']:8.3f}ms  p95 {result['p95_ms']:8.3f}ms"
+            + (f"  x{speedup:.1f}" if speedup else "")
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
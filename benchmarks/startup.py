@@ -0,0 +1,73 @@
+"""Schema work of a booting worker: `create_all` vs `shame.migrations`
+
+    python -m benchmarks.startup --stories 100000 --repeat 20
+
+Times what the lifespan used to run on every boot (`create_all`, which checks
+every table and index) against `migrations.bootstrap` on an up-to-date schema
+(one fingerprint read), on the same seeded SQLite file or `--url` database.
+The first, migrating bootstrap is reported on its own.
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from typing import Callable
+
+from sqlalchemy import create_engine, delete
+from sqlalchemy.engine import Engine
+
+from shame import migrations
+from shame.database import Base
+
+from .repository import seed
+
+
+def timed(action: Callable[[], object], repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        action()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name: str, timings: list[float]) -> None:
+    print(
+        f"{name:>24}: median={statistics.median(timings) * 1000:8.2f}ms"
+        f"  max={max(timings) * 1000:8.2f}ms  runs={len(timings)}"
+    )
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stories", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--url", help="database to seed instead of a temporary SQLite")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = args.url or f"sqlite:///{os.path.join(directory, 'startup.db')}"
+        engine: Engine = create_engine(url)
+        seed(engine, args.stories)
+        try:
+            report("create_all", timed(lambda: Base.metadata.create_all(engine), args.repeat))
+
+            # forget the version, as on the first boot after a deploy
+            with engine.begin() as connection:
+                migrations.schema_version.create(connection, checkfirst=True)
+                connection.execute(delete(migrations.schema_version))
+            report("bootstrap (migrating)", timed(lambda: migrations.bootstrap(engine), 1))
+            report(
+                "bootstrap (up to date)",
+                timed(lambda: migrations.bootstrap(engine), args.repeat),
+            )
+        finally:
+            Base.metadata.drop_all(bind=engine)
+            migrations.schema_version.drop(engine, checkfirst=True)
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,98 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
 
-from . import models, route as shame_route
-from .auth import route as auth_route
-from .database import engine
+from . import (
+    async_route as async_shame_route,
+    counters,
+    internal,
+    leaderboard,
+    migrations,
+    profiler,
+    replicas as replica_health,
+    route as shame_route,
+)
+from .auth import async_route as async_auth_route, route as auth_route
+from .auth.hashing import HasherSaturated, hasher
+from .config.settings import settings
+from .database import async_engine, engine, replicas
+from .responses import FastJSONResponse
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    models.Base.metadata.create_all(bind=engine)
+    if settings.ASYNC_DATABASE:
+        await migrations.bootstrap_async(async_engine)
+    else:
+        migrations.bootstrap(engine)
+
+    await leaderboard.reload()
+
+    agree_flusher = asyncio.create_task(
+        counters.flush_periodically(settings.AGREE_FLUSH_INTERVAL)
+    )
+    background = [agree_flusher]
+    if settings.LEADERBOARD_RELOAD_INTERVAL > 0:
+        background.append(
+            asyncio.create_task(
+                leaderboard.catch_up_periodically(settings.LEADERBOARD_RELOAD_INTERVAL)
+            )
+        )
+    if replicas:
+        background.append(
+            asyncio.create_task(
+                replica_health.check_periodically(
+                    replicas, settings.DB_REPLICA_HEALTH_INTERVAL
+                )
+            )
+        )
+
     yield
-    models.Base.metadata.drop_all(bind=engine)
+
+    for task in background:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    await counters.drain()
+
+    if settings.ASYNC_DATABASE:
+        await async_engine.dispose()
+    engine.dispose()
+    replicas.dispose()
+    hasher.shutdown()
 
 
-app = FastAPI(lifespan=lifespan)
+profiler.install()
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+if settings.SQL_PROFILER:
+    app.add_middleware(
+        profiler.SQLProfilerMiddleware,
+        repeat_threshold=settings.SQL_REPEAT_THRESHOLD,
+    )
+
+if settings.ASYNC_DATABASE:
+    # matched first, everything not ported stays on the sync routers below
+    app.include_router(router=async_shame_route.router)
+    app.include_router(router=async_shame_route.stats_router)
+    app.include_router(router=async_auth_route.router)
 
 app.include_router(router=shame_route.router)
+app.include_router(router=shame_route.stats_router)
 app.include_router(router=auth_route.router)
+app.include_router(router=internal.router)
+
+
+@app.exception_handler(HasherSaturated)
+def password_hashing_saturated(request: Request, exc: HasherSaturated):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"},
+    )
 
 
 @app.get("/")
@@ -0,0 +1,296 @@
+"""AsyncSession counterparts of `shame.repository`"""
+
+from typing import Collection, Iterable, Mapping, Sequence
+
+import sqlalchemy
+from sqlalchemy.exc import NoResultFound
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import locations
+from . import models
+from . import ratings
+from . import schemas
+from . import search
+from .database import upsert_insert
+from .pagination import Cursor
+from .repository import (
+    AddressKey,
+    _address_ids,
+    _address_ids_statement,
+    _address_keys,
+    _address_values,
+    _agree_deltas_statement,
+    _current_statement,
+    _expand_options,
+    _feed_order,
+    _get_many_statement,
+    _identity_mapped,
+    _last_id_statement,
+    _not_updated,
+    _projected_statement,
+    _update_statement,
+    _upsert_address_statement,
+)
+
+
+async def add(
+    db: AsyncSession,
+    shamestory: schemas.CreateShameStory,
+    author_id: int,
+    address_id: int,
+) -> models.ShameStory:
+    new_db_shamestory = models.ShameStory(
+        **shamestory.model_dump(),
+        author_id=author_id,
+        address_id=address_id,
+    )
+    db.add(new_db_shamestory)
+    await db.flush()
+    await search.index_story_async(db=db, shamestory_id=new_db_shamestory.id)
+    await locations.address_changed_async(
+        db, address_id, stories=1, agree=new_db_shamestory.agree
+    )
+    await db.commit()
+    return new_db_shamestory
+
+
+async def get_address(
+    db: AsyncSession,
+    address: schemas.CreateAddress,
+) -> models.Address:
+    result = await db.scalar(
+        sqlalchemy.select(models.Address).where(
+            (models.Address.country == address.country)
+            & (models.Address.state == address.state)
+            & (models.Address.city == address.city)
+            & (models.Address.street == address.street)
+        )
+    )
+    if not result:
+        raise NoResultFound(
+            "No address in database with params ["
+            f"country={address.country}, "
+            f"state={address.state}, "
+            f"city={address.city}, "
+            f"street={address.street}]"
+        )
+    return result
+
+
+async def add_address(
+    db: AsyncSession,
+    address: schemas.CreateAddress,
+) -> models.Address:
+    db_address = models.Address(**address.model_dump())
+    db.add(db_address)
+    await db.commit()
+    return db_address
+
+
+async def upsert_address(db: AsyncSession, address: schemas.CreateAddress) -> int:
+    """Returns the id of the address, inserting it if missing, without commit"""
+    statement = _upsert_address_statement(db.get_bind().dialect.name, address)
+    if statement is None:
+        try:
+            return (await get_address(db=db, address=address)).id
+        except NoResultFound:
+            db_address = models.Address(**address.model_dump())
+            db.add(db_address)
+            await db.flush()
+            return db_address.id
+    return (await db.execute(statement)).scalar_one()
+
+
+async def upsert_addresses(
+    db: AsyncSession,
+    addresses: Iterable[schemas.CreateAddress],
+) -> dict[AddressKey, int]:
+    """Resolves many addresses to ids in two statements, without commit"""
+    addresses = list(addresses)
+    keys = _address_keys(addresses)
+    if not keys:
+        return {}
+
+    insert = upsert_insert(db.get_bind().dialect.name, models.Address)
+    if insert is not None:
+        await db.execute(insert.on_conflict_do_nothing(), _address_values(keys))
+    else:
+        for address in addresses:
+            await upsert_address(db=db, address=address)
+
+    return _address_ids(await db.execute(_address_ids_statement(keys)))
+
+
+async def add_many(db: AsyncSession, shamestories: Sequence[dict]) -> int:
+    """Bulk inserts story rows with one executemany, without commit
+
+    No `COPY` here, asyncpg batches the executemany into a single round trip.
+    """
+    if not shamestories:
+        return 0
+
+    last_id = await db.scalar(_last_id_statement())
+    await db.execute(sqlalchemy.insert(models.ShameStory), list(shamestories))
+    await search.index_stories_after_async(
+        db=db, shamestory_id=-1 if last_id is None else last_id
+    )
+    await locations.stories_added_async(db, shamestories)
+    return len(shamestories)
+
+
+async def get(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 50,
+    after: Cursor | None = None,
+    expand: Collection[str] = (),
+) -> Sequence[models.ShameStory]:
+    result = await db.scalars(
+        _feed_order(sqlalchemy.select(models.ShameStory), after)
+        .options(*_expand_options(expand))
+        .offset(skip)
+        .limit(limit)
+    )
+    return result.all()
+
+
+async def get_projected(
+    db: AsyncSession,
+    fields: Sequence[str],
+    skip: int = 0,
+    limit: int = 50,
+    after: Cursor | None = None,
+    address_id: int | None = None,
+    author_id: int | None = None,
+) -> Sequence[sqlalchemy.Row]:
+    result = await db.execute(
+        _projected_statement(fields, skip, limit, after, address_id, author_id)
+    )
+    return result.all()
+
+
+async def get_by_id(
+    db: AsyncSession,
+    shamestory_id: int,
+    expand: Collection[str] = (),
+) -> models.ShameStory:
+    result = await db.get(
+        models.ShameStory, shamestory_id, options=_expand_options(expand)
+    )
+    if not result:
+        raise NoResultFound(f"Could not find shamestory with :id={shamestory_id}")
+    return result
+
+
+async def get_many(
+    db: AsyncSession,
+    shamestory_ids: Sequence[int],
+    expand: Collection[str] = (),
+) -> list[models.ShameStory]:
+    found = _identity_mapped(db.identity_map, shamestory_ids, expand)
+    rest = [id for id in dict.fromkeys(shamestory_ids) if id not in found]
+    if rest:
+        result = await db.scalars(_get_many_statement(rest, expand))
+        found.update((story.id, story) for story in result.unique())
+    return [found[id] for id in shamestory_ids if id in found]
+
+
+async def get_by_address(
+    db: AsyncSession,
+    address_id: int,
+    skip: int = 0,
+    limit: int = 50,
+    after: Cursor | None = None,
+    expand: Collection[str] = (),
+) -> Sequence[models.ShameStory]:
+    result = await db.scalars(
+        _feed_order(
+            sqlalchemy.select(models.ShameStory).where(
+                models.ShameStory.address_id == address_id
+            ),
+            after,
+        )
+        .options(*_expand_options(expand))
+        .offset(skip)
+        .limit(limit)
+    )
+    return result.all()
+
+
+async def get_by_author(
+    db: AsyncSession,
+    author_id: int,
+    skip: int = 0,
+    limit: int = 50,
+    after: Cursor | None = None,
+    expand: Collection[str] = (),
+) -> Sequence[models.ShameStory]:
+    result = await db.scalars(
+        _feed_order(
+            sqlalchemy.select(models.ShameStory).where(
+                models.ShameStory.author_id == author_id
+            ),
+            after,
+        )
+        .options(*_expand_options(expand))
+        .offset(skip)
+        .limit(limit)
+    )
+    return result.all()
+
+
+async def update(
+    db: AsyncSession,
+    shamestory_id: int,
+    values: schemas.CreateShameStory | schemas.UpdateShameStory,
+    author_id: int | None = None,
+    versions: Collection[int] | None = None,
+) -> models.ShameStory:
+    updated = await db.scalar(
+        _update_statement(shamestory_id, values, author_id, versions)
+    )
+    if updated is None:
+        await db.rollback()
+        current = (
+            await db.execute(_current_statement(shamestory_id))
+        ).one_or_none()
+        raise _not_updated(current, shamestory_id, author_id)
+    await search.index_story_async(db=db, shamestory_id=shamestory_id)
+    await db.commit()
+    return updated
+
+
+async def apply_agree_deltas(db: AsyncSession, deltas: Mapping[int, int]) -> None:
+    if not deltas:
+        return
+    statement, parameters = _agree_deltas_statement(deltas)
+    await db.execute(statement, parameters)
+    await locations.agree_changed_async(db, deltas)
+    await ratings.agree_changed_async(db, deltas)
+    await db.commit()
+
+
+async def delete(db: AsyncSession, shamestory_id: int) -> None:
+    try:
+        await search.remove_story_async(db=db, shamestory_id=shamestory_id)
+        deleted = (
+            await db.execute(
+                sqlalchemy.delete(models.ShameStory)
+                .where(models.ShameStory.id == shamestory_id)
+                .returning(
+                    models.ShameStory.address_id,
+                    models.ShameStory.author_id,
+                    models.ShameStory.agree,
+                )
+            )
+        ).one_or_none()
+        if deleted is not None:
+            await locations.address_changed_async(
+                db, deleted.address_id, stories=-1, agree=-deleted.agree
+            )
+            await ratings.author_changed_async(
+                db, {deleted.author_id: -deleted.agree}
+            )
+        await db.commit()
+    except Exception:
+        raise Exception("None to DELETE")
@@ -0,0 +1,356 @@
+"""`shame.route` served from the AsyncSession stack (`ASYNC_DATABASE=true`)
+
+Every `shame.route` path has its async twin here, so with the flag on no
+request reaches the sync database; the typed `:int` path convertors keep
+`/{shamestory_id}` from shadowing static paths such as `/search`.
+"""
+
+from typing import Annotated
+
+from fastapi import Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRouter
+from pydantic import SerializeAsAny
+from sqlalchemy.exc import NoResultFound
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from shame.auth import dependencies
+
+from . import export, ingest, leaderboard, locations, schemas, search
+from . import async_repository as repo
+from .cache import list_key, response_cache, story_key
+from .counters import agree_buffer
+from .database import get_async_database
+from .leaderboard import top_stories
+from .pagination import SearchCursor, encode_cursor, next_cursor
+from .responses import render
+from .route import (
+    BatchIds,
+    Expand,
+    Fields,
+    IfMatch,
+    PageCursor,
+    SearchPageCursor,
+    TopLimit,
+    batch_response,
+    cache_stories,
+    cached_stories,
+    edit_errors,
+    edited,
+    projected_page,
+    search_errors,
+    serialize_rows,
+    serialize_stories,
+    serialize_story,
+    story_page,
+)
+
+
+router = APIRouter(prefix="/shamestories")
+stats_router = APIRouter(prefix="/stats", tags=["Stats"])
+
+AsyncDatabase = Annotated[AsyncSession, Depends(get_async_database)]
+
+
+@router.get("/", response_model=list[SerializeAsAny[schemas.ShameStory]])
+async def get_shamestories(
+    request: Request,
+    db: AsyncDatabase,
+    expand: Expand,
+    fields: Fields,
+    skip: int = 0,
+    limit: int = 20,
+):
+    key = list_key(skip, limit, expand, fields)
+    entry = response_cache.get(key)
+    if entry is None:
+        generation = response_cache.generation
+        if fields:
+            rows = await repo.get_projected(db, fields, skip=skip, limit=limit)
+            body, story_ids = serialize_rows(rows, fields), [row.id for row in rows]
+        else:
+            results = await repo.get(db, skip=skip, limit=limit, expand=expand)
+            body = serialize_stories(results, expand)
+            story_ids = [result.id for result in results]
+        entry = response_cache.put(
+            key, body, story_ids=story_ids, generation=generation
+        )
+    return response_cache.respond(request, entry)
+
+
+@router.get("/feed", response_model=schemas.ShameStoryPage)
+async def get_shamestories_feed(
+    db: AsyncDatabase,
+    cursor: PageCursor,
+    expand: Expand,
+    limit: int = 20,
+):
+    results = await repo.get(db, limit=limit, after=cursor, expand=expand)
+    return story_page(results, expand, next_cursor(results, limit))
+
+
+@router.get("/address/{address_id:int}", response_model=schemas.ShameStoryPage)
+async def get_shamestories_by_address(
+    address_id: int,
+    db: AsyncDatabase,
+    cursor: PageCursor,
+    expand: Expand,
+    fields: Fields,
+    limit: int = 20,
+):
+    if fields:
+        rows = await repo.get_projected(
+            db, fields, limit=limit, after=cursor, address_id=address_id
+        )
+        return projected_page(rows, fields, limit)
+    results = await repo.get_by_address(
+        db, address_id=address_id, limit=limit, after=cursor, expand=expand
+    )
+    return story_page(results, expand, next_cursor(results, limit))
+
+
+@router.get("/author/{author_id:int}", response_model=schemas.ShameStoryPage)
+async def get_shamestories_by_author(
+    author_id: int,
+    db: AsyncDatabase,
+    cursor: PageCursor,
+    expand: Expand,
+    fields: Fields,
+    limit: int = 20,
+):
+    if fields:
+        rows = await repo.get_projected(
+            db, fields, limit=limit, after=cursor, author_id=author_id
+        )
+        return projected_page(rows, fields, limit)
+    results = await repo.get_by_author(
+        db, author_id=author_id, limit=limit, after=cursor, expand=expand
+    )
+    return story_page(results, expand, next_cursor(results, limit))
+
+
+@router.get("/search", response_model=schemas.ShameStoryPage)
+async def search_shamestories(
+    db: AsyncDatabase,
+    cursor: SearchPageCursor,
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    limit: int = 20,
+):
+    if not q.split():
+        return story_page([])
+
+    with search_errors():
+        rows = await search.search_async(db, query=q, limit=limit, after=cursor)
+    token = None
+    if limit > 0 and len(rows) == limit:
+        token = encode_cursor(SearchCursor(score=rows[-1].score, id=rows[-1][0].id))
+    return story_page([row[0] for row in rows], cursor=token)
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_shamestories(
+    user: dependencies.AsyncCurrentActiveUser,
+    db: AsyncDatabase,
+    format: export.ExportFormat = "ndjson",
+):
+    return StreamingResponse(
+        export.iter_export_async(db, format),
+        media_type=export.MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="shamestories.{format}"'
+        },
+    )
+
+
+@router.get("/batch", response_model=schemas.ShameStoryBatch)
+async def get_shamestories_batch(db: AsyncDatabase, ids: BatchIds, expand: Expand):
+    bodies = cached_stories(ids, expand)
+    generation = response_cache.generation
+    results = await repo.get_many(
+        db, [id for id in ids if id not in bodies], expand=expand
+    )
+    bodies.update(cache_stories(results, expand, generation))
+    return batch_response(ids, bodies)
+
+
+@router.get("/top", response_model=list[schemas.ShameStory])
+async def get_top_shamestories(
+    db: AsyncDatabase,
+    limit: TopLimit,
+    country: str | None = None,
+):
+    ranking = await leaderboard.top_async(db, limit=limit, country=country)
+    return render(
+        list[schemas.ShameStory],
+        await repo.get_many(db, [story_id for story_id, _ in ranking]),
+    )
+
+
+@router.get("/{shamestory_id:int}", response_model=schemas.ShameStory)
+async def get_shamestory_by_id(
+    request: Request,
+    shamestory_id: int,
+    db: AsyncDatabase,
+    expand: Expand,
+):
+    key = story_key(shamestory_id, expand)
+    entry = response_cache.get(key)
+    if entry is not None:
+        return response_cache.respond(request, entry)
+    try:
+        generation = response_cache.generation
+        result = await repo.get_by_id(
+            db=db, shamestory_id=shamestory_id, expand=expand
+        )
+        entry = response_cache.put(
+            key,
+            serialize_story(result, expand),
+            story_ids=[shamestory_id],
+            generation=generation,
+            version=result.version,
+        )
+        return response_cache.respond(request, entry)
+    except NoResultFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.post("/", response_model=schemas.ShameStory)
+async def insert_shamestory(
+    shamestory: schemas.CreateShameStory,
+    address: schemas.CreateAddress,
+    user: dependencies.AsyncCurrentActiveUser,
+    db: AsyncDatabase,
+):
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="To post ShameStory user should be authorized.",
+        )
+
+    # the address upsert and the story insert share one transaction
+    address_id = await repo.upsert_address(db=db, address=address)
+    db_shamestory = await repo.add(
+        db=db,
+        shamestory=shamestory,
+        author_id=user.id,
+        address_id=address_id,
+    )
+    response_cache.invalidate_lists()
+    top_stories.offer(db_shamestory.id, db_shamestory.agree, address.country)
+    return db_shamestory
+
+
+@router.post("/import", response_model=schemas.ImportReport)
+async def import_shamestories(
+    request: Request,
+    user: dependencies.AsyncCurrentActiveUser,
+    db: AsyncDatabase,
+):
+    importer = ingest.AsyncImporter(db=db, author_id=user.id)
+    async for chunk in ingest.achunked(ingest.split_lines(request.stream())):
+        await importer.import_chunk(chunk)
+    response_cache.invalidate_lists()
+    top_stories.invalidate()
+    return importer.finish()
+
+
+@router.put("/{shamestory_id:int}", response_model=schemas.ShameStory)
+async def update_shamestory(
+    shamestory_id: int,
+    shamestory_values: schemas.CreateShameStory,
+    user: dependencies.AsyncCurrentActiveUser,
+    db: AsyncDatabase,
+    versions: IfMatch,
+):
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="To update ShameStory user should be authorized.",
+        )
+
+    with edit_errors():
+        db_shamestory = await repo.update(
+            db=db,
+            shamestory_id=shamestory_id,
+            values=shamestory_values,
+            author_id=user.id,
+            versions=versions,
+        )
+    return edited(db_shamestory)
+
+
+@router.patch("/{shamestory_id:int}", response_model=schemas.ShameStory)
+async def patch_shamestory(
+    shamestory_id: int,
+    shamestory_values: schemas.UpdateShameStory,
+    user: dependencies.AsyncCurrentActiveUser,
+    db: AsyncDatabase,
+    versions: IfMatch,
+):
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="To update ShameStory user should be authorized.",
+        )
+
+    with edit_errors():
+        db_shamestory = await repo.update(
+            db=db,
+            shamestory_id=shamestory_id,
+            values=shamestory_values,
+            author_id=user.id,
+            versions=versions,
+        )
+    return edited(db_shamestory)
+
+
+@router.post(
+    "/{shamestory_id:int}/agree",
+    response_model=schemas.AgreeAccepted,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def agree_shamestory(
+    shamestory_id: int,
+    user: dependencies.AsyncCurrentActiveUser,
+    db: AsyncDatabase,
+):
+    try:
+        await repo.get_by_id(db=db, shamestory_id=shamestory_id)
+    except NoResultFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+    pending = agree_buffer.increment(shamestory_id)
+    return schemas.AgreeAccepted(id=shamestory_id, pending=pending)
+
+
+@router.delete("/{shamestory_id:int}")
+async def delete_shamestory(
+    shamestory_id: int,
+    user: dependencies.AsyncCurrentActiveUser,
+    db: AsyncDatabase,
+):
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="To delete ShameStory user should be authorized.",
+        )
+
+    await repo.delete(db=db, shamestory_id=shamestory_id)
+    response_cache.invalidate_story(shamestory_id)
+    response_cache.invalidate_lists()
+    top_stories.remove(shamestory_id)
+
+
+@stats_router.get("/locations", response_model=list[schemas.LocationStats])
+async def get_location_stats(
+    db: AsyncDatabase,
+    level: locations.Level = "country",
+    skip: int = 0,
+    limit: int = Query(default=50, le=1000),
+):
+    return render(
+        list[schemas.LocationStats],
+        await locations.get_async(db, level=level, skip=skip, limit=limit),
+    )
@@ -0,0 +1,113 @@
+"""AsyncSession counterparts of `shame.auth.repository`"""
+
+from typing import Collection, Sequence
+
+import sqlalchemy
+from sqlalchemy.exc import NoResultFound
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, schemas
+from ..cache import response_cache
+from .repository import (
+    _not_updated,
+    _top_statement,
+    _update_statement,
+    _version_statement,
+)
+from .cache import token_cache
+from .hashing import hasher
+
+
+async def contains(db: AsyncSession, username: str) -> bool:
+    result = await db.execute(
+        sqlalchemy.select(models.User).where(models.User.username == username)
+    )
+    return result.scalar_one_or_none() is not None
+
+
+async def get(db: AsyncSession, skip: int = 0, limit: int = 10) -> Sequence[models.User]:
+    result = await db.scalars(
+        sqlalchemy.select(models.User)
+        .offset(skip)
+        .limit(limit)
+        .order_by(models.User.rating)
+    )
+    return result.all()
+
+
+async def get_top(
+    db: AsyncSession, skip: int = 0, limit: int = 10
+) -> Sequence[models.User]:
+    return (await db.scalars(_top_statement(skip, limit))).all()
+
+
+async def get_by_username(db: AsyncSession, username: str) -> models.User:
+    result = await db.scalar(
+        sqlalchemy.select(models.User).where(models.User.username == username)
+    )
+    if not result:
+        raise NoResultFound(f"Could not find user with :username={username}")
+    return result
+
+
+async def get_by_email(db: AsyncSession, email: str) -> models.User:
+    result = await db.scalar(
+        sqlalchemy.select(models.User).where(models.User.email == email)
+    )
+    if not result:
+        raise NoResultFound(f"Could not find user with :email={email}")
+    return result
+
+
+async def get_by_id(db: AsyncSession, id: int) -> models.User:
+    result = await db.get(models.User, id)
+    if not result:
+        raise NoResultFound(f"Could not find user with :id={id}")
+    return result
+
+
+async def add(db: AsyncSession, user: schemas.CreateUser) -> models.User:
+    password_hashed = await hasher.hash_async(user.password)
+    db_user = models.User(
+        email=user.email,
+        username=user.username,
+        full_name=user.full_name,
+        password_hashed=password_hashed,
+    )
+    db.add(db_user)
+    await db.commit()
+    return db_user
+
+
+async def update_password_hash(db: AsyncSession, id: int, password_hashed: str) -> None:
+    await db.execute(
+        sqlalchemy.update(models.User)
+        .where(models.User.id == id)
+        .values(password_hashed=password_hashed)
+    )
+    await db.commit()
+
+
+async def update(
+    db: AsyncSession,
+    id: int,
+    values: schemas.UserBase,
+    versions: Collection[int] | None = None,
+) -> models.User:
+    updated = await db.scalar(_update_statement(id, values, versions))
+    if updated is None:
+        await db.rollback()
+        raise _not_updated(await db.scalar(_version_statement(id)), id)
+    await db.commit()
+    token_cache.invalidate_user(id)
+    # expanded story responses embed the username
+    response_cache.clear()
+    return updated
+
+
+async def delete(db: AsyncSession, id: int):
+    await db.execute(sqlalchemy.delete(models.User).where(models.User.id == id))
+    await db.commit()
+    token_cache.invalidate_user(id)
+    # expanded story responses embed the username
+    response_cache.clear()
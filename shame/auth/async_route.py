@@ -0,0 +1,87 @@
+"""`shame.auth.route` served from the AsyncSession stack (`ASYNC_DATABASE=true`)"""
+
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.exc import NoResultFound
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import get_async_database
+from ..responses import render
+from . import (
+    async_repository as user_repo,
+    dependencies as deps,
+    schemas,
+)
+from .hashing import hasher
+
+
+router = APIRouter(tags=["Authentication"])
+
+
+AuthForm = Annotated[OAuth2PasswordRequestForm, Depends()]
+AsyncDatabase = Annotated[AsyncSession, Depends(get_async_database)]
+
+
+@router.post("/signup", response_model=schemas.User)
+async def create_user(new_user: schemas.CreateUser, db: AsyncDatabase):
+    if await user_repo.contains(db=db, username=new_user.username):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="User with this username already exist.",
+        )
+    user = await user_repo.add(db=db, user=new_user)
+    return user
+
+
+@router.post("/login", response_model=schemas.Token)
+async def login_user(db: AsyncDatabase, form_data: AuthForm):
+    try:
+        user = await user_repo.get_by_username(db=db, username=form_data.username)
+    except NoResultFound:
+        user = None
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Incorrect username or password.",
+        )
+
+    valid, new_hash = await hasher.verify_and_update_async(
+        form_data.password, user.password_hashed
+    )
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Incorrect username or password.",
+        )
+    if new_hash:
+        await user_repo.update_password_hash(
+            db=db, id=user.id, password_hashed=new_hash
+        )
+    return user.generate_access_token()
+
+
+@router.get("/users/", response_model=list[schemas.RatedUser])
+async def get_top_users(
+    db: AsyncDatabase,
+    skip: int = 0,
+    limit: int = Query(default=10, le=100),
+):
+    return render(
+        list[schemas.RatedUser],
+        await user_repo.get_top(db=db, skip=skip, limit=limit),
+    )
+
+
+@router.get("/users/me", response_model=schemas.User)
+async def get_current_user(user: deps.AsyncCurrentActiveUser):
+    return user
+
+
+@router.get("/users/{username}", response_model=schemas.User)
+async def get_user(username: str, db: AsyncDatabase):
+    try:
+        return await user_repo.get_by_username(db=db, username=username)
+    except NoResultFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
@@ -0,0 +1,96 @@
+"""In-process cache of verified access tokens
+
+A hit hands back the decoded claims and a `schemas.User` snapshot without
+verifying the signature again or touching the database. Entries expire at the
+token's own `exp` and are dropped as soon as `repository.update`/`delete`
+touch their user. The cache is per process: other workers keep serving their
+snapshot until it expires.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+from . import schemas
+from ..config.auth import auth_settings
+from ..lazy import lazy
+
+
+@dataclass(frozen=True, slots=True)
+class CachedToken:
+    claims: dict[str, Any]
+    user: schemas.User
+    expires_at: float
+
+
+class TokenCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, CachedToken] = OrderedDict()
+        self._tokens_by_user: dict[int, set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> CachedToken | None:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= time.time():
+                self._remove(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry
+
+    def put(self, token: str, claims: dict[str, Any], user: schemas.User) -> None:
+        expires_at = claims.get("exp")
+        if not isinstance(expires_at, (int, float)) or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._remove(token)
+            self._entries[token] = CachedToken(claims, user, float(expires_at))
+            self._tokens_by_user.setdefault(user.id, set()).add(token)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            for token in self._tokens_by_user.pop(user_id, set()):
+                self._entries.pop(token, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _remove(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._tokens_by_user.get(entry.user.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[entry.user.id]
+
+
+token_cache = lazy(
+    lambda: TokenCache(maxsize=auth_settings.TOKEN_CACHE_SIZE)
+)
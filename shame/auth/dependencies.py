@@ -1,18 +1,23 @@
-from typing import Annotated
+from typing import Annotated, Any
 
-from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.exc import NoResultFound
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
-from . import schemas, repository as user_repo
-from ..database import SessionLocal
+from . import schemas, async_repository as async_user_repo, repository as user_repo
+from .cache import token_cache
+from ..database import get_async_database, get_database
 from ..config.auth import auth_settings
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login", scheme_name="JWT")
 
 
-def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
+def _decode_claims(token: str) -> dict[str, Any]:
+    from jose import JWTError, jwt
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -33,14 +38,26 @@ def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    return payload
 
-    user = user_repo.get_by_username(db=SessionLocal(), username=username)
-    if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Could not find user with username:{user.username}",
-        )
-    return user
+
+def get_current_user(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    db: Annotated[Session, Depends(get_database)],
+) -> schemas.User:
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached.user
+
+    claims = _decode_claims(token)
+    try:
+        user = user_repo.get_by_username(db=db, username=claims["sub"])
+    except NoResultFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+    snapshot = schemas.User.model_validate(user)
+    token_cache.put(token, claims, snapshot)
+    return snapshot
 
 
 CurrentUser = Annotated[schemas.User, Depends(get_current_user)]
@@ -53,3 +70,34 @@ def get_current_active_user(current_user: CurrentUser):
 
 
 CurrentActiveUser = Annotated[schemas.User, Depends(get_current_active_user)]
+
+
+async def get_current_user_async(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    db: Annotated[AsyncSession, Depends(get_async_database)],
+) -> schemas.User:
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached.user
+
+    claims = _decode_claims(token)
+    try:
+        user = await async_user_repo.get_by_username(db=db, username=claims["sub"])
+    except NoResultFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+    snapshot = schemas.User.model_validate(user)
+    token_cache.put(token, claims, snapshot)
+    return snapshot
+
+
+AsyncCurrentUser = Annotated[schemas.User, Depends(get_current_user_async)]
+
+
+async def get_current_active_user_async(current_user: AsyncCurrentUser):
+    return current_user
+
+
+AsyncCurrentActiveUser = Annotated[
+    schemas.User, Depends(get_current_active_user_async)
+]
@@ -0,0 +1,174 @@
+"""bcrypt hashing on a bounded process pool
+
+Hashing is CPU bound and holds the GIL, so running it inline starves every
+other request of the worker it runs on. `PasswordHasher` ships it to a
+`ProcessPoolExecutor` instead: the sync routes wait on the future from their
+threadpool worker, the async ones await it without blocking the event loop.
+Submissions past `max_pending` are rejected with `HasherSaturated` rather than
+queued without bound.
+"""
+
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, TypeVar
+
+from ..config.auth import auth_settings
+from ..lazy import lazy
+
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
+
+
+T = TypeVar("T")
+
+
+class HasherSaturated(RuntimeError):
+    pass
+
+
+@lru_cache
+def get_context(rounds: int) -> "CryptContext":
+    """One configured context per process and cost factor
+
+    Hashes below `rounds` (or using an old bcrypt ident) report as outdated.
+    passlib and bcrypt are imported here, by the first process that hashes.
+    """
+    from passlib.context import CryptContext
+
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+    )
+
+
+def _hash(password: str, rounds: int) -> str:
+    return get_context(rounds).hash(password)
+
+
+def _verify_and_update(
+    password: str,
+    password_hashed: str,
+    rounds: int,
+) -> tuple[bool, str | None]:
+    return get_context(rounds).verify_and_update(password, password_hashed)
+
+
+class _InlineExecutor(Executor):
+    """Runs in the calling thread, for `PASSWORD_HASH_WORKERS=0`"""
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        future: Future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+class PasswordHasher:
+    def __init__(self, rounds: int, workers: int | None, max_pending: int):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.completed = 0
+        self.rejected = 0
+        self._pending = 0
+        self._executor: Executor | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def hash(self, password: str) -> str:
+        return self._submit(_hash, password, self.rounds).result()
+
+    def verify(self, password: str, password_hashed: str) -> bool:
+        return self.verify_and_update(password, password_hashed)[0]
+
+    def verify_and_update(
+        self,
+        password: str,
+        password_hashed: str,
+    ) -> tuple[bool, str | None]:
+        """Checks the password, returns a fresh hash if the stored one is outdated"""
+        return self._submit(
+            _verify_and_update, password, password_hashed, self.rounds
+        ).result()
+
+    async def hash_async(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit(_hash, password, self.rounds))
+
+    async def verify_and_update_async(
+        self,
+        password: str,
+        password_hashed: str,
+    ) -> tuple[bool, str | None]:
+        return await asyncio.wrap_future(
+            self._submit(_verify_and_update, password, password_hashed, self.rounds)
+        )
+
+    def stats(self) -> dict[str, int | None]:
+        return {
+            "workers": self.workers,
+            "rounds": self.rounds,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _submit(self, fn: Callable[..., T], *args: Any) -> "Future[T]":
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise HasherSaturated(
+                    f"Password hashing queue is full :pending={self._pending}"
+                )
+            self._pending += 1
+            if self._executor is None:
+                self._executor = self._create_executor()
+            executor = self._executor
+
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, _: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+
+    def _create_executor(self) -> Executor:
+        if self.workers == 0:
+            return _InlineExecutor()
+        # forking a process that already runs threadpool workers is unsafe
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+
+hasher = lazy(
+    lambda: PasswordHasher(
+        rounds=auth_settings.BCRYPT_ROUNDS,
+        workers=auth_settings.PASSWORD_HASH_WORKERS,
+        max_pending=auth_settings.PASSWORD_HASH_MAX_PENDING,
+    )
+)
@@ -1,6 +1,7 @@
 from datetime import timedelta
 from typing import List, Optional, TYPE_CHECKING
 
+from sqlalchemy import Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from ..database import Base
@@ -20,11 +21,19 @@ class User(Base):
     full_name: Mapped[Optional[str]]
     username: Mapped[str]
     password_hashed: Mapped[str]
+    # total `agree` of the user's stories, kept by `shame.ratings`
     rating: Mapped[int] = mapped_column(default=0)
+    # bumped by every edit, see `shame.versioning`
+    version: Mapped[int] = mapped_column(default=1, server_default="1")
     stories: Mapped[List[ShameStory]] = relationship(
         "ShameStory", back_populates="author"
     )
 
+    __table_args__ = (
+        # top users walk it backwards: `rating desc, id desc`
+        Index("ix_Users_rating_id", "rating", "id"),
+    )
+
     @staticmethod
     def hash_password(password: str) -> str:
         return utils.hash_password(password)
@@ -1,4 +1,4 @@
-from typing import Sequence
+from typing import Collection, Sequence
 
 import sqlalchemy
 from sqlalchemy.exc import NoResultFound
@@ -7,6 +7,9 @@ from sqlalchemy.orm import Session
 from shame.auth import utils
 
 from . import models, schemas
+from .. import versioning
+from ..cache import response_cache
+from .cache import token_cache
 
 
 def contains(db: Session, username: str) -> bool:
@@ -31,6 +34,21 @@ def get(db: Session, skip: int = 0, limit: int = 10) -> Sequence[models.User]:
     return result
 
 
+def _top_statement(skip: int, limit: int) -> sqlalchemy.Select:
+    # a backward walk of `ix_Users_rating_id`
+    return (
+        sqlalchemy.select(models.User)
+        .order_by(models.User.rating.desc(), models.User.id.desc())
+        .offset(skip)
+        .limit(limit)
+    )
+
+
+def get_top(db: Session, skip: int = 0, limit: int = 10) -> Sequence[models.User]:
+    """Users by rating, highest first"""
+    return db.scalars(_top_statement(skip, limit)).all()
+
+
 def get_by_username(db: Session, username: str) -> models.User:
     result = db.execute(
         sqlalchemy.select(models.User).where(models.User.username == username)
@@ -70,17 +88,59 @@ def add(db: Session, user: schemas.CreateUser) -> models.User:
     return db_user
 
 
-def update(db: Session, id: int, values: schemas.UserBase) -> models.User:
-    if not db.get(models.User, id):
-        raise NoResultFound(f"Could not find user with :id={id}")
-
+def update_password_hash(db: Session, id: int, password_hashed: str) -> None:
     db.execute(
         sqlalchemy.update(models.User)
         .where(models.User.id == id)
-        .values(**values.model_dump(exclude_unset=True))
+        .values(password_hashed=password_hashed)
     )
-    updated_db_user = get_by_id(db=db, id=id)
-    return updated_db_user
+    db.commit()
+
+
+def _update_statement(
+    id: int, values: schemas.UserBase, versions: Collection[int] | None
+) -> sqlalchemy.Update:
+    user = models.User
+    return (
+        sqlalchemy.update(user)
+        .where(user.id == id, versioning.matches(user.version, versions))
+        .values(**values.model_dump(exclude_unset=True), version=user.version + 1)
+        .returning(user)
+    )
+
+
+def _not_updated(current: int | None, id: int) -> Exception:
+    """Why the conditional `UPDATE` matched no row, `current` is the version"""
+    if current is None:
+        return NoResultFound(f"Could not find user with :id={id}")
+    return versioning.VersionConflict(f"User :id={id} is at :version={current}")
+
+
+def _version_statement(id: int) -> sqlalchemy.Select:
+    return sqlalchemy.select(models.User.version).where(models.User.id == id)
+
+
+def update(
+    db: Session,
+    id: int,
+    values: schemas.UserBase,
+    versions: Collection[int] | None = None,
+) -> models.User:
+    """Changes the fields set in `values` in one `UPDATE ... RETURNING`
+
+    Given `versions`, only a user still at one of them changes, see
+    `shame.versioning`. The user comes back detached, unexpired by the commit.
+    """
+    updated = db.scalar(_update_statement(id, values, versions))
+    if updated is None:
+        db.rollback()
+        raise _not_updated(db.scalar(_version_statement(id)), id)
+    db.expunge(updated)
+    db.commit()
+    token_cache.invalidate_user(id)
+    # expanded story responses embed the username
+    response_cache.clear()
+    return updated
 
 
 def delete(db: Session, id: int):
@@ -89,3 +149,7 @@ def delete(db: Session, id: int):
         db.commit()
     except Exception as e:
         raise e
+    finally:
+        token_cache.invalidate_user(id)
+        # expanded story responses embed the username
+        response_cache.clear()
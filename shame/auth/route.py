@@ -1,15 +1,18 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm import Session
 
 from ..database import get_database
+from ..responses import render
 from . import (
     dependencies as deps,
     repository as user_repo,
     schemas,
 )
+from .hashing import hasher
 
 
 router = APIRouter(tags=["Authentication"])
@@ -32,15 +35,43 @@ def create_user(new_user: schemas.CreateUser, db: Database):
 
 @router.post("/login", response_model=schemas.Token)
 def login_user(db: Database, form_data: AuthForm):
-    user = user_repo.get_by_username(db=db, username=form_data.username)
-    if not user or not user.validate_password(form_data.password):
+    try:
+        user = user_repo.get_by_username(db=db, username=form_data.username)
+    except NoResultFound:
+        user = None
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Incorrect username or password.",
         )
+
+    valid, new_hash = hasher.verify_and_update(
+        form_data.password, user.password_hashed
+    )
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Incorrect username or password.",
+        )
+    if new_hash:
+        # stored with outdated bcrypt parameters, upgrade while we know the secret
+        user_repo.update_password_hash(db=db, id=user.id, password_hashed=new_hash)
     return user.generate_access_token()
 
 
+@router.get("/users/", response_model=list[schemas.RatedUser])
+def get_top_users(
+    db: Database,
+    skip: int = 0,
+    limit: int = Query(default=10, le=100),
+):
+    """Users by the total agree of their stories, highest first"""
+    return render(
+        list[schemas.RatedUser],
+        user_repo.get_top(db=db, skip=skip, limit=limit),
+    )
+
+
 @router.get("/users/me", response_model=schemas.User)
 def get_current_user(user: deps.CurrentActiveUser):
     return user
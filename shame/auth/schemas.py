@@ -18,6 +18,10 @@ class User(UserBase):
     id: int
 
 
+class RatedUser(User):
+    rating: int
+
+
 class UserInDB(User):
     password_hashed: str
 
@@ -1,9 +1,8 @@
 from datetime import datetime, timedelta
 from typing import Any
 
-from jose import jwt
-
 from . import schemas
+from .hashing import hasher
 from ..config.auth import auth_settings
 
 
@@ -17,14 +16,11 @@ def get_fake_user(token: str):
 
 
 def hash_password(password: str) -> str:
-    return auth_settings.PASSWORD_CONTEXT.hash(password)
+    return hasher.hash(password)
 
 
 def verify_password(password: str, password_hashed: str) -> bool:
-    return auth_settings.PASSWORD_CONTEXT.verify(
-        secret=password,
-        hash=password_hashed,
-    )
+    return hasher.verify(password, password_hashed)
 
 
 def _create_token(
@@ -40,6 +36,9 @@ def _create_token(
         expire = datetime.utcnow() + timedelta(
             minutes=auth_settings.ACCESS_TOKEN_EXPIRE_MINUTES
         )
+    # python-jose and its cryptography backend load on the first token
+    from jose import jwt
+
     to_encode = {"exp": expire, "sub": str(subject)}
     encoded_jwt = jwt.encode(
         to_encode,
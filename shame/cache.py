@@ -0,0 +1,191 @@
+"""In-process cache of serialized story responses
+
+`GET /shamestories/` and `GET /shamestories/{id}` keep their JSON body in a
+bounded LRU together with a strong ETag, so a hit costs neither a query nor a
+pass through `schemas.ShameStory`, and a client sending the ETag back in
+`If-None-Match` gets an empty 304. A single story's ETag also carries its
+version, which is what `If-Match` on an edit is checked against.
+
+Writes drop exactly what they can change: an edit drops the story and the
+pages it is on, while inserts, deletes and agree flushes also reorder pages,
+so they drop every page. A response computed while an invalidation ran is not
+stored, see `generation`.
+
+The cache is per process like `auth.cache`, and invalidation only reaches the
+worker that made the write. That is exact with a single worker; with several,
+the others keep serving their entry for at most `RESPONSE_CACHE_TTL` seconds,
+which is the bound on how stale a response can be. `RESPONSE_CACHE_MAX_AGE`
+only tells clients when to revalidate and bounds nothing on the server.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable, Iterable
+
+from fastapi import Request, Response, status
+
+from .config.settings import settings
+from .lazy import lazy
+
+
+@dataclass(frozen=True, slots=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+    story_ids: frozenset[int]
+    expires_at: float = float("inf")
+
+
+CacheKey = tuple[Hashable, ...]
+
+
+def story_key(shamestory_id: int, expand: Iterable[str] = ()) -> CacheKey:
+    return ("story", shamestory_id, tuple(sorted(expand)))
+
+
+def list_key(
+    skip: int,
+    limit: int,
+    expand: Iterable[str] = (),
+    fields: Iterable[str] = (),
+) -> CacheKey:
+    return ("list", skip, limit, tuple(sorted(expand)), tuple(fields))
+
+
+def make_etag(body: bytes, version: int | None = None) -> str:
+    """Strong ETag of `body`, led by the row version for `If-Match`"""
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    if version is None:
+        return f'"{digest}"'
+    return f'"{version}.{digest}"'
+
+
+class ResponseCache:
+    def __init__(self, maxsize: int, ttl: float = 0):
+        self.maxsize = maxsize
+        # seconds an entry is served for, 0 keeps it until invalidated
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+        # bumped by every invalidation, a `put` from an older one is dropped
+        self.generation = 0
+        self._entries: OrderedDict[CacheKey, CachedResponse] = OrderedDict()
+        self._keys_by_story: dict[int, set[CacheKey]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: CacheKey) -> CachedResponse | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(
+        self,
+        key: CacheKey,
+        body: bytes,
+        story_ids: Iterable[int],
+        generation: int,
+        version: int | None = None,
+    ) -> CachedResponse:
+        entry = CachedResponse(
+            body,
+            make_etag(body, version),
+            frozenset(story_ids),
+            time.monotonic() + self.ttl if self.ttl > 0 else float("inf"),
+        )
+        if self.maxsize <= 0:
+            return entry
+        with self._lock:
+            if generation != self.generation:
+                return entry
+            self._remove(key)
+            self._entries[key] = entry
+            for story_id in entry.story_ids:
+                self._keys_by_story.setdefault(story_id, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+        return entry
+
+    def invalidate_story(self, shamestory_id: int) -> None:
+        """Drops the story, in every expand variant, and every page listing it"""
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            for key in self._keys_by_story.pop(shamestory_id, set()):
+                self._remove(key)
+
+    def invalidate_lists(self) -> None:
+        """Drops every cached page, for writes that move stories between pages"""
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            for key in [key for key in self._entries if key[0] == "list"]:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._keys_by_story.clear()
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "invalidations": self.invalidations,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def respond(self, request: Request, entry: CachedResponse) -> Response:
+        """The cached body, or an empty 304 if the client already has it"""
+        headers = {
+            "ETag": entry.etag,
+            "Cache-Control": f"public, max-age={settings.RESPONSE_CACHE_MAX_AGE}",
+        }
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None and (
+            if_none_match.strip() == "*"
+            or entry.etag in (tag.strip() for tag in if_none_match.split(","))
+        ):
+            with self._lock:
+                self.not_modified += 1
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(
+            content=entry.body, media_type="application/json", headers=headers
+        )
+
+    def _remove(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for story_id in entry.story_ids:
+            keys = self._keys_by_story.get(story_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_story[story_id]
+
+
+response_cache = lazy(
+    lambda: ResponseCache(
+        maxsize=settings.RESPONSE_CACHE_SIZE, ttl=settings.RESPONSE_CACHE_TTL
+    )
+)
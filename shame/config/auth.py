@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from passlib.context import CryptContext
+
+from ..lazy import lazy
 
 
 class AuthSettings(BaseSettings):
@@ -8,12 +9,17 @@ class AuthSettings(BaseSettings):
     JWT_REFRESH_SECRET_KEY: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
     REFRESH_TOKEN_EXPIRE_MINUTES: int
+    # verified tokens kept in memory by `shame.auth.cache`, 0 disables it
+    TOKEN_CACHE_SIZE: int = 10_000
 
-    @property
-    def PASSWORD_CONTEXT(self) -> CryptContext:
-        return CryptContext(schemes=["bcrypt"], deprecated="auto")
+    # bcrypt cost factor, stored hashes below it are rehashed on login
+    BCRYPT_ROUNDS: int = 12
+    # processes hashing passwords (None: one per CPU, 0: inline)
+    PASSWORD_HASH_WORKERS: int | None = None
+    PASSWORD_HASH_MAX_PENDING: int = 256
 
     model_config = SettingsConfigDict(env_file=".env_auth")
 
 
-auth_settings = AuthSettings()  # pyright: ignore
+# read from the environment on first use, not on import
+auth_settings = lazy(AuthSettings)
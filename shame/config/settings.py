@@ -1,5 +1,7 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from ..lazy import lazy
+
 
 class Settings(BaseSettings):
     DB_HOST: str
@@ -8,11 +10,74 @@ class Settings(BaseSettings):
     DB_PASS: str
     DB_NAME: str
 
+    # connection pool of each engine, see `shame.pool`
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    # seconds before a connection is replaced, -1 keeps them forever
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # keep the stack of every checkout to find leaked sessions, costly
+    DB_POOL_TRACE_CHECKOUTS: bool = False
+
+    # read replicas for GET requests, a JSON list, see `shame.replicas`
+    DB_REPLICA_URLS: list[str] = []
+    # a client that wrote reads from the primary for this long
+    DB_REPLICA_STICKY_SECONDS: float = 5.0
+    # seconds between health checks of a replica
+    DB_REPLICA_HEALTH_INTERVAL: float = 10.0
+
+    # per-request SQL profile in a `Server-Timing` header, see `shame.profiler`
+    SQL_PROFILER: bool = False
+    # statements repeated this often in one request are logged as likely N+1
+    SQL_REPEAT_THRESHOLD: int = 5
+    # statements slower than this go to the `shame.sql.slow` log, 0 turns it off
+    SLOW_QUERY_THRESHOLD_MS: float = 200.0
+
+    # `/internal` diagnostics answer only requests sending this back in
+    # `X-Internal-Token`, unset hides them
+    INTERNAL_TOKEN: str | None = None
+
+    # serve routes from the AsyncEngine/AsyncSession stack instead of the sync one
+    ASYNC_DATABASE: bool = False
+    # overrides the asyncpg url, e.g. `sqlite+aiosqlite:///./shame.db` locally
+    ASYNC_DATABASE_URL: str | None = None
+
+    # write-behind `agree` counter, see `shame.counters`
+    AGREE_FLUSH_INTERVAL: float = 1.0
+    AGREE_FLUSH_MAX_BATCH: int = 1000
+    AGREE_BUFFER_SHARDS: int = 16
+
+    # ids one `GET /shamestories/batch` may ask for
+    BATCH_MAX_IDS: int = 100
+
+    # most agreed stories kept in memory per board, see `shame.leaderboard`
+    LEADERBOARD_SIZE: int = 100
+    # seconds between catch-ups with other workers' agrees, 0 turns it off
+    LEADERBOARD_RELOAD_INTERVAL: float = 60.0
+
+    # story read responses kept by `shame.cache`, 0 turns the cache off
+    RESPONSE_CACHE_SIZE: int = 1024
+    # seconds a cached response is served before it is rebuilt, which bounds
+    # how long other workers' writes stay invisible; 0 keeps it until invalidated
+    RESPONSE_CACHE_TTL: float = 5.0
+    # clients revalidate with `If-None-Match` once this runs out
+    RESPONSE_CACHE_MAX_AGE: int = 0
+
     @property
     def DATABASE_URL_PSYCOPG(self):
         return f"postgresql://{self.DB_USER}:{self.DB_PASS}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
+    @property
+    def DATABASE_URL_ASYNCPG(self):
+        return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASS}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+
+    @property
+    def DATABASE_URL_ASYNC(self):
+        return self.ASYNC_DATABASE_URL or self.DATABASE_URL_ASYNCPG
+
     model_config = SettingsConfigDict(env_file=".env")
 
 
-settings = Settings()  # pyright: ignore
+# read from the environment on first use, not on import
+settings = lazy(Settings)
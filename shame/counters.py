@@ -0,0 +1,162 @@
+"""Write-behind buffer for `ShameStory.agree`
+
+Clicks only bump an in-memory delta; a periodic flush turns everything that
+piled up for a story into one `agree = agree + delta`, so a viral story costs
+one row update per flush instead of one row lock per click. Deltas live in
+this process until flushed, `drain` on shutdown writes out what is left.
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Mapping
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import async_repository, leaderboard, repository
+from .cache import response_cache
+from .config.settings import settings
+from .database import AsyncSessionLocal, SessionLocal
+from .lazy import lazy
+
+
+logger = logging.getLogger(__name__)
+
+
+class AgreeBuffer:
+    def __init__(self, shards: int, max_batch: int):
+        self.max_batch = max_batch
+        self.flushed = 0
+        self._shards: list[dict[int, int]] = [{} for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+
+    def _shard(self, story_id: int) -> int:
+        return story_id % len(self._shards)
+
+    def increment(self, story_id: int, amount: int = 1) -> int:
+        """Adds to the pending delta of the story and returns it"""
+        index = self._shard(story_id)
+        with self._locks[index]:
+            deltas = self._shards[index]
+            deltas[story_id] = deltas.get(story_id, 0) + amount
+            return deltas[story_id]
+
+    def pending(self, story_id: int | None = None) -> int:
+        """Pending delta of one story, or the number of stories with one"""
+        if story_id is not None:
+            return self._shards[self._shard(story_id)].get(story_id, 0)
+        return sum(len(deltas) for deltas in self._shards)
+
+    def take(self, limit: int | None = None) -> dict[int, int]:
+        """Removes up to `limit` pending deltas from the buffer"""
+        taken: dict[int, int] = {}
+        for lock, deltas in zip(self._locks, self._shards):
+            with lock:
+                while deltas and (limit is None or len(taken) < limit):
+                    story_id, delta = deltas.popitem()
+                    if delta:
+                        taken[story_id] = delta
+            if limit is not None and len(taken) >= limit:
+                break
+        return taken
+
+    def restore(self, deltas: Mapping[int, int]) -> None:
+        """Puts back deltas of a failed flush"""
+        for story_id, delta in deltas.items():
+            self.increment(story_id, delta)
+
+    def flush(self, db: Session) -> int:
+        """Writes at most `max_batch` stories, returns how many were written"""
+        deltas = self.take(self.max_batch)
+        if not deltas:
+            return 0
+        try:
+            repository.apply_agree_deltas(db=db, deltas=deltas)
+        except Exception:
+            self.restore(deltas)
+            raise
+        self.flushed += len(deltas)
+        self._invalidate(deltas)
+        leaderboard.refresh(db, deltas)
+        return len(deltas)
+
+    async def flush_async(self, db: AsyncSession) -> int:
+        deltas = self.take(self.max_batch)
+        if not deltas:
+            return 0
+        try:
+            await async_repository.apply_agree_deltas(db=db, deltas=deltas)
+        except Exception:
+            self.restore(deltas)
+            raise
+        self.flushed += len(deltas)
+        self._invalidate(deltas)
+        await leaderboard.refresh_async(db, deltas)
+        return len(deltas)
+
+    def _invalidate(self, deltas: Mapping[int, int]) -> None:
+        for story_id in deltas:
+            response_cache.invalidate_story(story_id)
+        # new counts reorder the pages
+        response_cache.invalidate_lists()
+
+    def drain(self, db: Session) -> int:
+        flushed = 0
+        while written := self.flush(db):
+            flushed += written
+        return flushed
+
+    async def drain_async(self, db: AsyncSession) -> int:
+        flushed = 0
+        while written := await self.flush_async(db):
+            flushed += written
+        return flushed
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "shards": len(self._shards),
+            "pending_stories": self.pending(),
+            "max_batch": self.max_batch,
+            "flushed": self.flushed,
+        }
+
+
+agree_buffer = lazy(
+    lambda: AgreeBuffer(
+        shards=settings.AGREE_BUFFER_SHARDS,
+        max_batch=settings.AGREE_FLUSH_MAX_BATCH,
+    )
+)
+
+
+def _flush_once() -> int:
+    with SessionLocal() as db:
+        return agree_buffer.flush(db)
+
+
+async def flush_periodically(interval: float) -> None:
+    """Flushes one bounded batch per tick until cancelled"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if settings.ASYNC_DATABASE:
+                async with AsyncSessionLocal() as db:
+                    await agree_buffer.flush_async(db)
+            else:
+                await run_in_threadpool(_flush_once)
+        except Exception:
+            logger.exception("Failed to flush agree counters, retrying next tick")
+
+
+async def drain() -> int:
+    if settings.ASYNC_DATABASE:
+        async with AsyncSessionLocal() as db:
+            return await agree_buffer.drain_async(db)
+
+    def _drain() -> int:
+        with SessionLocal() as db:
+            return agree_buffer.drain(db)
+
+    return await run_in_threadpool(_drain)
@@ -1,21 +1,128 @@
-from sqlalchemy import create_engine
+"""Engines and session factories, built from settings on first use
+
+Importing this module reads no settings: `engine`, `async_engine` and
+`replicas` are `lazy` proxies, and the session factories are bound to them,
+so the first session (or `engine.begin()`) is what connects. `async_engine`
+is only ever built with `ASYNC_DATABASE` on.
+"""
+
+import hashlib
+from typing import Any
+
+from fastapi import Request
+from sqlalchemy import Engine, create_engine
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 from .config.settings import settings
+from .lazy import lazy
+from .pool import PoolMonitor
+from .replicas import SAFE_METHODS, ReplicaSet
+
+
+def _pool_options() -> dict[str, Any]:
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+pool_monitor = PoolMonitor()
+async_pool_monitor = PoolMonitor()
+
+
+def _create_engine() -> Engine:
+    pool_monitor.trace_checkouts = settings.DB_POOL_TRACE_CHECKOUTS
+    engine = create_engine(
+        settings.DATABASE_URL_PSYCOPG,
+        poolclass=pool_monitor.pool_class(QueuePool),
+        **_pool_options(),
+    )
+    pool_monitor.listen(engine)
+    return engine
+
 
+def _create_async_engine() -> AsyncEngine:
+    async_pool_monitor.trace_checkouts = settings.DB_POOL_TRACE_CHECKOUTS
+    engine = create_async_engine(
+        settings.DATABASE_URL_ASYNC,
+        poolclass=async_pool_monitor.pool_class(AsyncAdaptedQueuePool),
+        **_pool_options(),
+    )
+    async_pool_monitor.listen(engine.sync_engine)
+    return engine
 
-engine = create_engine(settings.DATABASE_URL_PSYCOPG)
+
+engine = lazy(_create_engine)
 SessionLocal = sessionmaker(engine, autocommit=False, autoflush=False)
 
+replicas = lazy(
+    lambda: ReplicaSet(
+        engine,
+        [create_engine(url, **_pool_options()) for url in settings.DB_REPLICA_URLS],
+        sticky_seconds=settings.DB_REPLICA_STICKY_SECONDS,
+    )
+)
+
+async_engine = lazy(_create_async_engine)
+# objects must stay readable after commit: an expired attribute would need IO
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 
 class Base(DeclarativeBase):
     pass
 
 
-def get_database():
-    db = SessionLocal()
+def upsert_insert(dialect: str, table: Any) -> postgresql.Insert | sqlite.Insert | None:
+    """The dialect's `INSERT` that takes `ON CONFLICT`, None where there is none"""
+    match dialect:
+        case "postgresql":
+            return postgresql.insert(table)
+        case "sqlite":
+            return sqlite.insert(table)
+        case _:
+            return None
+
+
+def _client(request: Request) -> str | None:
+    """Stickiness key: a hash of the credentials, so no token is kept"""
+    authorization = request.headers.get("authorization")
+    if authorization:
+        return hashlib.sha256(authorization.encode()).hexdigest()
+    return request.client.host if request.client is not None else None
+
+
+def get_database(request: Request):
+    """A session on the primary, or on a replica for a read-only request"""
+    if replicas:
+        read_only = request.method in SAFE_METHODS
+        client = _client(request)
+        if not read_only and client is not None:
+            replicas.wrote(client)
+        db = SessionLocal(bind=replicas.engine_for(read_only, client))
+    else:
+        db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
+
+async def get_async_database():
+    async with AsyncSessionLocal() as db:
+        yield db
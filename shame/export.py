@@ -0,0 +1,171 @@
+"""Streaming NDJSON/CSV dump of stories joined with their address and author
+
+Rows come from a Core column projection executed with `yield_per`, which
+turns on server-side cursors (`stream_results`) where the driver has them, so
+only one partition of plain rows is ever held in memory, whatever the size of
+the table. The `_async` variants stream the same partitions from an
+`AsyncSession`.
+
+    python -m shame.export --format csv > stories.csv
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+from typing import AsyncIterator, Iterator, Literal, Sequence
+
+import sqlalchemy
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import models
+from .auth.models import User
+from .database import SessionLocal
+
+
+ExportFormat = Literal["ndjson", "csv"]
+
+MEDIA_TYPES: dict[ExportFormat, str] = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+YIELD_PER = 1000
+
+COLUMNS = (
+    models.ShameStory.id,
+    models.ShameStory.title,
+    models.ShameStory.text,
+    models.ShameStory.agree,
+    models.ShameStory.author_id,
+    User.username.label("author_username"),
+    models.ShameStory.address_id,
+    models.Address.country,
+    models.Address.state,
+    models.Address.city,
+    models.Address.street,
+)
+HEADER = list(sqlalchemy.select(*COLUMNS).selected_columns.keys())
+
+
+def export_statement() -> sqlalchemy.Select:
+    return (
+        sqlalchemy.select(*COLUMNS)
+        .join_from(
+            models.ShameStory,
+            models.Address,
+            models.ShameStory.address_id == models.Address.id,
+            isouter=True,
+        )
+        .join(User, models.ShameStory.author_id == User.id, isouter=True)
+        .order_by(models.ShameStory.id)
+    )
+
+
+def iter_partitions(
+    db: Session,
+    yield_per: int = YIELD_PER,
+) -> Iterator[Sequence[sqlalchemy.Row]]:
+    result = db.execute(export_statement().execution_options(yield_per=yield_per))
+    try:
+        yield from result.partitions()
+    finally:
+        result.close()
+
+
+async def iter_partitions_async(
+    db: AsyncSession,
+    yield_per: int = YIELD_PER,
+) -> AsyncIterator[Sequence[sqlalchemy.Row]]:
+    result = await db.stream(
+        export_statement().execution_options(yield_per=yield_per)
+    )
+    try:
+        async for rows in result.partitions():
+            yield rows
+    finally:
+        await result.close()
+
+
+def _ndjson(rows: Sequence[sqlalchemy.Row]) -> bytes:
+    return "".join(
+        json.dumps(dict(zip(HEADER, row)), ensure_ascii=False) + "\n" for row in rows
+    ).encode()
+
+
+def _csv(rows: Sequence[sqlalchemy.Row], header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(HEADER)
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def iter_ndjson(db: Session, yield_per: int = YIELD_PER) -> Iterator[bytes]:
+    for rows in iter_partitions(db, yield_per):
+        yield _ndjson(rows)
+
+
+def iter_csv(db: Session, yield_per: int = YIELD_PER) -> Iterator[bytes]:
+    header = True
+    for rows in iter_partitions(db, yield_per):
+        yield _csv(rows, header)
+        header = False
+    if header:
+        yield _csv((), header)
+
+
+def iter_export(
+    db: Session,
+    format: ExportFormat,
+    yield_per: int = YIELD_PER,
+) -> Iterator[bytes]:
+    if format == "csv":
+        return iter_csv(db, yield_per)
+    return iter_ndjson(db, yield_per)
+
+
+async def iter_ndjson_async(
+    db: AsyncSession, yield_per: int = YIELD_PER
+) -> AsyncIterator[bytes]:
+    async for rows in iter_partitions_async(db, yield_per):
+        yield _ndjson(rows)
+
+
+async def iter_csv_async(
+    db: AsyncSession, yield_per: int = YIELD_PER
+) -> AsyncIterator[bytes]:
+    header = True
+    async for rows in iter_partitions_async(db, yield_per):
+        yield _csv(rows, header)
+        header = False
+    if header:
+        yield _csv((), header)
+
+
+def iter_export_async(
+    db: AsyncSession,
+    format: ExportFormat,
+    yield_per: int = YIELD_PER,
+) -> AsyncIterator[bytes]:
+    if format == "csv":
+        return iter_csv_async(db, yield_per)
+    return iter_ndjson_async(db, yield_per)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Stream all stories to stdout")
+    parser.add_argument("--format", choices=list(MEDIA_TYPES), default="ndjson")
+    parser.add_argument("--yield-per", type=int, default=YIELD_PER)
+    args = parser.parse_args(argv)
+
+    with SessionLocal() as db:
+        for data in iter_export(db, args.format, args.yield_per):
+            sys.stdout.buffer.write(data)
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
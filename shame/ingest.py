@@ -0,0 +1,259 @@
+"""Streaming bulk import of stories from NDJSON
+
+Every line is one `schemas.ImportShameStory`. Lines are read lazily and
+handled in chunks: validated, their addresses resolved with one upsert and
+one select, and the stories written with a single executemany (`COPY` on
+Postgres) and one commit per chunk. A bad line is reported and skipped, it
+never aborts the import: a chunk the database rejects is retried row by
+row, each in a savepoint, so only the rows that fail again are reported. `AsyncImporter` does the same on an `AsyncSession`.
+
+    python -m shame.ingest stories.ndjson --author-id 1
+"""
+
+import argparse
+import sys
+import time
+from itertools import islice
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator
+
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import async_repository as async_repo
+from . import repository as repo
+from . import schemas
+from .database import SessionLocal
+
+
+CHUNK_SIZE = 1000
+# the report keeps the first errors only, `rows - inserted` still counts all
+MAX_REPORTED_ERRORS = 1000
+
+
+# line number, the validated line, its author
+_Row = tuple[int, schemas.ImportShameStory, int]
+_Valid = list[_Row]
+
+
+class _Importer:
+    """Validation and the report, shared by both session kinds"""
+
+    def __init__(self, author_id: int | None = None):
+        self.author_id = author_id
+        self.report = schemas.ImportReport()
+        self._started = time.perf_counter()
+
+    def _error(self, line: int, error: str) -> None:
+        if len(self.report.errors) < MAX_REPORTED_ERRORS:
+            self.report.errors.append(schemas.ImportRowError(line=line, error=error))
+
+    def _validate(self, chunk: list[tuple[int, str | bytes]]) -> _Valid:
+        valid: _Valid = []
+        for line_number, line in chunk:
+            if not line.strip():
+                continue
+            self.report.rows += 1
+            try:
+                row = schemas.ImportShameStory.model_validate_json(line)
+            except ValidationError as e:
+                self._error(line_number, str(e))
+                continue
+
+            author_id = self.author_id if self.author_id is not None else row.author_id
+            if author_id is None:
+                self._error(line_number, "Missing :author_id")
+                continue
+            valid.append((line_number, row, author_id))
+        return valid
+
+    @staticmethod
+    def _rows(valid: _Valid, address_ids: dict[repo.AddressKey, int]) -> list[dict]:
+        return [
+            {
+                **row.shamestory.model_dump(),
+                "author_id": author_id,
+                "address_id": address_ids[
+                    (
+                        row.address.country,
+                        row.address.state,
+                        row.address.city,
+                        row.address.street,
+                    )
+                ],
+            }
+            for _, row, author_id in valid
+        ]
+
+    def _failed(self, valid: _Valid, error: Exception) -> int:
+        for line_number, _, _ in valid:
+            self._error(line_number, f"Chunk failed: {error}")
+        return 0
+
+    def _row_failed(self, row: _Row, error: Exception) -> None:
+        self._error(row[0], f"Insert failed: {error}")
+
+    def _inserted(self, inserted: int) -> int:
+        self.report.inserted += inserted
+        return inserted
+
+    def finish(self) -> schemas.ImportReport:
+        self.report.seconds = time.perf_counter() - self._started
+        if self.report.seconds > 0:
+            self.report.rows_per_second = self.report.inserted / self.report.seconds
+        return self.report
+
+
+class Importer(_Importer):
+    def __init__(self, db: Session, author_id: int | None = None):
+        super().__init__(author_id=author_id)
+        self.db = db
+
+    def _insert(self, valid: _Valid) -> int:
+        address_ids = repo.upsert_addresses(
+            self.db, (row.address for _, row, _ in valid)
+        )
+        return repo.add_many(self.db, self._rows(valid, address_ids))
+
+    def _insert_each(self, valid: _Valid) -> int:
+        """Each row in its own savepoint, so only the rows that fail are lost"""
+        inserted = 0
+        for row in valid:
+            try:
+                with self.db.begin_nested():
+                    inserted += self._insert([row])
+            except Exception as e:
+                self._row_failed(row, e)
+        try:
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            return self._failed(valid, e)
+        return inserted
+
+    def import_chunk(self, chunk: list[tuple[int, str | bytes]]) -> int:
+        valid = self._validate(chunk)
+        if not valid:
+            return 0
+
+        try:
+            inserted = self._insert(valid)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            inserted = self._insert_each(valid)
+        return self._inserted(inserted)
+
+
+class AsyncImporter(_Importer):
+    def __init__(self, db: AsyncSession, author_id: int | None = None):
+        super().__init__(author_id=author_id)
+        self.db = db
+
+    async def _insert(self, valid: _Valid) -> int:
+        address_ids = await async_repo.upsert_addresses(
+            self.db, (row.address for _, row, _ in valid)
+        )
+        return await async_repo.add_many(self.db, self._rows(valid, address_ids))
+
+    async def _insert_each(self, valid: _Valid) -> int:
+        inserted = 0
+        for row in valid:
+            try:
+                async with self.db.begin_nested():
+                    inserted += await self._insert([row])
+            except Exception as e:
+                self._row_failed(row, e)
+        try:
+            await self.db.commit()
+        except Exception as e:
+            await self.db.rollback()
+            return self._failed(valid, e)
+        return inserted
+
+    async def import_chunk(self, chunk: list[tuple[int, str | bytes]]) -> int:
+        valid = self._validate(chunk)
+        if not valid:
+            return 0
+
+        try:
+            inserted = await self._insert(valid)
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            inserted = await self._insert_each(valid)
+        return self._inserted(inserted)
+
+
+def chunked(
+    lines: Iterable[str | bytes],
+    size: int = CHUNK_SIZE,
+) -> Iterator[list[tuple[int, str | bytes]]]:
+    numbered = enumerate(lines, start=1)
+    while chunk := list(islice(numbered, size)):
+        yield chunk
+
+
+async def achunked(
+    lines: AsyncIterable[bytes],
+    size: int = CHUNK_SIZE,
+) -> AsyncIterator[list[tuple[int, str | bytes]]]:
+    chunk: list[tuple[int, str | bytes]] = []
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        chunk.append((line_number, line))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def split_lines(stream: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Re-splits a byte stream of arbitrary chunks into lines"""
+    rest = b""
+    async for data in stream:
+        *lines, rest = (rest + data).split(b"\n")
+        for line in lines:
+            yield line
+    if rest:
+        yield rest
+
+
+def import_lines(
+    db: Session,
+    lines: Iterable[str | bytes],
+    author_id: int | None = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> schemas.ImportReport:
+    importer = Importer(db=db, author_id=author_id)
+    for chunk in chunked(lines, chunk_size):
+        importer.import_chunk(chunk)
+    return importer.finish()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Bulk import NDJSON stories")
+    parser.add_argument("path", help="NDJSON file, `-` for stdin")
+    parser.add_argument(
+        "--author-id",
+        type=int,
+        default=None,
+        help="author of every story, otherwise taken from each line",
+    )
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    with SessionLocal() as db:
+        if args.path == "-":
+            report = import_lines(db, sys.stdin, args.author_id, args.chunk_size)
+        else:
+            with open(args.path, encoding="utf-8") as file:
+                report = import_lines(db, file, args.author_id, args.chunk_size)
+
+    print(report.model_dump_json(indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Process diagnostics, hidden unless `INTERNAL_TOKEN` is set
+
+Every route answers 404 unless the request carries the token in
+`X-Internal-Token`: pool checkouts include stack traces, and none of it is
+meant for clients.
+"""
+
+import secrets
+from typing import Annotated
+
+from fastapi import Depends, Header, HTTPException, status
+from fastapi.routing import APIRouter
+
+from . import migrations
+from .auth.cache import token_cache
+from .auth.hashing import hasher
+from .cache import response_cache
+from .config.settings import settings
+from .counters import agree_buffer
+from .database import async_pool_monitor, pool_monitor, replicas
+from .leaderboard import top_stories
+
+
+def internal_access(
+    x_internal_token: Annotated[str | None, Header()] = None,
+) -> None:
+    expected = settings.INTERNAL_TOKEN
+    if (
+        expected is None
+        or x_internal_token is None
+        or not secrets.compare_digest(x_internal_token, expected)
+    ):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+
+router = APIRouter(
+    prefix="/internal",
+    tags=["Internal"],
+    dependencies=[Depends(internal_access)],
+    include_in_schema=False,
+)
+
+
+@router.get("/stats")
+def get_stats():
+    bootstrap = migrations.last_bootstrap
+    return {
+        "schema_bootstrap": (
+            None
+            if bootstrap is None
+            else {"migrated": bootstrap.migrated, "seconds": bootstrap.seconds}
+        ),
+        "token_cache": token_cache.stats(),
+        "password_hasher": hasher.stats(),
+        "agree_buffer": agree_buffer.stats(),
+        "response_cache": response_cache.stats(),
+        "leaderboard": top_stories.stats(),
+        "database_pool": pool_monitor.stats(),
+        "async_database_pool": (
+            async_pool_monitor.stats() if settings.ASYNC_DATABASE else None
+        ),
+        "read_replicas": replicas.stats(),
+    }
+
+
+@router.get("/pool/checkouts")
+def get_pool_checkouts(older_than: float = 0.0):
+    """Connections checked out for `older_than` seconds, with their stacks"""
+    return {
+        "database_pool": pool_monitor.checked_out(older_than),
+        "async_database_pool": async_pool_monitor.checked_out(older_than),
+    }
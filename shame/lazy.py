@@ -0,0 +1,62 @@
+"""Module-level singletons built on first use
+
+`Lazy(factory)` stands in for the object `factory()` returns and builds it on
+the first attribute access, so importing a module that defines one costs
+nothing: settings are read from the environment, and heavy dependencies
+imported, only once something actually uses them.
+
+`lazy(factory)` is how modules define one: it returns the same proxy, typed
+as the `T` it forwards to, so call sites type-check against the real class.
+Attribute access, assignment and truthiness are forwarded; `isinstance` and
+other dunders see the proxy.
+"""
+
+import threading
+from typing import Callable, Generic, TypeVar, cast
+
+
+T = TypeVar("T")
+
+_UNSET = object()
+
+
+class Lazy(Generic[T]):
+    __slots__ = ("_factory", "_value", "_lock")
+
+    def __init__(self, factory: Callable[[], T]):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_value", _UNSET)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    @property
+    def resolved(self) -> bool:
+        return self._value is not _UNSET
+
+    def resolve(self) -> T:
+        if self._value is _UNSET:
+            with self._lock:
+                if self._value is _UNSET:
+                    object.__setattr__(self, "_value", self._factory())
+        return self._value  # type: ignore[return-value]
+
+    def __getattr__(self, name: str):
+        return getattr(self.resolve(), name)
+
+    def __setattr__(self, name: str, value) -> None:
+        setattr(self.resolve(), name, value)
+
+    def __delattr__(self, name: str) -> None:
+        delattr(self.resolve(), name)
+
+    def __bool__(self) -> bool:
+        return bool(self.resolve())
+
+    def __repr__(self) -> str:
+        if not self.resolved:
+            return f"Lazy({self._factory!r})"
+        return repr(self._value)
+
+
+def lazy(factory: Callable[[], T]) -> T:
+    """A `Lazy(factory)` standing in for the `T` it builds on first use"""
+    return cast(T, Lazy(factory))
@@ -0,0 +1,353 @@
+"""Most agreed stories, globally and per country, kept in memory
+
+Each `Board` holds the best `capacity` stories by `(agree desc, id)` in a
+sorted list, plus `bound`: the best key of any story left outside. Every
+story on the board is better than `bound` and every story outside is not, so
+the first `limit` entries are the exact top as long as the board holds that
+many. An update or insert is a bisect into the list; a story that falls to
+`bound` or below leaves the board, and one that grows past `bound` joins it.
+Reading the top is a slice, with no query.
+
+Deletions can drain a board below `limit`; `top` then answers None and the
+caller reloads from the database. Boards are loaded at startup and refreshed
+from the stories of every agree flush of this process. Every
+`LEADERBOARD_RELOAD_INTERVAL` seconds `catch_up` picks up what other workers
+flushed without reloading: it re-reads the stories on the boards by id,
+removes those it no longer finds, and offers the global top, an index scan
+of `capacity + 1` rows. A story that
+climbs into a country's top only from outside the global one waits for the
+next full load, which the per-country window scan is kept for.
+"""
+
+import asyncio
+import bisect
+import logging
+import threading
+from typing import Iterable, Iterator, Sequence
+
+import sqlalchemy
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .config.settings import settings
+from .database import AsyncSessionLocal, SessionLocal
+from .lazy import lazy
+
+
+logger = logging.getLogger(__name__)
+
+# `(-agree, id)`, ascending is best first
+Key = tuple[int, int]
+
+
+class Board:
+    def __init__(self, capacity: int, bound: Key | None = None):
+        self.capacity = capacity
+        # None while every story is on the board
+        self.bound = bound
+        self._keys: list[Key] = []
+        self._agree: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, story_id: int) -> bool:
+        return story_id in self._agree
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._agree)
+
+    def offer(self, story_id: int, agree: int) -> None:
+        """Puts the story at its place, or outside when it is not good enough"""
+        current = self._agree.get(story_id)
+        if current == agree:
+            return
+        if current is not None:
+            self.remove(story_id)
+        key = (-agree, story_id)
+        if self.bound is not None and key >= self.bound:
+            return
+        bisect.insort(self._keys, key)
+        self._agree[story_id] = agree
+        if len(self._keys) > self.capacity:
+            self.bound = self._keys.pop()
+            del self._agree[self.bound[1]]
+
+    def remove(self, story_id: int) -> None:
+        agree = self._agree.pop(story_id, None)
+        if agree is not None:
+            del self._keys[bisect.bisect_left(self._keys, (-agree, story_id))]
+
+    def top(self, limit: int) -> list[tuple[int, int]] | None:
+        """`(id, agree)` of the best `limit` stories, None if not known here"""
+        if len(self._keys) < limit and self.bound is not None:
+            return None
+        return [(story_id, -agree) for agree, story_id in self._keys[:limit]]
+
+
+class Leaderboard:
+    def __init__(self, size: int, capacity: int | None = None):
+        self.size = size
+        # the margin absorbs deletions before a board has to be reloaded
+        self.capacity = capacity or 2 * size
+        self.loaded = False
+        self.loads = 0
+        self._global = Board(self.capacity)
+        self._countries: dict[str, Board] = {}
+        self._country_of: dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def _board(self, rows: Iterable[Sequence]) -> Board:
+        """A board from `(id, agree)` rows in order, one past capacity if any"""
+        rows = list(rows)
+        board = Board(self.capacity)
+        if len(rows) > self.capacity:
+            story_id, agree = rows.pop()[:2]
+            board.bound = (-agree, story_id)
+        for story_id, agree in (row[:2] for row in rows):
+            board.offer(story_id, agree)
+        return board
+
+    def load(
+        self,
+        global_rows: Iterable[Sequence],
+        country_rows: Iterable[Sequence],
+    ) -> None:
+        """Replaces every board, country rows are `(id, agree, country)`"""
+        by_country: dict[str, list[Sequence]] = {}
+        for row in country_rows:
+            by_country.setdefault(row[2], []).append(row)
+        countries = {
+            country: self._board(rows) for country, rows in by_country.items()
+        }
+        board = self._board(global_rows)
+        with self._lock:
+            self._global = board
+            self._countries = countries
+            self._country_of = {
+                story_id: country
+                for country, board in countries.items()
+                for story_id in board
+            }
+            self.loaded = True
+            self.loads += 1
+
+    def story_ids(self) -> list[int]:
+        """Every story on some board"""
+        with self._lock:
+            return sorted({*self._global, *self._country_of})
+
+    def invalidate(self) -> None:
+        """Forgets the boards, the next read loads them again"""
+        self.loaded = False
+
+    def offer(self, story_id: int, agree: int, country: str) -> None:
+        if not self.loaded:
+            return
+        with self._lock:
+            self._global.offer(story_id, agree)
+            board = self._countries.setdefault(country, Board(self.capacity))
+            board.offer(story_id, agree)
+            if story_id in board:
+                self._country_of[story_id] = country
+            else:
+                self._country_of.pop(story_id, None)
+
+    def remove(self, story_id: int) -> None:
+        with self._lock:
+            self._global.remove(story_id)
+            country = self._country_of.pop(story_id, None)
+            if country is not None:
+                self._countries[country].remove(story_id)
+
+    def top(
+        self, limit: int, country: str | None = None
+    ) -> list[tuple[int, int]] | None:
+        """`(id, agree)` best first, None when the boards need a reload"""
+        if not self.loaded:
+            return None
+        with self._lock:
+            if country is None:
+                return self._global.top(limit)
+            board = self._countries.get(country)
+            return [] if board is None else board.top(limit)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "capacity": self.capacity,
+            "loaded": self.loaded,
+            "loads": self.loads,
+            "global": len(self._global),
+            "countries": len(self._countries),
+        }
+
+
+top_stories = lazy(lambda: Leaderboard(size=settings.LEADERBOARD_SIZE))
+
+
+def _global_statement(capacity: int) -> sqlalchemy.Select:
+    story, address = models.ShameStory, models.Address
+    return (
+        sqlalchemy.select(story.id, story.agree, address.country)
+        .join(address, address.id == story.address_id)
+        .order_by(story.agree.desc(), story.id)
+        .limit(capacity + 1)
+    )
+
+
+def _country_statement(capacity: int) -> sqlalchemy.Select:
+    story, address = models.ShameStory, models.Address
+    ranked = (
+        sqlalchemy.select(
+            story.id,
+            story.agree,
+            address.country,
+            sqlalchemy.func.row_number()
+            .over(
+                partition_by=address.country,
+                order_by=(story.agree.desc(), story.id),
+            )
+            .label("rank"),
+        )
+        .join(address, address.id == story.address_id)
+        .subquery()
+    )
+    return (
+        sqlalchemy.select(ranked.c.id, ranked.c.agree, ranked.c.country)
+        .where(ranked.c.rank <= capacity + 1)
+        .order_by(ranked.c.country, ranked.c.rank)
+    )
+
+
+def _stories_statement(story_ids: Sequence[int]) -> sqlalchemy.Select:
+    story, address = models.ShameStory, models.Address
+    return (
+        sqlalchemy.select(story.id, story.agree, address.country)
+        .join(address, address.id == story.address_id)
+        .where(story.id.in_(story_ids))
+    )
+
+
+def load(db: Session) -> None:
+    top_stories.load(
+        db.execute(_global_statement(top_stories.capacity)).all(),
+        db.execute(_country_statement(top_stories.capacity)).all(),
+    )
+
+
+async def load_async(db: AsyncSession) -> None:
+    top_stories.load(
+        (await db.execute(_global_statement(top_stories.capacity))).all(),
+        (await db.execute(_country_statement(top_stories.capacity))).all(),
+    )
+
+
+def refresh(db: Session, story_ids: Iterable[int]) -> None:
+    """Offers the current agree of the stories, after a flush"""
+    if not top_stories.loaded:
+        return
+    for story_id, agree, country in db.execute(_stories_statement(sorted(story_ids))):
+        top_stories.offer(story_id, agree, country)
+
+
+async def refresh_async(db: AsyncSession, story_ids: Iterable[int]) -> None:
+    if not top_stories.loaded:
+        return
+    rows = await db.execute(_stories_statement(sorted(story_ids)))
+    for story_id, agree, country in rows:
+        top_stories.offer(story_id, agree, country)
+
+
+def _caught_up(story_ids: Sequence[int], rows: Iterable[Sequence]) -> None:
+    """Offers the re-read rows and removes the stories on a board they miss"""
+    found = set()
+    for story_id, agree, country in rows:
+        top_stories.offer(story_id, agree, country)
+        found.add(story_id)
+    # deleted by another worker since they were put on the board
+    for story_id in set(story_ids) - found:
+        top_stories.remove(story_id)
+
+
+def catch_up(db: Session) -> None:
+    """Offers the global top and the current agree of every story on a board"""
+    if not top_stories.loaded:
+        load(db)
+        return
+    story_ids = top_stories.story_ids()
+    _caught_up(
+        story_ids,
+        [
+            *db.execute(_global_statement(top_stories.capacity)),
+            *db.execute(_stories_statement(story_ids)),
+        ],
+    )
+
+
+async def catch_up_async(db: AsyncSession) -> None:
+    if not top_stories.loaded:
+        await load_async(db)
+        return
+    story_ids = top_stories.story_ids()
+    _caught_up(
+        story_ids,
+        [
+            *await db.execute(_global_statement(top_stories.capacity)),
+            *await db.execute(_stories_statement(story_ids)),
+        ],
+    )
+
+
+def top(
+    db: Session, limit: int, country: str | None = None
+) -> list[tuple[int, int]]:
+    """`(id, agree)` best first, loading the boards if they cannot answer"""
+    ranking = top_stories.top(limit, country)
+    if ranking is None:
+        load(db)
+        ranking = top_stories.top(limit, country) or []
+    return ranking
+
+
+async def top_async(
+    db: AsyncSession, limit: int, country: str | None = None
+) -> list[tuple[int, int]]:
+    ranking = top_stories.top(limit, country)
+    if ranking is None:
+        await load_async(db)
+        ranking = top_stories.top(limit, country) or []
+    return ranking
+
+
+def _load_once() -> None:
+    with SessionLocal() as db:
+        load(db)
+
+
+def _catch_up_once() -> None:
+    with SessionLocal() as db:
+        catch_up(db)
+
+
+async def reload() -> None:
+    if settings.ASYNC_DATABASE:
+        async with AsyncSessionLocal() as db:
+            await load_async(db)
+    else:
+        await run_in_threadpool(_load_once)
+
+
+async def catch_up_periodically(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if settings.ASYNC_DATABASE:
+                async with AsyncSessionLocal() as db:
+                    await catch_up_async(db)
+            else:
+                await run_in_threadpool(_catch_up_once)
+        except Exception:
+            logger.exception("Failed to catch up leaderboard, retrying next tick")
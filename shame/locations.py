@@ -0,0 +1,294 @@
+"""Story count and total `agree` per country, state and city
+
+`LocationStats` holds one row per location and level, so reading the stats of
+a level is an index scan instead of a `GROUP BY` over every story. The
+repository keeps it current inside each write's own transaction: adding or
+deleting a story and flushing agree deltas turn into one upsert of
+`stories = stories + :stories, agree = agree + :agree` over the three levels
+of every address involved, or an update and, where it matched no row, an
+insert per row on databases without `ON CONFLICT`. Story updates leave title
+and text only, which the stats do not depend on.
+
+`rebuild` recomputes the table from scratch, for a database the incremental
+path has not seen (`python -m shame.locations`).
+"""
+
+import argparse
+from collections import Counter
+from typing import Iterable, Literal, Mapping, Sequence, cast
+
+import sqlalchemy
+from sqlalchemy.engine import Connection, CursorResult
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import upsert_insert
+
+
+Level = Literal["country", "state", "city"]
+LEVELS: tuple[Level, ...] = ("country", "state", "city")
+
+Location = tuple[str, str, str]
+
+_stats = cast(sqlalchemy.Table, models.LocationStats.__table__)
+_stories = cast(sqlalchemy.Table, models.ShameStory.__table__)
+_addresses = cast(sqlalchemy.Table, models.Address.__table__)
+
+
+def _key(level: Level, location: Location) -> tuple[str, str, str, str]:
+    """`LocationStats` primary key, levels above the city leave the rest empty"""
+    depth = LEVELS.index(level) + 1
+    country, state, city = (*location[:depth], "", "")[:3]
+    return level, country, state, city
+
+
+def _rows(changes: Mapping[Location, tuple[int, int]]) -> list[dict]:
+    """`(stories, agree)` deltas per address location as rows of every level"""
+    totals: dict[tuple[str, str, str, str], list[int]] = {}
+    for location, (stories, agree) in changes.items():
+        for level in LEVELS:
+            total = totals.setdefault(_key(level, location), [0, 0])
+            total[0] += stories
+            total[1] += agree
+    return [
+        {
+            "level": level,
+            "country": country,
+            "state": state,
+            "city": city,
+            "stories": stories,
+            "agree": agree,
+        }
+        # a fixed order keeps concurrent writers from deadlocking
+        for (level, country, state, city), (stories, agree) in sorted(totals.items())
+        if stories or agree
+    ]
+
+
+def _upsert_statement(dialect: str) -> sqlalchemy.Insert | None:
+    """Adds the deltas of many rows in one statement, None without `ON CONFLICT`"""
+    statement = upsert_insert(dialect, _stats)
+    if statement is None:
+        return None
+    return statement.on_conflict_do_update(
+        index_elements=[
+            _stats.c.level,
+            _stats.c.country,
+            _stats.c.state,
+            _stats.c.city,
+        ],
+        set_={
+            "stories": _stats.c.stories + statement.excluded.stories,
+            "agree": _stats.c.agree + statement.excluded.agree,
+        },
+    )
+
+
+def _increment_statement(row: Mapping) -> sqlalchemy.Update:
+    """Adds the deltas of one row to its location, if that has a row already"""
+    return (
+        sqlalchemy.update(_stats)
+        .where(
+            _stats.c.level == row["level"],
+            _stats.c.country == row["country"],
+            _stats.c.state == row["state"],
+            _stats.c.city == row["city"],
+        )
+        .values(
+            stories=_stats.c.stories + row["stories"],
+            agree=_stats.c.agree + row["agree"],
+        )
+    )
+
+
+def _address_locations(address_ids: list[int]) -> sqlalchemy.Select:
+    return sqlalchemy.select(
+        _addresses.c.id, _addresses.c.country, _addresses.c.state, _addresses.c.city
+    ).where(_addresses.c.id.in_(address_ids))
+
+
+def _story_locations(story_ids: list[int]) -> sqlalchemy.Select:
+    return (
+        sqlalchemy.select(
+            _stories.c.id, _addresses.c.country, _addresses.c.state, _addresses.c.city
+        )
+        .join(_addresses, _addresses.c.id == _stories.c.address_id)
+        .where(_stories.c.id.in_(story_ids))
+    )
+
+
+def _changes(
+    rows: sqlalchemy.Result, deltas: Mapping[int, tuple[int, int]]
+) -> dict[Location, tuple[int, int]]:
+    """Deltas keyed by address or story id, summed up per location"""
+    changes: dict[Location, tuple[int, int]] = {}
+    for id, country, state, city in rows:
+        stories, agree = changes.get((country, state, city), (0, 0))
+        changes[(country, state, city)] = (
+            stories + deltas[id][0],
+            agree + deltas[id][1],
+        )
+    return changes
+
+
+def _apply(db: Session, changes: Mapping[Location, tuple[int, int]]) -> None:
+    rows = _rows(changes)
+    if not rows:
+        return
+    upsert = _upsert_statement(db.get_bind().dialect.name)
+    if upsert is not None:
+        db.execute(upsert, rows)
+        return
+    # no `ON CONFLICT`: update, then insert the locations that had no row
+    for row in rows:
+        result = cast(CursorResult, db.execute(_increment_statement(row)))
+        if result.rowcount == 0:
+            db.execute(sqlalchemy.insert(_stats).values(row))
+
+
+async def _apply_async(
+    db: AsyncSession, changes: Mapping[Location, tuple[int, int]]
+) -> None:
+    rows = _rows(changes)
+    if not rows:
+        return
+    upsert = _upsert_statement(db.get_bind().dialect.name)
+    if upsert is not None:
+        await db.execute(upsert, rows)
+        return
+    for row in rows:
+        result = cast(CursorResult, await db.execute(_increment_statement(row)))
+        if result.rowcount == 0:
+            await db.execute(sqlalchemy.insert(_stats).values(row))
+
+
+def addresses_changed(db: Session, deltas: Mapping[int, tuple[int, int]]) -> None:
+    """Adds `(stories, agree)` deltas keyed by address id, without commit"""
+    if not deltas:
+        return
+    rows = db.execute(_address_locations(sorted(deltas)))
+    _apply(db, _changes(rows, deltas))
+
+
+async def addresses_changed_async(
+    db: AsyncSession, deltas: Mapping[int, tuple[int, int]]
+) -> None:
+    if not deltas:
+        return
+    rows = await db.execute(_address_locations(sorted(deltas)))
+    await _apply_async(db, _changes(rows, deltas))
+
+
+def address_changed(db: Session, address_id: int, stories: int, agree: int) -> None:
+    """Adds to the stats of an address, without commit"""
+    addresses_changed(db, {address_id: (stories, agree)})
+
+
+async def address_changed_async(
+    db: AsyncSession, address_id: int, stories: int, agree: int
+) -> None:
+    await addresses_changed_async(db, {address_id: (stories, agree)})
+
+
+def _added(shamestories: Iterable[Mapping]) -> dict[int, tuple[int, int]]:
+    """Story count per address of new rows, which start at zero `agree`"""
+    counts = Counter(row["address_id"] for row in shamestories)
+    return {address_id: (count, 0) for address_id, count in counts.items()}
+
+
+def stories_added(db: Session, shamestories: Iterable[Mapping]) -> None:
+    """Counts the rows of a bulk insert, without commit"""
+    addresses_changed(db, _added(shamestories))
+
+
+async def stories_added_async(
+    db: AsyncSession, shamestories: Iterable[Mapping]
+) -> None:
+    await addresses_changed_async(db, _added(shamestories))
+
+
+def agree_changed(db: Session, deltas: Mapping[int, int]) -> None:
+    """Adds agree deltas keyed by story id, without commit"""
+    if not deltas:
+        return
+    story_deltas = {story_id: (0, delta) for story_id, delta in deltas.items()}
+    rows = db.execute(_story_locations(sorted(deltas)))
+    _apply(db, _changes(rows, story_deltas))
+
+
+async def agree_changed_async(db: AsyncSession, deltas: Mapping[int, int]) -> None:
+    if not deltas:
+        return
+    story_deltas = {story_id: (0, delta) for story_id, delta in deltas.items()}
+    rows = await db.execute(_story_locations(sorted(deltas)))
+    await _apply_async(db, _changes(rows, story_deltas))
+
+
+def rebuild(connection: Connection) -> None:
+    """Recomputes every row from `ShameStories` joined to `Addresses`"""
+    connection.execute(sqlalchemy.delete(_stats))
+    for depth, level in enumerate(LEVELS, start=1):
+        columns = [_addresses.c.country, _addresses.c.state, _addresses.c.city][:depth]
+        padding = [sqlalchemy.literal("")] * (len(LEVELS) - depth)
+        connection.execute(
+            sqlalchemy.insert(_stats).from_select(
+                ["level", "country", "state", "city", "stories", "agree"],
+                sqlalchemy.select(
+                    sqlalchemy.literal(level),
+                    *columns,
+                    *padding,
+                    sqlalchemy.func.count(),
+                    sqlalchemy.func.coalesce(
+                        sqlalchemy.func.sum(_stories.c.agree), 0
+                    ),
+                )
+                .join(_addresses, _addresses.c.id == _stories.c.address_id)
+                .group_by(*columns),
+            )
+        )
+
+
+def _get_statement(level: Level, skip: int, limit: int) -> sqlalchemy.Select:
+    return (
+        sqlalchemy.select(models.LocationStats)
+        .where(models.LocationStats.level == level, models.LocationStats.stories > 0)
+        .order_by(
+            models.LocationStats.agree.desc(),
+            models.LocationStats.stories.desc(),
+            models.LocationStats.country,
+            models.LocationStats.state,
+            models.LocationStats.city,
+        )
+        .offset(skip)
+        .limit(limit)
+    )
+
+
+def get(
+    db: Session, level: Level, skip: int = 0, limit: int = 50
+) -> Sequence[models.LocationStats]:
+    return db.scalars(_get_statement(level, skip, limit)).all()
+
+
+async def get_async(
+    db: AsyncSession, level: Level, skip: int = 0, limit: int = 50
+) -> Sequence[models.LocationStats]:
+    return (await db.scalars(_get_statement(level, skip, limit))).all()
+
+
+def main(argv: list[str] | None = None) -> None:
+    from .database import engine
+
+    parser = argparse.ArgumentParser(description="Rebuild the location stats")
+    parser.parse_args(argv)
+    with engine.begin() as connection:
+        rebuild(connection)
+        count = connection.scalar(
+            sqlalchemy.select(sqlalchemy.func.count()).select_from(_stats)
+        )
+    print(f"Rebuilt {count} location stats rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""Schema bootstrap of a worker
+
+`Base.metadata` plus the names of the `MIGRATIONS` steps hash into a
+fingerprint kept in the one-row `SchemaVersion` table. A booting worker reads
+that row and, when it matches, issues no DDL at all. Otherwise it runs every
+step in order and stores the new fingerprint, all in one transaction (behind
+an advisory lock on Postgres, so workers booting together migrate once).
+
+Steps only ever add what is missing, so running them against any earlier
+state of the schema, or twice, is safe. Nothing here drops data. The few
+that rewrite data, named in `RUN_ONCE`, are recorded in `SchemaSteps` and
+skipped by every later bootstrap of the same database.
+"""
+
+import hashlib
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Sequence, cast
+
+import sqlalchemy
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.schema import CreateColumn
+
+from . import locations, models, ratings, search
+from .auth import models as auth_models  # noqa: F401, registers `Users`
+from .database import Base
+
+
+logger = logging.getLogger(__name__)
+
+# any constant, shared by every worker migrating the same database
+ADVISORY_LOCK_KEY = 7_346_153
+
+_version_metadata = MetaData()
+schema_version = Table(
+    "SchemaVersion",
+    _version_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("fingerprint", String(64), nullable=False),
+    Column("updated_at", DateTime(timezone=True), nullable=False),
+)
+schema_steps = Table(
+    "SchemaSteps",
+    _version_metadata,
+    Column("name", String(64), primary_key=True),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+
+def _create_tables(connection: Connection) -> None:
+    Base.metadata.create_all(connection)
+
+
+def _add_missing_columns(connection: Connection) -> None:
+    """`ALTER TABLE ... ADD COLUMN` for model columns an older schema lacks"""
+    inspector = sqlalchemy.inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable and column.server_default is None:
+                raise RuntimeError(
+                    f"Cannot add NOT NULL column without a server default"
+                    f" :column={table.name}.{column.name}"
+                )
+            ddl = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.execute(
+                sqlalchemy.text(f'ALTER TABLE "{table.name}" ADD COLUMN {ddl}')
+            )
+
+
+def _create_indexes(connection: Connection) -> None:
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def _merge_duplicate_addresses(connection: Connection) -> None:
+    """Addresses equal up to whitespace become the one with the lowest id
+
+    Stories of the others are moved onto it before they are deleted, and
+    `LocationStats`, keyed by the names, is rebuilt when any name changed.
+    """
+    addresses = cast(Table, models.Address.__table__)
+    stories = cast(Table, models.ShameStory.__table__)
+    columns = ("country", "state", "city", "street")
+    keep: dict[tuple[str, ...], int] = {}
+    renamed: dict[int, tuple[str, ...]] = {}
+    merged: dict[int, list[int]] = {}
+    for row in connection.execute(
+        sqlalchemy.select(addresses.c.id, *(addresses.c[name] for name in columns))
+        .order_by(addresses.c.id)
+    ):
+        location = tuple(" ".join((value or "").split()) for value in row[1:])
+        if location not in keep:
+            keep[location] = row.id
+            if location != tuple(row[1:]):
+                renamed[row.id] = location
+        else:
+            merged.setdefault(keep[location], []).append(row.id)
+    if not renamed and not merged:
+        return
+
+    for address_id, duplicates in merged.items():
+        connection.execute(
+            sqlalchemy.update(stories)
+            .where(stories.c.address_id.in_(duplicates))
+            .values(address_id=address_id)
+        )
+        connection.execute(
+            sqlalchemy.delete(addresses).where(addresses.c.id.in_(duplicates))
+        )
+    for address_id, location in renamed.items():
+        connection.execute(
+            sqlalchemy.update(addresses)
+            .where(addresses.c.id == address_id)
+            .values(dict(zip(columns, location)))
+        )
+    logger.info(
+        "Merged %d duplicate addresses, renamed %d",
+        sum(map(len, merged.values())),
+        len(renamed),
+    )
+    locations.rebuild(connection)
+
+
+def _addresses_unique_location(connection: Connection) -> None:
+    """Tables created before `uq_Addresses_location` get it as a unique index
+
+    Duplicates an older schema let in are merged first, or the index would
+    not build.
+    """
+    inspector = sqlalchemy.inspect(connection)
+    names = {
+        constraint["name"]
+        for constraint in inspector.get_unique_constraints(models.Address.__tablename__)
+    } | {index["name"] for index in inspector.get_indexes(models.Address.__tablename__)}
+    if "uq_Addresses_location" not in names:
+        _merge_duplicate_addresses(connection)
+        connection.execute(
+            sqlalchemy.text(
+                'CREATE UNIQUE INDEX "uq_Addresses_location"'
+                ' ON "Addresses" (country, state, city, street)'
+            )
+        )
+
+
+def _search_index(connection: Connection) -> None:
+    search.create_index(connection)
+    search.backfill(connection)
+
+
+def _location_stats(connection: Connection) -> None:
+    """Fills `LocationStats` once, the repository keeps it current from then on"""
+    filled = connection.scalar(sqlalchemy.select(models.LocationStats.level).limit(1))
+    if filled is None:
+        locations.rebuild(connection)
+
+
+def _user_ratings(connection: Connection) -> None:
+    """Ratings stored before `shame.ratings` kept them are recomputed, once"""
+    ratings.reconcile(connection)
+
+
+Migration = Callable[[Connection], None]
+
+# append only: a new step changes the fingerprint and runs on the next boot
+MIGRATIONS: Sequence[tuple[str, Migration]] = (
+    ("create_tables", _create_tables),
+    ("add_missing_columns", _add_missing_columns),
+    ("create_indexes", _create_indexes),
+    ("addresses_unique_location", _addresses_unique_location),
+    ("search_index", _search_index),
+    ("location_stats", _location_stats),
+    ("user_ratings", _user_ratings),
+)
+# steps that scan whole tables, run on the first bootstrap of a database only
+RUN_ONCE = frozenset({"user_ratings"})
+
+
+def fingerprint(
+    metadata: MetaData = Base.metadata,
+    migrations: Sequence[tuple[str, Migration]] = MIGRATIONS,
+) -> str:
+    digest = hashlib.sha256()
+    for table in sorted(metadata.tables.values(), key=lambda table: table.name):
+        digest.update(f"table {table.name}\n".encode())
+        for column in table.columns:
+            digest.update(
+                f"column {column.name} {column.type} nullable={column.nullable}"
+                f" primary_key={column.primary_key}"
+                f" foreign_keys={sorted(fk.target_fullname for fk in column.foreign_keys)}"
+                f" server_default={column.server_default is not None}\n".encode()
+            )
+        for index in sorted(table.indexes, key=lambda index: str(index.name)):
+            digest.update(
+                f"index {index.name} {[column.name for column in index.columns]}"
+                f" unique={index.unique}\n".encode()
+            )
+        for constraint in sorted(
+            (c for c in table.constraints if isinstance(c, sqlalchemy.UniqueConstraint)),
+            key=lambda constraint: str(constraint.name),
+        ):
+            digest.update(
+                f"unique {constraint.name}"
+                f" {[column.name for column in constraint.columns]}\n".encode()
+            )
+    for name, _ in migrations:
+        digest.update(f"migration {name}\n".encode())
+    return digest.hexdigest()
+
+
+def _current_fingerprint(connection: Connection) -> str | None:
+    if not connection.dialect.has_table(connection, schema_version.name):
+        return None
+    return connection.scalar(
+        sqlalchemy.select(schema_version.c.fingerprint).where(schema_version.c.id == 1)
+    )
+
+
+_default_fingerprint: str | None = None
+
+
+def bootstrap_connection(
+    connection: Connection,
+    metadata: MetaData | None = None,
+    migrations: Sequence[tuple[str, Migration]] | None = None,
+) -> bool:
+    """Brings the schema up to date inside the caller's transaction
+
+    Returns whether any migration ran.
+    """
+    global _default_fingerprint
+    if metadata is None and migrations is None:
+        # the models cannot change under a running process
+        if _default_fingerprint is None:
+            _default_fingerprint = fingerprint()
+        target = _default_fingerprint
+    else:
+        target = fingerprint(metadata or Base.metadata, migrations or MIGRATIONS)
+
+    # the common case, an up-to-date schema, takes no lock
+    if _current_fingerprint(connection) == target:
+        return False
+
+    if connection.dialect.name == "postgresql":
+        connection.execute(
+            sqlalchemy.select(sqlalchemy.func.pg_advisory_xact_lock(ADVISORY_LOCK_KEY))
+        )
+    _version_metadata.create_all(connection, checkfirst=True)
+    # another worker may have migrated while this one waited for the lock
+    current = _current_fingerprint(connection)
+    if current == target:
+        return False
+
+    now = datetime.now(timezone.utc)
+    applied = set(connection.scalars(sqlalchemy.select(schema_steps.c.name)))
+    for name, migration in migrations or MIGRATIONS:
+        if name in RUN_ONCE and name in applied:
+            continue
+        logger.info("Applying schema migration %s", name)
+        migration(connection)
+        if name in RUN_ONCE:
+            connection.execute(
+                sqlalchemy.insert(schema_steps).values(name=name, applied_at=now)
+            )
+
+    values = {"fingerprint": target, "updated_at": now}
+    if current is None:
+        connection.execute(sqlalchemy.insert(schema_version).values(id=1, **values))
+    else:
+        connection.execute(
+            sqlalchemy.update(schema_version)
+            .where(schema_version.c.id == 1)
+            .values(**values)
+        )
+    return True
+
+
+@dataclass(frozen=True, slots=True)
+class Bootstrap:
+    migrated: bool
+    seconds: float
+
+
+last_bootstrap: Bootstrap | None = None
+
+
+def _finish(migrated: bool, started: float) -> Bootstrap:
+    global last_bootstrap
+    last_bootstrap = Bootstrap(migrated=migrated, seconds=time.perf_counter() - started)
+    logger.info(
+        "Schema bootstrap took %.3fs (%s)",
+        last_bootstrap.seconds,
+        "migrated" if migrated else "up to date",
+    )
+    return last_bootstrap
+
+
+def bootstrap(engine: Engine) -> Bootstrap:
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        migrated = bootstrap_connection(connection)
+    return _finish(migrated, started)
+
+
+async def bootstrap_async(engine: AsyncEngine) -> Bootstrap:
+    started = time.perf_counter()
+    async with engine.begin() as connection:
+        migrated = await connection.run_sync(bootstrap_connection)
+    return _finish(migrated, started)
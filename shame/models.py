@@ -1,6 +1,6 @@
 from typing import List, TYPE_CHECKING
 
-from sqlalchemy import ForeignKey, Integer, String
+from sqlalchemy import ForeignKey, Index, Integer, String, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .database import Base
@@ -24,6 +24,12 @@ class Address(Base):
         back_populates="address",
     )
 
+    __table_args__ = (
+        UniqueConstraint(
+            "country", "state", "city", "street", name="uq_Addresses_location"
+        ),
+    )
+
     def __repr__(self) -> str:
         return (
             f"Address(id={self.id!r}"
@@ -43,6 +49,8 @@ class ShameStory(Base):
     title: Mapped[str] = mapped_column(String(50))
     text: Mapped[str]
     agree: Mapped[int] = mapped_column(default=0)
+    # bumped by every edit, see `shame.versioning`
+    version: Mapped[int] = mapped_column(default=1, server_default="1")
 
     address_id: Mapped[int] = mapped_column(ForeignKey("Addresses.id"))
     address: Mapped["Address"] = relationship(
@@ -55,6 +63,13 @@ class ShameStory(Base):
         "User", back_populates="stories", foreign_keys=author_id
     )
 
+    __table_args__ = (
+        # keyset pagination walks stories in `(agree, id)` order
+        Index("ix_ShameStories_agree_id", "agree", "id"),
+        Index("ix_ShameStories_address_id_agree_id", "address_id", "agree", "id"),
+        Index("ix_ShameStories_author_id_agree_id", "author_id", "agree", "id"),
+    )
+
     def __repr__(self) -> str:
         return (
             f"ShameStory(id={self.id!r}"
@@ -62,3 +77,23 @@ class ShameStory(Base):
             f", author={self.author!r}"
             f", address={self.address!r})"
         )
+
+
+class LocationStats(Base):
+    """Story count and total `agree` of a location, kept by `shame.locations`
+
+    One row per level: `state` and `city` are empty above their own level.
+    """
+
+    __tablename__ = "LocationStats"
+
+    level: Mapped[str] = mapped_column(String(8), primary_key=True)
+    country: Mapped[str] = mapped_column(primary_key=True)
+    state: Mapped[str] = mapped_column(primary_key=True)
+    city: Mapped[str] = mapped_column(primary_key=True)
+    stories: Mapped[int] = mapped_column(default=0)
+    agree: Mapped[int] = mapped_column(default=0)
+
+    __table_args__ = (
+        Index("ix_LocationStats_level_agree", "level", "agree"),
+    )
@@ -0,0 +1,68 @@
+import base64
+import binascii
+import json
+from typing import Any, NamedTuple, Sequence
+
+import sqlalchemy
+
+from . import models
+
+
+class Cursor(NamedTuple):
+    """Position of the last seen story in the `(agree, id)` feed order"""
+
+    agree: int
+    id: int
+
+
+class SearchCursor(NamedTuple):
+    """Position of the last seen search hit in `(score, id)` order"""
+
+    score: float
+    id: int
+
+
+def _encode(values: Sequence[Any]) -> str:
+    raw = json.dumps(list(values), separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode(token: str, *types: type | tuple[type, ...]) -> list[Any]:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise TypeError
+        for value, expected in zip(values, types):
+            # bool is an int subclass, but never a valid position
+            if isinstance(value, bool) or not isinstance(value, expected):
+                raise TypeError
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise ValueError(f"Invalid pagination cursor :cursor={token}")
+    return values
+
+
+# ORM stories, or the rows of a `?fields=` projection; both carry `agree` and
+# `id` (a Protocol would not do: mypy does not match `Mapped[int]` to `int`)
+Positioned = models.ShameStory | sqlalchemy.Row
+
+
+def encode_cursor(cursor: Cursor | SearchCursor) -> str:
+    return _encode(cursor)
+
+
+def decode_cursor(token: str) -> Cursor:
+    agree, id = _decode(token, int, int)
+    return Cursor(agree=agree, id=id)
+
+
+def decode_search_cursor(token: str) -> SearchCursor:
+    score, id = _decode(token, (int, float), int)
+    return SearchCursor(score=float(score), id=id)
+
+
+def next_cursor(items: Sequence[Positioned], limit: int) -> str | None:
+    if limit <= 0 or len(items) < limit:
+        return None
+    last = items[-1]
+    return encode_cursor(Cursor(agree=last.agree, id=last.id))
@@ -0,0 +1,137 @@
+"""Connection pool instrumentation
+
+`listen` hooks the public pool `checkout`/`checkin` events to keep the
+currently checked out connections. A connection held for long is a leaked
+session; with `trace_checkouts` on (off by default, it walks the stack on
+every checkout) each one also keeps the stack that took it, which says whose.
+
+Pool events have no hook before a checkout, so `PoolMonitor.pool_class`
+subclasses a pool class to time its public `connect`: how long a checkout
+waited for a connection, and how many gave up with `TimeoutError`.
+"""
+
+import os
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import Pool
+
+
+@dataclass(slots=True)
+class Checkout:
+    started: float
+    stack: traceback.StackSummary | None
+
+
+class PoolMonitor:
+    def __init__(self, trace_checkouts: bool = False, stack_limit: int = 32):
+        self.trace_checkouts = trace_checkouts
+        self.stack_limit = stack_limit
+        self.engine: Engine | None = None
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+        self.checkouts = 0
+        self._checked_out: dict[int, Checkout] = {}
+        self._lock = threading.Lock()
+
+    def pool_class(self, base: type[Pool]) -> type[Pool]:
+        """Subclass of `base` timing every wait for a connection
+
+        The monitor lives on the class, so it survives `Pool.recreate`.
+        """
+        monitor = self
+
+        class InstrumentedPool(base):  # type: ignore[valid-type, misc]
+            def connect(self) -> Any:
+                started = time.perf_counter()
+                try:
+                    return super().connect()
+                except TimeoutError:
+                    with monitor._lock:
+                        monitor.timeouts += 1
+                    raise
+                finally:
+                    monitor._record_wait(time.perf_counter() - started)
+
+        InstrumentedPool.__name__ = f"Instrumented{base.__name__}"
+        InstrumentedPool.__qualname__ = InstrumentedPool.__name__
+        return InstrumentedPool
+
+    def listen(self, engine: Engine) -> None:
+        self.engine = engine
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+
+    def _record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.waits += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def _on_checkout(self, dbapi_connection: Any, record: Any, proxy: Any) -> None:
+        stack = self._caller_stack() if self.trace_checkouts else None
+        with self._lock:
+            self.checkouts += 1
+            self._checked_out[id(record)] = Checkout(time.monotonic(), stack)
+
+    def _caller_stack(self) -> traceback.StackSummary:
+        """Innermost frames outside SQLAlchemy and this module"""
+        frames = traceback.StackSummary.extract(
+            traceback.walk_stack(None), lookup_lines=False
+        )
+        return traceback.StackSummary.from_list(
+            [
+                frame
+                for frame in frames
+                if frame.filename != __file__
+                and f"{os.sep}sqlalchemy{os.sep}" not in frame.filename
+            ][: self.stack_limit]
+        )
+
+    def _on_checkin(self, dbapi_connection: Any, record: Any) -> None:
+        with self._lock:
+            self._checked_out.pop(id(record), None)
+
+    def checked_out(self, older_than: float = 0.0) -> list[dict[str, Any]]:
+        """Connections held for at least `older_than` seconds, longest first"""
+        now = time.monotonic()
+        with self._lock:
+            held = [
+                checkout
+                for checkout in self._checked_out.values()
+                if now - checkout.started >= older_than
+            ]
+        return [
+            {
+                "seconds": now - checkout.started,
+                "stack": (
+                    [] if checkout.stack is None else checkout.stack.format()[::-1]
+                ),
+            }
+            for checkout in sorted(held, key=lambda checkout: checkout.started)
+        ]
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            stats: dict[str, Any] = {
+                "checkouts": self.checkouts,
+                "checked_out": len(self._checked_out),
+                "waits": self.waits,
+                "mean_wait_seconds": self.wait_seconds / self.waits if self.waits else 0.0,
+                "max_wait_seconds": self.max_wait_seconds,
+                "timeouts": self.timeouts,
+            }
+        pool = self.engine.pool if self.engine is not None else None
+        for name in ("size", "checkedin", "overflow"):
+            # only `QueuePool`s size themselves
+            if pool is not None and hasattr(pool, name):
+                stats[name] = getattr(pool, name)()
+        return stats
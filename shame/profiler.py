@@ -0,0 +1,155 @@
+"""Per-request SQL profiling and the slow-query log
+
+Cursor events of every engine time each statement. Inside a request the
+`SQLProfilerMiddleware` keeps a `RequestProfile` in a contextvar, so the
+statements add up to a query count, total DB time and the slowest ones, which
+go out in a `Server-Timing` header. A statement repeated `SQL_REPEAT_THRESHOLD`
+times in one request is logged as a likely N+1. Independently of requests, a
+statement slower than `SLOW_QUERY_THRESHOLD_MS` goes to the `shame.sql.slow`
+logger as one JSON object.
+"""
+
+import heapq
+import json
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config.settings import settings
+
+
+slow_query_logger = logging.getLogger("shame.sql.slow")
+logger = logging.getLogger(__name__)
+
+SLOWEST_KEPT = 3
+
+
+@dataclass(slots=True)
+class RequestProfile:
+    queries: int = 0
+    seconds: float = 0.0
+    statements: Counter[str] = field(default_factory=Counter)
+    # min-heap of `(seconds, statement)`, the slowest `SLOWEST_KEPT` survive
+    slowest: list[tuple[float, str]] = field(default_factory=list)
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.queries += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+        if len(self.slowest) < SLOWEST_KEPT:
+            heapq.heappush(self.slowest, (seconds, statement))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, statement))
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """Statements run at least `threshold` times, the usual N+1 signature"""
+        return [
+            (statement, count)
+            for statement, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+    def server_timing(self) -> str:
+        metrics = [f'db;dur={self.seconds * 1000:.2f};desc="{self.queries} queries"']
+        for rank, (seconds, statement) in enumerate(
+            sorted(self.slowest, reverse=True), start=1
+        ):
+            metrics.append(
+                f'sql-{rank};dur={seconds * 1000:.2f};desc="{_describe(statement)}"'
+            )
+        return ", ".join(metrics)
+
+
+_profile: ContextVar[RequestProfile | None] = ContextVar("sql_profile", default=None)
+
+
+def current_profile() -> RequestProfile | None:
+    return _profile.get()
+
+
+def _describe(statement: str, width: int = 60) -> str:
+    """One line, quote free and short enough for a header"""
+    line = " ".join(statement.replace('"', "").replace("\\", "").split())
+    return line if len(line) <= width else line[: width - 3] + "..."
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["query_started"].pop()
+
+    profile = _profile.get()
+    if profile is not None:
+        profile.record(statement, seconds)
+
+    threshold = settings.SLOW_QUERY_THRESHOLD_MS
+    if threshold > 0 and seconds * 1000 >= threshold:
+        slow_query_logger.warning(
+            json.dumps(
+                {
+                    "event": "slow_query",
+                    "ms": round(seconds * 1000, 3),
+                    "statement": statement,
+                    "executemany": executemany,
+                    "database": conn.engine.url.database,
+                }
+            )
+        )
+
+
+def install() -> None:
+    """Times statements on every engine, current and future"""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class SQLProfilerMiddleware:
+    """Profiles the SQL of each HTTP request into a `Server-Timing` header"""
+
+    def __init__(self, app: ASGIApp, repeat_threshold: int):
+        self.app = app
+        self.repeat_threshold = repeat_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile()
+        token = _profile.set(profile)
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", profile.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _profile.reset(token)
+            self._report(scope, profile)
+
+    def _report(self, scope: Scope, profile: RequestProfile) -> None:
+        for statement, count in profile.repeated(self.repeat_threshold):
+            logger.warning(
+                json.dumps(
+                    {
+                        "event": "likely_n_plus_one",
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "count": count,
+                        "statement": statement,
+                    }
+                )
+            )
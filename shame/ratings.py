@@ -0,0 +1,148 @@
+"""`User.rating`, the total `agree` of the user's stories
+
+The repository keeps it current inside each write's own transaction: a flush
+of agree deltas adds them to the authors of the stories, one executemany over
+the authors in id order, and deleting a story takes its agree away from the
+author. New stories start at zero and change nothing.
+
+`reconcile` recomputes ratings from `ShameStories` in batches of users and
+fixes those that drifted (`python -m shame.ratings`).
+"""
+
+import argparse
+from typing import Mapping, cast
+
+import sqlalchemy
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import models
+from .auth import models as auth_models
+
+
+RECONCILE_BATCH = 10_000
+
+_users = cast(sqlalchemy.Table, auth_models.User.__table__)
+_stories = cast(sqlalchemy.Table, models.ShameStory.__table__)
+
+
+def _ratings_statement(
+    deltas: Mapping[int, int],
+) -> tuple[sqlalchemy.Update, list[dict[str, int]]]:
+    statement = (
+        sqlalchemy.update(_users)
+        .where(_users.c.id == sqlalchemy.bindparam("author_id"))
+        .values(rating=_users.c.rating + sqlalchemy.bindparam("delta"))
+    )
+    parameters = [
+        {"author_id": author_id, "delta": delta}
+        for author_id, delta in sorted(deltas.items())
+        if delta
+    ]
+    return statement, parameters
+
+
+def _story_authors(story_ids: list[int]) -> sqlalchemy.Select:
+    return sqlalchemy.select(_stories.c.id, _stories.c.author_id).where(
+        _stories.c.id.in_(story_ids)
+    )
+
+
+def _author_deltas(
+    rows: sqlalchemy.Result, deltas: Mapping[int, int]
+) -> dict[int, int]:
+    authors: dict[int, int] = {}
+    for story_id, author_id in rows:
+        authors[author_id] = authors.get(author_id, 0) + deltas[story_id]
+    return authors
+
+
+def author_changed(db: Session, deltas: Mapping[int, int]) -> None:
+    """Adds rating deltas keyed by user id, without commit"""
+    statement, parameters = _ratings_statement(deltas)
+    if parameters:
+        db.execute(statement, parameters)
+
+
+async def author_changed_async(db: AsyncSession, deltas: Mapping[int, int]) -> None:
+    statement, parameters = _ratings_statement(deltas)
+    if parameters:
+        await db.execute(statement, parameters)
+
+
+def agree_changed(db: Session, deltas: Mapping[int, int]) -> None:
+    """Adds agree deltas keyed by story id to their authors, without commit"""
+    if not deltas:
+        return
+    rows = db.execute(_story_authors(sorted(deltas)))
+    author_changed(db, _author_deltas(rows, deltas))
+
+
+async def agree_changed_async(db: AsyncSession, deltas: Mapping[int, int]) -> None:
+    if not deltas:
+        return
+    rows = await db.execute(_story_authors(sorted(deltas)))
+    await author_changed_async(db, _author_deltas(rows, deltas))
+
+
+def _total() -> sqlalchemy.ScalarSelect:
+    return (
+        sqlalchemy.select(
+            sqlalchemy.func.coalesce(sqlalchemy.func.sum(_stories.c.agree), 0)
+        )
+        .where(_stories.c.author_id == _users.c.id)
+        .scalar_subquery()
+    )
+
+
+def _batches(connection: Connection, batch_size: int) -> list[tuple[int, int]]:
+    """`[start, stop)` ranges of user ids"""
+    first, last = connection.execute(
+        sqlalchemy.select(
+            sqlalchemy.func.min(_users.c.id), sqlalchemy.func.max(_users.c.id)
+        )
+    ).one()
+    if first is None:
+        return []
+    return [(start, start + batch_size) for start in range(first, last + 1, batch_size)]
+
+
+def reconcile_batch(connection: Connection, start: int, stop: int) -> int:
+    """Recomputes ratings of users in `[start, stop)`, returns how many drifted"""
+    total = _total()
+    result = connection.execute(
+        sqlalchemy.update(_users)
+        .where(_users.c.id >= start, _users.c.id < stop, _users.c.rating != total)
+        .values(rating=total)
+    )
+    return result.rowcount
+
+
+def reconcile(connection: Connection, batch_size: int = RECONCILE_BATCH) -> int:
+    """Recomputes every rating inside the caller's transaction"""
+    return sum(
+        reconcile_batch(connection, start, stop)
+        for start, stop in _batches(connection, batch_size)
+    )
+
+
+def main(argv: list[str] | None = None) -> None:
+    from .database import engine
+
+    parser = argparse.ArgumentParser(description="Reconcile user ratings")
+    parser.add_argument("--batch-size", type=int, default=RECONCILE_BATCH)
+    args = parser.parse_args(argv)
+
+    with engine.connect() as connection:
+        batches = _batches(connection, args.batch_size)
+    fixed = 0
+    for start, stop in batches:
+        # one short transaction per batch, never a lock on every user at once
+        with engine.begin() as connection:
+            fixed += reconcile_batch(connection, start, stop)
+    print(f"Fixed the rating of {fixed} users")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Routing of read-only requests to read replicas
+
+`ReplicaSet.engine_for` hands out the primary engine or, for a read, the next
+healthy replica in round-robin order, with no IO of its own. Health is kept
+by `check_periodically`, a background task probing every replica (`SELECT 1`)
+each interval: a replica that fails is skipped until a later probe passes,
+and with no healthy replica left reads fall back to the primary.
+
+A client that has just written reads from the primary for `sticky_seconds`,
+so it sees its own writes however far the replicas lag. Clients are told
+apart by a hash of their bearer token, or by address when they send none.
+The window is kept per process: it holds as long as the load balancer keeps
+a client on one worker, or the window is shorter than the replication lag
+that matters.
+"""
+
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from starlette.concurrency import run_in_threadpool
+
+
+logger = logging.getLogger(__name__)
+
+# requests that change nothing, served by a replica
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+# sticky clients kept before expired windows are swept
+_STICKY_SWEEP_SIZE = 4096
+
+
+@dataclass(slots=True)
+class _Replica:
+    engine: Engine
+    # until its first probe passes
+    healthy: bool = False
+    reads: int = 0
+    failures: int = 0
+
+
+class ReplicaSet:
+    def __init__(
+        self,
+        primary: Engine,
+        replicas: Sequence[Engine] = (),
+        sticky_seconds: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.primary = primary
+        self.sticky_seconds = sticky_seconds
+        self._clock = clock
+        self._replicas = [_Replica(engine) for engine in replicas]
+        self._next = itertools.count()
+        self._sticky: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._primary_reads = 0
+        self._sticky_reads = 0
+
+    def __bool__(self) -> bool:
+        return bool(self._replicas)
+
+    def wrote(self, client: str) -> None:
+        """Keeps `client` on the primary for the stickiness window"""
+        if not self._replicas or self.sticky_seconds <= 0:
+            return
+        now = self._clock()
+        with self._lock:
+            if len(self._sticky) >= _STICKY_SWEEP_SIZE:
+                self._sticky = {
+                    key: until for key, until in self._sticky.items() if until > now
+                }
+            self._sticky[client] = now + self.sticky_seconds
+
+    def is_sticky(self, client: str) -> bool:
+        until = self._sticky.get(client)
+        return until is not None and until > self._clock()
+
+    def engine_for(self, read_only: bool, client: str | None = None) -> Engine:
+        if not read_only or not self._replicas:
+            return self.primary
+        if client is not None and self.is_sticky(client):
+            self._sticky_reads += 1
+            return self.primary
+
+        start = next(self._next)
+        for offset in range(len(self._replicas)):
+            replica = self._replicas[(start + offset) % len(self._replicas)]
+            if replica.healthy:
+                replica.reads += 1
+                return replica.engine
+        self._primary_reads += 1
+        return self.primary
+
+    def check(self) -> None:
+        """Probes every replica, blocking; `check_periodically` runs it"""
+        for replica in self._replicas:
+            self._check(replica)
+
+    def _check(self, replica: _Replica) -> None:
+        try:
+            with replica.engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+        except Exception:
+            # once per outage, and for a replica down from the start
+            if replica.healthy or not replica.failures:
+                logger.warning(
+                    "Read replica failed its health check :url=%s",
+                    replica.engine.url.render_as_string(hide_password=True),
+                    exc_info=True,
+                )
+            replica.healthy = False
+            replica.failures += 1
+        else:
+            replica.healthy = True
+
+    def dispose(self) -> None:
+        for replica in self._replicas:
+            replica.engine.dispose()
+
+    def stats(self) -> dict:
+        return {
+            "replicas": [
+                {
+                    "url": replica.engine.url.render_as_string(hide_password=True),
+                    "healthy": replica.healthy,
+                    "reads": replica.reads,
+                    "failed_checks": replica.failures,
+                }
+                for replica in self._replicas
+            ],
+            "primary_fallback_reads": self._primary_reads,
+            "sticky_reads": self._sticky_reads,
+            "sticky_clients": sum(
+                until > self._clock() for until in list(self._sticky.values())
+            ),
+        }
+
+
+async def check_periodically(replicas: ReplicaSet, interval: float) -> None:
+    """Probes the replicas off the request path, once now and every tick"""
+    while True:
+        try:
+            await run_in_threadpool(replicas.check)
+        except Exception:
+            logger.exception("Failed to check read replicas, retrying next tick")
+        await asyncio.sleep(interval)
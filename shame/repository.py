@@ -1,10 +1,48 @@
-from typing import Sequence
+import csv
+import io
+from typing import Collection, Iterable, Mapping, Sequence, cast
 import sqlalchemy
 from sqlalchemy.exc import NoResultFound
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm.identity import IdentityMap
+from sqlalchemy.orm.interfaces import LoaderOption
+from sqlalchemy.orm.util import identity_key
 
+from . import locations
 from . import models
+from . import ratings
 from . import schemas
+from . import search
+from . import versioning
+from .database import upsert_insert
+from .pagination import Cursor
+
+
+def _feed_order(
+    statement: sqlalchemy.Select,
+    after: Cursor | None = None,
+) -> sqlalchemy.Select:
+    """Orders stories by `(agree, id)` and continues after the cursor if given"""
+    if after is not None:
+        statement = statement.where(
+            sqlalchemy.tuple_(models.ShameStory.agree, models.ShameStory.id)
+            > sqlalchemy.tuple_(
+                sqlalchemy.literal(after.agree), sqlalchemy.literal(after.id)
+            )
+        )
+    return statement.order_by(models.ShameStory.agree, models.ShameStory.id)
+
+
+def _expand_options(expand: Collection[str]) -> list[LoaderOption]:
+    """Loads the `schemas.EXPANDABLE` relationships asked for in the same query
+
+    Both are many-to-one, so a join adds columns but never rows and a page of
+    expanded stories stays a single SELECT.
+    """
+    return [
+        joinedload(getattr(models.ShameStory, relationship))
+        for relationship in sorted(expand)
+    ]
 
 
 def add(
@@ -19,6 +57,11 @@ def add(
         address_id=address_id,
     )
     db.add(new_db_shamestory)
+    db.flush()
+    search.index_story(db=db, shamestory_id=new_db_shamestory.id)
+    locations.address_changed(
+        db, address_id, stories=1, agree=new_db_shamestory.agree
+    )
     db.commit()
     return new_db_shamestory
 
@@ -50,13 +93,146 @@ def add_address(db: Session, address: schemas.CreateAddress) -> models.Address:
     return db_address
 
 
-def get(db: Session, skip: int = 0, limit: int = 50) -> Sequence[models.ShameStory]:
+def _upsert_address_statement(
+    dialect: str,
+    address: schemas.CreateAddress,
+) -> sqlalchemy.Executable | None:
+    """`INSERT ... ON CONFLICT DO UPDATE ... RETURNING id` for the address key
+
+    The no-op update makes the conflicting row visible to RETURNING, so the
+    id comes back whether the address was new or not.
+    """
+    insert = upsert_insert(dialect, models.Address)
+    if insert is None:
+        return None
+
+    values = address.model_dump()
+    statement = insert.values(**values)
+    return statement.on_conflict_do_update(
+        index_elements=list(values),
+        set_={"country": statement.excluded.country},
+    ).returning(models.Address.id)
+
+
+def upsert_address(db: Session, address: schemas.CreateAddress) -> int:
+    """Returns the id of the address, inserting it if missing, without commit"""
+    statement = _upsert_address_statement(db.get_bind().dialect.name, address)
+    if statement is None:
+        try:
+            return get_address(db=db, address=address).id
+        except NoResultFound:
+            db_address = models.Address(**address.model_dump())
+            db.add(db_address)
+            db.flush()
+            return db_address.id
+    return db.execute(statement).scalar_one()
+
+
+AddressKey = tuple[str, str, str, str]
+
+
+_ADDRESS_KEY = (
+    models.Address.country,
+    models.Address.state,
+    models.Address.city,
+    models.Address.street,
+)
+
+
+def _address_keys(addresses: Iterable[schemas.CreateAddress]) -> set[AddressKey]:
+    return {
+        (address.country, address.state, address.city, address.street)
+        for address in addresses
+    }
+
+
+def _address_values(keys: Iterable[AddressKey]) -> list[dict[str, str]]:
+    return [dict(zip(("country", "state", "city", "street"), key)) for key in keys]
+
+
+def _address_ids_statement(keys: Iterable[AddressKey]) -> sqlalchemy.Select:
+    return sqlalchemy.select(models.Address.id, *_ADDRESS_KEY).where(
+        sqlalchemy.tuple_(*_ADDRESS_KEY).in_(list(keys))
+    )
+
+
+def _address_ids(rows: Iterable[sqlalchemy.Row]) -> dict[AddressKey, int]:
+    return {(row.country, row.state, row.city, row.street): row.id for row in rows}
+
+
+def upsert_addresses(
+    db: Session,
+    addresses: Iterable[schemas.CreateAddress],
+) -> dict[AddressKey, int]:
+    """Resolves many addresses to ids in two statements, without commit"""
+    addresses = list(addresses)
+    keys = _address_keys(addresses)
+    if not keys:
+        return {}
+
+    insert = upsert_insert(db.get_bind().dialect.name, models.Address)
+    if insert is not None:
+        db.execute(insert.on_conflict_do_nothing(), _address_values(keys))
+    else:
+        for address in addresses:
+            upsert_address(db=db, address=address)
+
+    return _address_ids(db.execute(_address_ids_statement(keys)))
+
+
+def _last_id_statement() -> sqlalchemy.Select:
+    return sqlalchemy.select(sqlalchemy.func.max(models.ShameStory.id))
+
+
+def add_many(db: Session, shamestories: Sequence[dict]) -> int:
+    """Bulk inserts story rows without commit, with `COPY` on Postgres
+
+    Rows carry `title`, `text`, `author_id` and `address_id`.
+    """
+    if not shamestories:
+        return 0
+
+    # everything above the current max id is ours to index afterwards
+    last_id = db.scalar(_last_id_statement())
+    _insert_many(db, shamestories)
+    search.index_stories_after(db=db, shamestory_id=-1 if last_id is None else last_id)
+    locations.stories_added(db, shamestories)
+    return len(shamestories)
+
+
+def _insert_many(db: Session, shamestories: Sequence[dict]) -> None:
+    if db.get_bind().dialect.name == "postgresql":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in shamestories:
+            writer.writerow(
+                (row["title"], row["text"], 0, row["author_id"], row["address_id"])
+            )
+        buffer.seek(0)
+        cursor = db.connection().connection.cursor()
+        cursor.copy_expert(
+            'COPY "ShameStories" (title, text, agree, author_id, address_id) '
+            "FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+        return
+
+    db.execute(sqlalchemy.insert(models.ShameStory), list(shamestories))
+
+
+def get(
+    db: Session,
+    skip: int = 0,
+    limit: int = 50,
+    after: Cursor | None = None,
+    expand: Collection[str] = (),
+) -> Sequence[models.ShameStory]:
     result = (
         db.execute(
-            sqlalchemy.select(models.ShameStory)
+            _feed_order(sqlalchemy.select(models.ShameStory), after)
+            .options(*_expand_options(expand))
             .offset(skip)
             .limit(limit)
-            .order_by(models.ShameStory.agree)
         )
         .scalars()
         .all()
@@ -65,22 +241,118 @@ def get(db: Session, skip: int = 0, limit: int = 50) -> Sequence[models.ShameSto
     return result
 
 
-def get_by_id(db: Session, shamestory_id: int) -> models.ShameStory:
-    result = db.get(models.ShameStory, shamestory_id)
+def _projected_statement(
+    fields: Sequence[str],
+    skip: int,
+    limit: int,
+    after: Cursor | None,
+    address_id: int | None,
+    author_id: int | None,
+) -> sqlalchemy.Select:
+    """Core select of `fields`, then the `agree` and `id` a cursor is built from"""
+    table = models.ShameStory.__table__
+    statement = sqlalchemy.select(
+        *(table.c[name] for name in dict.fromkeys([*fields, "agree", "id"]))
+    )
+    if address_id is not None:
+        statement = statement.where(table.c.address_id == address_id)
+    if author_id is not None:
+        statement = statement.where(table.c.author_id == author_id)
+    return _feed_order(statement, after).offset(skip).limit(limit)
+
+
+def get_projected(
+    db: Session,
+    fields: Sequence[str],
+    skip: int = 0,
+    limit: int = 50,
+    after: Cursor | None = None,
+    address_id: int | None = None,
+    author_id: int | None = None,
+) -> Sequence[sqlalchemy.Row]:
+    """Plain rows of only `fields`, in the order of `get`
+
+    Rows start with `fields` in the order given; no ORM instance is built and
+    columns not asked for (usually `text`) never leave the database.
+    """
+    return db.execute(
+        _projected_statement(fields, skip, limit, after, address_id, author_id)
+    ).all()
+
+
+def get_by_id(
+    db: Session,
+    shamestory_id: int,
+    expand: Collection[str] = (),
+) -> models.ShameStory:
+    result = db.get(models.ShameStory, shamestory_id, options=_expand_options(expand))
     if not result:
         raise NoResultFound(f"Could not find shamestory with :id={shamestory_id}")
     return result
 
 
+def _identity_mapped(
+    identity_map: IdentityMap,
+    shamestory_ids: Iterable[int],
+    expand: Collection[str],
+) -> dict[int, models.ShameStory]:
+    """Stories the session already holds with every column and `expand` loaded"""
+    # relationships left unloaded are fine as long as nobody asked for them
+    allowed_unloaded = schemas.EXPANDABLE - set(expand)
+    found = {}
+    for shamestory_id in shamestory_ids:
+        story = identity_map.get(identity_key(models.ShameStory, shamestory_id))
+        if story is not None and sqlalchemy.inspect(story).unloaded <= allowed_unloaded:
+            found[shamestory_id] = story
+    return found
+
+
+def _get_many_statement(
+    shamestory_ids: Collection[int], expand: Collection[str]
+) -> sqlalchemy.Select:
+    return (
+        sqlalchemy.select(models.ShameStory)
+        .where(models.ShameStory.id.in_(shamestory_ids))
+        .options(*_expand_options(expand))
+    )
+
+
+def get_many(
+    db: Session,
+    shamestory_ids: Sequence[int],
+    expand: Collection[str] = (),
+) -> list[models.ShameStory]:
+    """Stories in the order of `shamestory_ids`, missing ones left out
+
+    Stories already in the session's identity map are taken from there, the
+    rest comes from one `IN` query.
+    """
+    found = _identity_mapped(db.identity_map, shamestory_ids, expand)
+    rest = [id for id in dict.fromkeys(shamestory_ids) if id not in found]
+    if rest:
+        found.update(
+            (story.id, story)
+            for story in db.scalars(_get_many_statement(rest, expand)).unique()
+        )
+    return [found[id] for id in shamestory_ids if id in found]
+
+
 def get_by_address(
     db: Session,
     address_id: int,
     skip: int = 0,
     limit: int = 50,
+    after: Cursor | None = None,
+    expand: Collection[str] = (),
 ) -> Sequence[models.ShameStory]:
     result = db.scalars(
-        sqlalchemy.select(models.ShameStory)
-        .where(models.ShameStory.address_id == address_id)
+        _feed_order(
+            sqlalchemy.select(models.ShameStory).where(
+                models.ShameStory.address_id == address_id
+            ),
+            after,
+        )
+        .options(*_expand_options(expand))
         .offset(skip)
         .limit(limit)
     ).all()
@@ -92,41 +364,138 @@ def get_by_author(
     author_id: int,
     skip: int = 0,
     limit: int = 50,
+    after: Cursor | None = None,
+    expand: Collection[str] = (),
 ) -> Sequence[models.ShameStory]:
     result = db.scalars(
-        sqlalchemy.select(models.ShameStory)
-        .where(models.ShameStory.author_id == author_id)
+        _feed_order(
+            sqlalchemy.select(models.ShameStory).where(
+                models.ShameStory.author_id == author_id
+            ),
+            after,
+        )
+        .options(*_expand_options(expand))
         .offset(skip)
         .limit(limit)
     ).all()
     return result
 
 
+class NotAuthor(Exception):
+    """The story belongs to another user"""
+
+
+def _update_statement(
+    shamestory_id: int,
+    values: schemas.CreateShameStory | schemas.UpdateShameStory,
+    author_id: int | None,
+    versions: Collection[int] | None,
+) -> sqlalchemy.Update:
+    story = models.ShameStory
+    statement = (
+        sqlalchemy.update(story)
+        .where(story.id == shamestory_id, versioning.matches(story.version, versions))
+        .values(**values.model_dump(exclude_unset=True), version=story.version + 1)
+        .returning(story)
+    )
+    if author_id is not None:
+        statement = statement.where(story.author_id == author_id)
+    return statement
+
+
+def _current_statement(shamestory_id: int) -> sqlalchemy.Select:
+    return sqlalchemy.select(
+        models.ShameStory.author_id, models.ShameStory.version
+    ).where(models.ShameStory.id == shamestory_id)
+
+
+def _not_updated(
+    current: sqlalchemy.Row | None, shamestory_id: int, author_id: int | None
+) -> Exception:
+    """Why the conditional `UPDATE` matched no row, from a plain read of it"""
+    if current is None:
+        return NoResultFound(f"Could not find shamestory with :id={shamestory_id}")
+    if author_id is not None and current.author_id != author_id:
+        return NotAuthor(f"Shamestory :id={shamestory_id} is not the user's")
+    return versioning.VersionConflict(
+        f"Shamestory :id={shamestory_id} is at :version={current.version}"
+    )
+
+
 def update(
     db: Session,
     shamestory_id: int,
-    values: schemas.CreateShameStory,
-) -> models.ShameStory | None:
-    try:
-        updated = db.scalar(
-            sqlalchemy.update(models.ShameStory)
-            .where(models.ShameStory.id == shamestory_id)
-            .values(**values.model_dump(exclude_unset=True))
-            .returning(models.ShameStory)
-        )
-        db.commit()
-        return updated
-    except Exception as e:
-        raise e
+    values: schemas.CreateShameStory | schemas.UpdateShameStory,
+    author_id: int | None = None,
+    versions: Collection[int] | None = None,
+) -> models.ShameStory:
+    """Changes the fields set in `values` in one `UPDATE ... RETURNING`
+
+    Given `author_id`, only that user's story changes; given `versions`, only
+    a story still at one of them (see `shame.versioning`). Otherwise raises
+    `NoResultFound`, `NotAuthor` or `versioning.VersionConflict`.
+
+    The story comes back detached, as RETURNING left it: the commit would
+    expire it, and reading it then would select the row again.
+    """
+    updated = db.scalar(_update_statement(shamestory_id, values, author_id, versions))
+    if updated is None:
+        db.rollback()
+        current = db.execute(_current_statement(shamestory_id)).one_or_none()
+        raise _not_updated(current, shamestory_id, author_id)
+    search.index_story(db=db, shamestory_id=shamestory_id)
+    db.expunge(updated)
+    db.commit()
+    return updated
+
+
+def _agree_deltas_statement(
+    deltas: Mapping[int, int],
+) -> tuple[sqlalchemy.Update, list[dict[str, int]]]:
+    """One executemany `agree = agree + delta` over the stories, in id order
+
+    Updating in a fixed order keeps concurrent flushes from deadlocking.
+    """
+    table = cast(sqlalchemy.Table, models.ShameStory.__table__)
+    statement = (
+        sqlalchemy.update(table)
+        .where(table.c.id == sqlalchemy.bindparam("story_id"))
+        .values(agree=table.c.agree + sqlalchemy.bindparam("delta"))
+    )
+    parameters = [
+        {"story_id": story_id, "delta": delta}
+        for story_id, delta in sorted(deltas.items())
+    ]
+    return statement, parameters
+
+
+def apply_agree_deltas(db: Session, deltas: Mapping[int, int]) -> None:
+    if not deltas:
+        return
+    statement, parameters = _agree_deltas_statement(deltas)
+    db.execute(statement, parameters)
+    locations.agree_changed(db, deltas)
+    ratings.agree_changed(db, deltas)
+    db.commit()
 
 
 def delete(db: Session, shamestory_id: int) -> None:
     try:
-        db.execute(
-            sqlalchemy.delete(models.ShameStory).where(
-                models.ShameStory.id == shamestory_id
+        search.remove_story(db=db, shamestory_id=shamestory_id)
+        deleted = db.execute(
+            sqlalchemy.delete(models.ShameStory)
+            .where(models.ShameStory.id == shamestory_id)
+            .returning(
+                models.ShameStory.address_id,
+                models.ShameStory.author_id,
+                models.ShameStory.agree,
             )
-        )
+        ).one_or_none()
+        if deleted is not None:
+            locations.address_changed(
+                db, deleted.address_id, stories=-1, agree=-deleted.agree
+            )
+            ratings.author_changed(db, {deleted.author_id: -deleted.agree})
         db.commit()
     except Exception:
         raise Exception("None to DELETE")
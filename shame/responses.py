@@ -0,0 +1,55 @@
+"""JSON responses that skip FastAPI's generic serialization
+
+A route returning models or ORM rows under `response_model` pays for it
+twice: FastAPI validates the result against the response field, walks it
+again with `jsonable_encoder`, and only then `json.dumps` it. `render` does
+it in one pass instead, validating from attributes and dumping to bytes in
+pydantic-core through a `TypeAdapter` built once per schema, and hands the
+bytes to `FastJSONResponse` as they are.
+
+`FastJSONResponse` is also the application's default response class, where
+it renders whatever the remaining routes return with orjson when installed
+(`pip install orjson`) and pydantic-core otherwise.
+"""
+
+import functools
+from types import ModuleType
+from typing import Any
+
+import pydantic_core
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+orjson: ModuleType | None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+@functools.cache
+def adapter(schema: Any) -> TypeAdapter:
+    """The `TypeAdapter` of `schema`, built on its first response only"""
+    return TypeAdapter(schema)
+
+
+def dump(schema: Any, content: Any) -> bytes:
+    """`content` (models, ORM objects or both) as JSON of `schema`"""
+    schema_adapter = adapter(schema)
+    return schema_adapter.dump_json(
+        schema_adapter.validate_python(content, from_attributes=True)
+    )
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            # already rendered by `dump`
+            return content
+        if orjson is not None:
+            return orjson.dumps(content, default=pydantic_core.to_jsonable_python)
+        return pydantic_core.to_json(content)
+
+
+def render(schema: Any, content: Any, **kwargs: Any) -> FastJSONResponse:
+    return FastJSONResponse(dump(schema, content), **kwargs)
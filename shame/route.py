@@ -1,32 +1,463 @@
-from typing import Annotated
+import json
+from contextlib import contextmanager
+from typing import Annotated, Iterator, Sequence
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from fastapi.routing import APIRouter
+from pydantic import SerializeAsAny
+import sqlalchemy
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from shame.auth import dependencies
 
-from . import schemas, repository as repo
+from . import (
+    export,
+    ingest,
+    leaderboard,
+    locations,
+    models,
+    schemas,
+    search,
+    versioning,
+    repository as repo,
+)
+from .cache import list_key, response_cache, story_key
+from .config.settings import settings
+from .counters import agree_buffer
 from .database import get_database
+from .leaderboard import top_stories
+from .pagination import (
+    Cursor,
+    SearchCursor,
+    decode_cursor,
+    decode_search_cursor,
+    encode_cursor,
+    next_cursor,
+)
+from .responses import FastJSONResponse, dump, render
 
 
 router = APIRouter(prefix="/shamestories")
+stats_router = APIRouter(prefix="/stats", tags=["Stats"])
 
 Database = Annotated[Session, Depends(get_database)]
 
 
-@router.get("/", response_model=list[schemas.ShameStory])
-def get_shamestories(db: Database, skip: int = 0, limit: int = 20):
-    results = repo.get(db, skip=skip, limit=limit)
-    return results
+def get_expand(expand: str | None = None) -> frozenset[str]:
+    """Parses `?expand=author,address`"""
+    if not expand:
+        return frozenset()
+    relationships = frozenset(
+        name.strip() for name in expand.split(",") if name.strip()
+    )
+    unknown = relationships - schemas.EXPANDABLE
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Cannot expand :expand={','.join(sorted(unknown))}",
+        )
+    return relationships
+
+
+Expand = Annotated[frozenset[str], Depends(get_expand)]
+
+
+def get_fields(expand: Expand, fields: str | None = None) -> tuple[str, ...]:
+    """Parses `?fields=id,title,agree` into `schemas.STORY_FIELDS` order"""
+    if not fields:
+        return ()
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = names - set(schemas.STORY_FIELDS)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown :fields={','.join(sorted(unknown))}",
+        )
+    if expand:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cannot combine :fields with :expand",
+        )
+    return tuple(name for name in schemas.STORY_FIELDS if name in names)
+
+
+Fields = Annotated[tuple[str, ...], Depends(get_fields)]
+
+
+def present(result: models.ShameStory, expand: frozenset[str]) -> schemas.ShameStory:
+    """Story schema embedding the relationships the repository loaded for `expand`"""
+    story = schemas.ShameStory.model_validate(result)
+    if not expand:
+        return story
+    return schemas.ExpandedShameStory(
+        **story.model_dump(),
+        **{relationship: getattr(result, relationship) for relationship in expand},
+    )
+
+
+def present_all(
+    results: Sequence[models.ShameStory], expand: frozenset[str]
+) -> Sequence[models.ShameStory | schemas.ShameStory]:
+    """What `responses.dump` validates: ORM rows as they are unless expanded"""
+    if not expand:
+        return results
+    return [present(result, expand) for result in results]
+
+
+StoryList = list[SerializeAsAny[schemas.ShameStory]]
+
+
+def serialize_stories(
+    results: Sequence[models.ShameStory],
+    expand: frozenset[str] = frozenset(),
+) -> bytes:
+    return dump(StoryList, present_all(results, expand))
+
+
+def story_page(
+    results: Sequence[models.ShameStory],
+    expand: frozenset[str] = frozenset(),
+    cursor: str | None = None,
+) -> FastJSONResponse:
+    """`schemas.ShameStoryPage` rendered without FastAPI's response validation"""
+    return render(
+        schemas.ShameStoryPage,
+        {"items": present_all(results, expand), "next_cursor": cursor},
+    )
+
+
+def serialize_story(
+    result: models.ShameStory,
+    expand: frozenset[str] = frozenset(),
+) -> bytes:
+    return present(result, expand).model_dump_json().encode()
+
+
+def serialize_rows(rows: Sequence[sqlalchemy.Row], fields: Sequence[str]) -> bytes:
+    """Projected rows as JSON objects of `fields`, with no model in between"""
+    return json.dumps(
+        [dict(zip(fields, row)) for row in rows],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode()
+
+
+def projected_page(
+    rows: Sequence[sqlalchemy.Row], fields: Sequence[str], limit: int
+) -> Response:
+    """`schemas.ShameStoryPage` of projected rows"""
+    items = serialize_rows(rows, fields)
+    cursor = json.dumps(next_cursor(rows, limit)).encode()
+    return Response(
+        b'{"items":' + items + b',"next_cursor":' + cursor + b"}",
+        media_type="application/json",
+    )
+
+
+def get_batch_ids(ids: str) -> list[int]:
+    """Parses `?ids=3,1,2`, keeping the order and dropping repeats"""
+    try:
+        parsed = list(dict.fromkeys(int(id) for id in ids.split(",") if id.strip()))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Cannot parse :ids={ids}",
+        )
+    if len(parsed) > settings.BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Cannot get more than {settings.BATCH_MAX_IDS} stories at once",
+        )
+    return parsed
+
+
+BatchIds = Annotated[list[int], Depends(get_batch_ids)]
+
+
+def get_top_limit(limit: int = Query(default=20, ge=1)) -> int:
+    """`?limit=` of `/top`, at most the `LEADERBOARD_SIZE` the boards keep"""
+    if limit > settings.LEADERBOARD_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Cannot rank more than {settings.LEADERBOARD_SIZE} stories",
+        )
+    return limit
+
+
+TopLimit = Annotated[int, Depends(get_top_limit)]
+
+
+def cached_stories(ids: Sequence[int], expand: frozenset[str]) -> dict[int, bytes]:
+    """Story bodies the response cache already holds"""
+    bodies = {}
+    for id in ids:
+        entry = response_cache.get(story_key(id, expand))
+        if entry is not None:
+            bodies[id] = entry.body
+    return bodies
+
+
+def cache_stories(
+    results: Sequence[models.ShameStory],
+    expand: frozenset[str],
+    generation: int,
+) -> dict[int, bytes]:
+    return {
+        result.id: response_cache.put(
+            story_key(result.id, expand),
+            serialize_story(result, expand),
+            story_ids=[result.id],
+            generation=generation,
+            version=result.version,
+        ).body
+        for result in results
+    }
+
+
+def batch_response(ids: Sequence[int], bodies: dict[int, bytes]) -> Response:
+    """`schemas.ShameStoryBatch` spliced together from serialized stories"""
+    items = b",".join(bodies[id] for id in ids if id in bodies)
+    missing = json.dumps([id for id in ids if id not in bodies]).encode()
+    return Response(
+        b'{"items":[' + items + b'],"missing":' + missing + b"}",
+        media_type="application/json",
+    )
+
+
+def get_if_match(
+    if_match: Annotated[str | None, Header()] = None,
+) -> frozenset[int] | None:
+    """Story versions named by `If-Match`, see `shame.versioning`"""
+    return versioning.parse_if_match(if_match)
+
+
+IfMatch = Annotated[frozenset[int] | None, Depends(get_if_match)]
+
+
+@contextmanager
+def edit_errors() -> Iterator[None]:
+    """HTTP errors of a failed `repository.update`"""
+    try:
+        yield
+    except NoResultFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except repo.NotAuthor as e:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(e))
+    except versioning.VersionConflict as e:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED, detail=str(e)
+        )
+
+
+@contextmanager
+def search_errors() -> Iterator[None]:
+    """501 where the database has no full-text search"""
+    try:
+        yield
+    except search.SearchUnsupported as e:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=str(e))
+
+
+def edited(result: models.ShameStory) -> Response:
+    """The edited story with its new ETag, cached for the next `GET`"""
+    response_cache.invalidate_story(result.id)
+    entry = response_cache.put(
+        story_key(result.id),
+        serialize_story(result),
+        story_ids=[result.id],
+        generation=response_cache.generation,
+        version=result.version,
+    )
+    return Response(
+        entry.body, media_type="application/json", headers={"ETag": entry.etag}
+    )
+
+
+def get_cursor(cursor: str | None = None) -> Cursor | None:
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+PageCursor = Annotated[Cursor | None, Depends(get_cursor)]
+
+
+def get_search_cursor(cursor: str | None = None) -> SearchCursor | None:
+    if cursor is None:
+        return None
+    try:
+        return decode_search_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+SearchPageCursor = Annotated[SearchCursor | None, Depends(get_search_cursor)]
+
+
+@router.get("/", response_model=list[SerializeAsAny[schemas.ShameStory]])
+def get_shamestories(
+    request: Request,
+    db: Database,
+    expand: Expand,
+    fields: Fields,
+    skip: int = 0,
+    limit: int = 20,
+):
+    key = list_key(skip, limit, expand, fields)
+    entry = response_cache.get(key)
+    if entry is None:
+        generation = response_cache.generation
+        if fields:
+            rows = repo.get_projected(db, fields, skip=skip, limit=limit)
+            body, story_ids = serialize_rows(rows, fields), [row.id for row in rows]
+        else:
+            results = repo.get(db, skip=skip, limit=limit, expand=expand)
+            body = serialize_stories(results, expand)
+            story_ids = [result.id for result in results]
+        entry = response_cache.put(
+            key, body, story_ids=story_ids, generation=generation
+        )
+    return response_cache.respond(request, entry)
+
+
+@router.get("/feed", response_model=schemas.ShameStoryPage)
+def get_shamestories_feed(
+    db: Database,
+    cursor: PageCursor,
+    expand: Expand,
+    limit: int = 20,
+):
+    results = repo.get(db, limit=limit, after=cursor, expand=expand)
+    return story_page(results, expand, next_cursor(results, limit))
+
+
+@router.get("/address/{address_id}", response_model=schemas.ShameStoryPage)
+def get_shamestories_by_address(
+    address_id: int,
+    db: Database,
+    cursor: PageCursor,
+    expand: Expand,
+    fields: Fields,
+    limit: int = 20,
+):
+    if fields:
+        rows = repo.get_projected(
+            db, fields, limit=limit, after=cursor, address_id=address_id
+        )
+        return projected_page(rows, fields, limit)
+    results = repo.get_by_address(
+        db, address_id=address_id, limit=limit, after=cursor, expand=expand
+    )
+    return story_page(results, expand, next_cursor(results, limit))
+
+
+@router.get("/author/{author_id}", response_model=schemas.ShameStoryPage)
+def get_shamestories_by_author(
+    author_id: int,
+    db: Database,
+    cursor: PageCursor,
+    expand: Expand,
+    fields: Fields,
+    limit: int = 20,
+):
+    if fields:
+        rows = repo.get_projected(
+            db, fields, limit=limit, after=cursor, author_id=author_id
+        )
+        return projected_page(rows, fields, limit)
+    results = repo.get_by_author(
+        db, author_id=author_id, limit=limit, after=cursor, expand=expand
+    )
+    return story_page(results, expand, next_cursor(results, limit))
+
+
+@router.get("/search", response_model=schemas.ShameStoryPage)
+def search_shamestories(
+    db: Database,
+    cursor: SearchPageCursor,
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    limit: int = 20,
+):
+    """Ranked full-text search over story titles and texts"""
+    if not q.split():
+        return story_page([])
+
+    with search_errors():
+        rows = search.search(db, query=q, limit=limit, after=cursor)
+    token = None
+    if limit > 0 and len(rows) == limit:
+        token = encode_cursor(SearchCursor(score=rows[-1].score, id=rows[-1][0].id))
+    return story_page([row[0] for row in rows], cursor=token)
+
+
+@router.get("/export", response_class=StreamingResponse)
+def export_shamestories(
+    user: dependencies.CurrentActiveUser,
+    db: Database,
+    format: export.ExportFormat = "ndjson",
+):
+    """Streams every story with its address and author as NDJSON or CSV"""
+    return StreamingResponse(
+        export.iter_export(db, format),
+        media_type=export.MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="shamestories.{format}"'
+        },
+    )
+
+
+@router.get("/batch", response_model=schemas.ShameStoryBatch)
+def get_shamestories_batch(db: Database, ids: BatchIds, expand: Expand):
+    """Stories by id in one `IN` query, cached ones straight from the cache"""
+    bodies = cached_stories(ids, expand)
+    generation = response_cache.generation
+    results = repo.get_many(db, [id for id in ids if id not in bodies], expand=expand)
+    bodies.update(cache_stories(results, expand, generation))
+    return batch_response(ids, bodies)
+
+
+@router.get("/top", response_model=list[schemas.ShameStory])
+def get_top_shamestories(
+    db: Database,
+    limit: TopLimit,
+    country: str | None = None,
+):
+    """Most agreed stories, of one country if given, ranked in memory"""
+    ranking = leaderboard.top(db, limit=limit, country=country)
+    return render(
+        list[schemas.ShameStory],
+        repo.get_many(db, [story_id for story_id, _ in ranking]),
+    )
 
 
 @router.get("/{shamestory_id}", response_model=schemas.ShameStory)
-def get_shamestory_by_id(shamestory_id: int, db: Database):
+def get_shamestory_by_id(
+    request: Request,
+    shamestory_id: int,
+    db: Database,
+    expand: Expand,
+):
+    key = story_key(shamestory_id, expand)
+    entry = response_cache.get(key)
+    if entry is not None:
+        return response_cache.respond(request, entry)
     try:
-        result = repo.get_by_id(db=db, shamestory_id=shamestory_id)
-        return result
+        generation = response_cache.generation
+        result = repo.get_by_id(db=db, shamestory_id=shamestory_id, expand=expand)
+        entry = response_cache.put(
+            key,
+            serialize_story(result, expand),
+            story_ids=[shamestory_id],
+            generation=generation,
+            version=result.version,
+        )
+        return response_cache.respond(request, entry)
     except NoResultFound as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
     except Exception as e:
@@ -46,26 +477,41 @@ def insert_shamestory(
             detail="To post ShameStory user should be authorized.",
         )
 
-    try:
-        db_address = repo.get_address(db=db, address=address)
-    except NoResultFound:
-        db_address = repo.add_address(db=db, address=address)
-
+    # the address upsert and the story insert share one transaction
+    address_id = repo.upsert_address(db=db, address=address)
     db_shamestory = repo.add(
         db=db,
         shamestory=shamestory,
         author_id=user.id,
-        address_id=db_address.id,
+        address_id=address_id,
     )
+    response_cache.invalidate_lists()
+    top_stories.offer(db_shamestory.id, db_shamestory.agree, address.country)
     return db_shamestory
 
 
+@router.post("/import", response_model=schemas.ImportReport)
+async def import_shamestories(
+    request: Request,
+    user: dependencies.CurrentActiveUser,
+    db: Database,
+):
+    """Bulk imports an NDJSON body of `ImportShameStory` lines as the user"""
+    importer = ingest.Importer(db=db, author_id=user.id)
+    async for chunk in ingest.achunked(ingest.split_lines(request.stream())):
+        await run_in_threadpool(importer.import_chunk, chunk)
+    response_cache.invalidate_lists()
+    top_stories.invalidate()
+    return importer.finish()
+
+
 @router.put("/{shamestory_id}", response_model=schemas.ShameStory)
 def update_shamestory(
     shamestory_id: int,
     shamestory_values: schemas.CreateShameStory,
     user: dependencies.CurrentActiveUser,
     db: Database,
+    versions: IfMatch,
 ):
     if not user:
         raise HTTPException(
@@ -73,12 +519,61 @@ def update_shamestory(
             detail="To update ShameStory user should be authorized.",
         )
 
-    db_shamestory = repo.update(
-        db=db,
-        shamestory_id=shamestory_id,
-        values=shamestory_values,
-    )
-    return db_shamestory
+    with edit_errors():
+        db_shamestory = repo.update(
+            db=db,
+            shamestory_id=shamestory_id,
+            values=shamestory_values,
+            author_id=user.id,
+            versions=versions,
+        )
+    return edited(db_shamestory)
+
+
+@router.patch("/{shamestory_id}", response_model=schemas.ShameStory)
+def patch_shamestory(
+    shamestory_id: int,
+    shamestory_values: schemas.UpdateShameStory,
+    user: dependencies.CurrentActiveUser,
+    db: Database,
+    versions: IfMatch,
+):
+    """Changes only the fields sent, `If-Match` rejects edits of a stale read"""
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="To update ShameStory user should be authorized.",
+        )
+
+    with edit_errors():
+        db_shamestory = repo.update(
+            db=db,
+            shamestory_id=shamestory_id,
+            values=shamestory_values,
+            author_id=user.id,
+            versions=versions,
+        )
+    return edited(db_shamestory)
+
+
+@router.post(
+    "/{shamestory_id}/agree",
+    response_model=schemas.AgreeAccepted,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+def agree_shamestory(
+    shamestory_id: int,
+    user: dependencies.CurrentActiveUser,
+    db: Database,
+):
+    try:
+        repo.get_by_id(db=db, shamestory_id=shamestory_id)
+    except NoResultFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+    # counted in memory, written by the periodic flush in `shame.app`
+    pending = agree_buffer.increment(shamestory_id)
+    return schemas.AgreeAccepted(id=shamestory_id, pending=pending)
 
 
 @router.delete("/{shamestory_id}")
@@ -94,3 +589,20 @@ def delete_shamestory(
         )
 
     repo.delete(db=db, shamestory_id=shamestory_id)
+    response_cache.invalidate_story(shamestory_id)
+    response_cache.invalidate_lists()
+    top_stories.remove(shamestory_id)
+
+
+@stats_router.get("/locations", response_model=list[schemas.LocationStats])
+def get_location_stats(
+    db: Database,
+    level: locations.Level = "country",
+    skip: int = 0,
+    limit: int = Query(default=50, le=1000),
+):
+    """Story count and total `agree` per location, most agreed first"""
+    return render(
+        list[schemas.LocationStats],
+        locations.get(db, level=level, skip=skip, limit=limit),
+    )
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, SerializeAsAny, field_validator, model_validator
 from pydantic.config import ConfigDict
 
 
@@ -16,16 +16,51 @@ class ShameStory(ShameStoryBase):
     address_id: int | None = None
 
 
+# what `?fields=` may select, in the order responses list them
+STORY_FIELDS = tuple(ShameStory.model_fields)
+
+
 class CreateShameStory(ShameStoryBase):
     pass
 
 
+class UpdateShameStory(BaseModel):
+    """`PATCH` body, only the fields sent change"""
+
+    title: str | None = None
+    text: str | None = None
+
+    @field_validator("title", "text")
+    @classmethod
+    def not_null(cls, value: str | None) -> str:
+        if value is None:
+            raise ValueError("cannot be null, leave it out to keep it")
+        return value
+
+    @model_validator(mode="after")
+    def not_empty(self) -> "UpdateShameStory":
+        if not self.model_fields_set:
+            raise ValueError("nothing to update")
+        return self
+
+
+class AgreeAccepted(BaseModel):
+    id: int
+    pending: int
+
+
 class AddressBase(BaseModel):
     country: str
     state: str
     city: str
     street: str
 
+    @field_validator("country", "state", "city", "street")
+    @classmethod
+    def normalize_whitespace(cls, value: str) -> str:
+        """Addresses are unique by value, so spacing must not make a new one"""
+        return " ".join(value.split())
+
 
 class Address(AddressBase):
     model_config = ConfigDict(from_attributes=True)
@@ -34,3 +69,71 @@ class Address(AddressBase):
 
 class CreateAddress(AddressBase):
     pass
+
+
+# relationships a story response can embed with `?expand=`
+EXPANDABLE = frozenset({"author", "address"})
+
+
+class StoryAuthor(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    username: str
+
+
+class ExpandedShameStory(ShameStory):
+    """`ShameStory` with the relationships asked for in `?expand=`, others null"""
+
+    author: StoryAuthor | None = None
+    address: Address | None = None
+
+
+class ShameStoryPage(BaseModel):
+    items: list[SerializeAsAny[ShameStory]]
+    next_cursor: str | None = None
+
+
+class ShameStoryBatch(BaseModel):
+    """Stories in the order asked for, with the ids that do not exist"""
+
+    items: list[SerializeAsAny[ShameStory]]
+    missing: list[int] = []
+
+
+class ImportShameStory(BaseModel):
+    """One NDJSON line of a bulk import"""
+
+    shamestory: CreateShameStory
+    address: CreateAddress
+    author_id: int | None = None
+
+
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+
+class ImportReport(BaseModel):
+    rows: int = 0
+    inserted: int = 0
+    errors: list[ImportRowError] = []
+    seconds: float = 0.0
+    rows_per_second: float = 0.0
+
+
+class LocationStats(BaseModel):
+    """Stories at a location; `state` and `city` are null above their level"""
+
+    model_config = ConfigDict(from_attributes=True)
+
+    country: str
+    state: str | None = None
+    city: str | None = None
+    stories: int
+    agree: int
+
+    @field_validator("state", "city")
+    @classmethod
+    def empty_as_null(cls, value: str | None) -> str | None:
+        return value or None
@@ -0,0 +1,222 @@
+"""Full-text index over story title and text
+
+Postgres keeps a weighted `tsvector` column on `ShameStories` behind a GIN
+index, SQLite an FTS5 table keyed by story id. Both are created together with
+the metadata and kept current by the repository: every story write calls
+`index_story`/`remove_story` inside its own transaction.
+
+Hits are ordered by a score where lower is better (`bm25` on SQLite,
+`-ts_rank` on Postgres) and then by id, which gives search results the same
+keyset pagination as the feed. Scores are float8 on both sides of the cursor
+comparison, so a score read back from a JSON cursor compares equal to itself.
+"""
+
+from typing import Any, Sequence
+
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import Base
+from .pagination import SearchCursor
+
+
+class SearchUnsupported(Exception):
+    """The database has no full-text index this module knows how to build"""
+
+
+FTS_TABLE = "ShameStoriesSearch"
+TS_CONFIG = "simple"
+# float8, the same precision as the JSON floats of search cursors
+_SCORE_TYPE = sqlalchemy.Float(precision=53)
+
+_POSTGRES_VECTOR = (
+    f"setweight(to_tsvector('{TS_CONFIG}', coalesce(title, '')), 'A')"
+    f" || setweight(to_tsvector('{TS_CONFIG}', coalesce(text, '')), 'B')"
+)
+
+_CREATE = {
+    "postgresql": [
+        'ALTER TABLE "ShameStories" ADD COLUMN IF NOT EXISTS search_vector tsvector',
+        'CREATE INDEX IF NOT EXISTS "ix_ShameStories_search_vector"'
+        ' ON "ShameStories" USING GIN (search_vector)',
+    ],
+    "sqlite": [
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS "{FTS_TABLE}"'
+        " USING fts5(title, text, tokenize = 'unicode61 remove_diacritics 2')",
+    ],
+}
+_DROP = {
+    "sqlite": [f'DROP TABLE IF EXISTS "{FTS_TABLE}"'],
+}
+_INDEX = {
+    "postgresql": [
+        f'UPDATE "ShameStories" SET search_vector = {_POSTGRES_VECTOR} WHERE id = :id',
+    ],
+    "sqlite": [
+        f'DELETE FROM "{FTS_TABLE}" WHERE rowid = :id',
+        f'INSERT INTO "{FTS_TABLE}" (rowid, title, text)'
+        ' SELECT id, title, text FROM "ShameStories" WHERE id = :id',
+    ],
+}
+_INDEX_AFTER = {
+    "postgresql": [
+        f'UPDATE "ShameStories" SET search_vector = {_POSTGRES_VECTOR}'
+        " WHERE id > :id AND search_vector IS NULL",
+    ],
+    "sqlite": [
+        f'INSERT INTO "{FTS_TABLE}" (rowid, title, text)'
+        ' SELECT id, title, text FROM "ShameStories" WHERE id > :id',
+    ],
+}
+_BACKFILL = {
+    "postgresql": [
+        f'UPDATE "ShameStories" SET search_vector = {_POSTGRES_VECTOR}'
+        " WHERE search_vector IS NULL",
+    ],
+    "sqlite": [
+        f'INSERT INTO "{FTS_TABLE}" (rowid, title, text)'
+        ' SELECT id, title, text FROM "ShameStories"'
+        f' WHERE id NOT IN (SELECT rowid FROM "{FTS_TABLE}")',
+    ],
+}
+_REMOVE = {
+    "sqlite": [f'DELETE FROM "{FTS_TABLE}" WHERE rowid = :id'],
+}
+
+
+def _statements(
+    statements: dict[str, list[str]],
+    dialect: str,
+) -> list[sqlalchemy.TextClause]:
+    return [sqlalchemy.text(statement) for statement in statements.get(dialect, [])]
+
+
+def create_index(connection: Connection) -> None:
+    """Creates the index structures if missing"""
+    for statement in _statements(_CREATE, connection.dialect.name):
+        connection.execute(statement)
+
+
+def backfill(connection: Connection) -> None:
+    """Indexes every story the index does not know yet"""
+    for statement in _statements(_BACKFILL, connection.dialect.name):
+        connection.execute(statement)
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_search_index(target: Any, connection: Connection, **kw: Any) -> None:
+    create_index(connection)
+
+
+@event.listens_for(Base.metadata, "before_drop")
+def _drop_search_index(target: Any, connection: Connection, **kw: Any) -> None:
+    for statement in _statements(_DROP, connection.dialect.name):
+        connection.execute(statement)
+
+
+def index_story(db: Session, shamestory_id: int) -> None:
+    """(Re)indexes one stored story, without commit"""
+    for statement in _statements(_INDEX, db.get_bind().dialect.name):
+        db.execute(statement, {"id": shamestory_id})
+
+
+def index_stories_after(db: Session, shamestory_id: int) -> None:
+    """Indexes every story inserted with an id above `shamestory_id`"""
+    for statement in _statements(_INDEX_AFTER, db.get_bind().dialect.name):
+        db.execute(statement, {"id": shamestory_id})
+
+
+def remove_story(db: Session, shamestory_id: int) -> None:
+    for statement in _statements(_REMOVE, db.get_bind().dialect.name):
+        db.execute(statement, {"id": shamestory_id})
+
+
+async def index_story_async(db: AsyncSession, shamestory_id: int) -> None:
+    for statement in _statements(_INDEX, db.get_bind().dialect.name):
+        await db.execute(statement, {"id": shamestory_id})
+
+
+async def index_stories_after_async(db: AsyncSession, shamestory_id: int) -> None:
+    for statement in _statements(_INDEX_AFTER, db.get_bind().dialect.name):
+        await db.execute(statement, {"id": shamestory_id})
+
+
+async def remove_story_async(db: AsyncSession, shamestory_id: int) -> None:
+    for statement in _statements(_REMOVE, db.get_bind().dialect.name):
+        await db.execute(statement, {"id": shamestory_id})
+
+
+_VECTOR: sqlalchemy.ColumnClause[Any] = sqlalchemy.literal_column(
+    '"ShameStories".search_vector'
+)
+_FTS: sqlalchemy.ColumnClause[Any] = sqlalchemy.literal_column(f'"{FTS_TABLE}"')
+
+
+def _fts5_query(query: str) -> str:
+    """Quotes every term, so user input never reaches the FTS5 query syntax"""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+def search_statement(
+    dialect: str,
+    query: str,
+    limit: int,
+    after: SearchCursor | None = None,
+) -> sqlalchemy.Select:
+    score: sqlalchemy.ColumnElement[float]
+    match dialect:
+        case "postgresql":
+            tsquery = sqlalchemy.func.websearch_to_tsquery(TS_CONFIG, query)
+            # `ts_rank` is float4, widened so cursors round-trip it exactly
+            score = sqlalchemy.cast(
+                -sqlalchemy.func.ts_rank(_VECTOR, tsquery), _SCORE_TYPE
+            )
+            statement = sqlalchemy.select(
+                models.ShameStory, score.label("score")
+            ).where(_VECTOR.bool_op("@@")(tsquery))
+        case "sqlite":
+            fts = sqlalchemy.table(FTS_TABLE, sqlalchemy.column("rowid"))
+            # title matches weigh twice as much as text matches
+            score = sqlalchemy.func.bm25(_FTS, 2.0, 1.0, type_=_SCORE_TYPE)
+            statement = (
+                sqlalchemy.select(models.ShameStory, score.label("score"))
+                .join(fts, fts.c.rowid == models.ShameStory.id)
+                .where(_FTS.bool_op("MATCH")(_fts5_query(query)))
+            )
+        case _:
+            raise SearchUnsupported(f"Full-text search is not supported on {dialect}")
+
+    if after is not None:
+        statement = statement.where(
+            sqlalchemy.tuple_(score, models.ShameStory.id)
+            > sqlalchemy.tuple_(
+                sqlalchemy.literal(after.score, _SCORE_TYPE),
+                sqlalchemy.literal(after.id),
+            )
+        )
+    return statement.order_by(score, models.ShameStory.id).limit(limit)
+
+
+def search(
+    db: Session,
+    query: str,
+    limit: int = 20,
+    after: SearchCursor | None = None,
+) -> Sequence[sqlalchemy.Row[tuple[models.ShameStory, float]]]:
+    """Returns `(story, score)` rows, best match first"""
+    statement = search_statement(db.get_bind().dialect.name, query, limit, after)
+    return db.execute(statement).all()
+
+
+async def search_async(
+    db: AsyncSession,
+    query: str,
+    limit: int = 20,
+    after: SearchCursor | None = None,
+) -> Sequence[sqlalchemy.Row[tuple[models.ShameStory, float]]]:
+    statement = search_statement(db.get_bind().dialect.name, query, limit, after)
+    return (await db.execute(statement)).all()
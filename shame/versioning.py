@@ -0,0 +1,50 @@
+"""Optimistic concurrency on the `version` column of stories and users
+
+An edit is one `UPDATE ... SET version = version + 1 WHERE id = :id AND
+version IN (:versions) RETURNING *`: an edit made from a stale read matches
+no row and changes nothing, and nothing is locked while the client thinks.
+Only when no row matched does the repository read the row once, plainly, to
+tell a missing row from a conflict.
+
+A story's ETag starts with its version, `"3.<hash of the body>"`, and
+`If-Match` is checked against that part alone. `agree` changes the body but
+not the version, so agrees counted in between never fail an edit.
+"""
+
+from typing import Collection
+
+import sqlalchemy
+from sqlalchemy.orm import QueryableAttribute
+
+
+class VersionConflict(Exception):
+    """The row exists, but at none of the versions the client read"""
+
+
+def parse_if_match(header: str | None) -> frozenset[int] | None:
+    """Versions named by an `If-Match` header, None when absent or `*`
+
+    Comparison is strong, so weak tags match nothing, and neither do tags
+    without a version.
+    """
+    if header is None or header.strip() == "*":
+        return None
+    versions = set()
+    for tag in header.split(","):
+        tag = tag.strip()
+        if len(tag) < 2 or tag[0] != '"' or tag[-1] != '"':
+            continue
+        version = tag[1:-1].partition(".")[0]
+        if version.isdigit():
+            versions.add(int(version))
+    return frozenset(versions)
+
+
+def matches(
+    column: sqlalchemy.ColumnElement[int] | QueryableAttribute[int],
+    versions: Collection[int] | None,
+) -> sqlalchemy.ColumnElement[bool]:
+    """`version IN (:versions)`, or true for an unconditional edit"""
+    if versions is None:
+        return sqlalchemy.true()
+    return column.in_(sorted(versions))
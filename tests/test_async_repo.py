@@ -0,0 +1,213 @@
+import json
+import re
+from typing import AsyncGenerator
+
+import pytest
+import pytest_asyncio
+from fastapi.routing import APIRoute, APIRouter
+from sqlalchemy.exc import NoResultFound
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from shame import async_repository as repository
+from shame import async_route as async_shame_route
+from shame import export, ingest, locations, schemas
+from shame import route as shame_route
+from shame.auth import async_repository as user_repository
+from shame.auth import async_route as async_auth_route
+from shame.auth import route as auth_route
+from shame.auth import schemas as user_schemas
+from shame.auth.models import User
+from shame.database import Base
+from shame.models import Address, ShameStory
+
+
+DATABASE_URL = "sqlite+aiosqlite:///:memory:"
+engine = create_async_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+SessionTesting = async_sessionmaker(
+    bind=engine,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+
+@pytest_asyncio.fixture()
+async def session() -> AsyncGenerator[AsyncSession, None]:
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+    session = SessionTesting()
+    session.add(
+        User(
+            id=0,
+            email="tuky.chyvekshyno@gmail.com",
+            username="tuki",
+            password_hashed="1111",
+            rating=3,
+        )
+    )
+    session.add(
+        Address(
+            id=0,
+            country="Ukraine",
+            state="Lviv",
+            city="Lviv",
+            street="Hrinchenka, 14a",
+        )
+    )
+    session.add(
+        ShameStory(
+            id=0,
+            title="Lorem Ipsum",
+            text="Lorem ipsum dolor sit amet, qui minim labore adipisicing.",
+            author_id=0,
+            address_id=0,
+        )
+    )
+    await session.commit()
+
+    yield session
+
+    await session.close()
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+
+
+@pytest.mark.asyncio
+async def test_async_repo_insert_shamestory(session: AsyncSession):
+    address = await repository.add_address(
+        session,
+        schemas.CreateAddress(
+            country="Ukraine", state="Kyiv", city="Kyiv", street="Vassylkivska, 5"
+        ),
+    )
+    found = await repository.get_address(
+        session,
+        schemas.CreateAddress(
+            country="Ukraine", state="Kyiv", city="Kyiv", street="Vassylkivska, 5"
+        ),
+    )
+    assert found.id == address.id
+
+    assert await repository.upsert_address(
+        session,
+        schemas.CreateAddress(
+            country="Ukraine", state="Kyiv", city="Kyiv", street="Vassylkivska, 5"
+        ),
+    ) == address.id
+
+    db_shamestory = await repository.add(
+        session,
+        schemas.CreateShameStory(title="Lorem Short", text="Lorem ipsum."),
+        author_id=0,
+        address_id=address.id,
+    )
+    check = await repository.get_by_id(session, shamestory_id=db_shamestory.id)
+    assert check.title == "Lorem Short"
+    assert check.address_id == address.id
+
+
+@pytest.mark.asyncio
+async def test_async_repo_get_shamestories(session: AsyncSession):
+    for i in range(30):
+        await repository.add(
+            session,
+            schemas.CreateShameStory(title="P" * i, text="Lo Ho" * i),
+            author_id=0,
+            address_id=0,
+        )
+
+    results = await repository.get(session, skip=0, limit=20)
+    assert len(results) == 20
+    assert len(await repository.get_by_author(session, author_id=0)) == 31
+    assert len(await repository.get_by_address(session, address_id=0, limit=5)) == 5
+
+    (city,) = await locations.get_async(session, level="city")
+    assert (city.city, city.stories, city.agree) == ("Lviv", 30, 0)
+
+
+@pytest.mark.asyncio
+async def test_async_repo_update_delete_shamestory(session: AsyncSession):
+    updated = await repository.update(
+        session,
+        shamestory_id=0,
+        values=schemas.CreateShameStory(title="New", text="Reprehenderit!"),
+    )
+    assert updated is not None
+    assert updated.title == "New"
+
+    await repository.delete(session, shamestory_id=0)
+    with pytest.raises(NoResultFound):
+        await repository.get_by_id(session, shamestory_id=0)
+
+
+@pytest.mark.asyncio
+async def test_async_repo_users(session: AsyncSession):
+    db_user = await user_repository.add(
+        session,
+        user_schemas.CreateUser(username="Yana", email="yana@gmail.com", password="1234"),
+    )
+    assert db_user.validate_password("1234")
+    assert await user_repository.contains(session, username="Yana")
+
+    found = await user_repository.get_by_email(session, email="yana@gmail.com")
+    assert found.id == db_user.id
+
+    updated = await user_repository.update(
+        session, id=0, values=user_schemas.UserBase(username="tukiNew")
+    )
+    assert updated.username == "tukiNew"
+
+    await user_repository.delete(session, id=db_user.id)
+    with pytest.raises(NoResultFound):
+        await user_repository.get_by_username(session, username="Yana")
+
+
+@pytest.mark.asyncio
+async def test_async_import_export_roundtrip(session: AsyncSession):
+    address = {"country": "Poland", "state": "-", "city": "Warsaw", "street": "-"}
+    lines = [
+        json.dumps({"shamestory": {"title": f"{i}", "text": "-"}, "address": address})
+        for i in range(5)
+    ] + ["{broken"]
+    importer = ingest.AsyncImporter(session, author_id=0)
+    for chunk in ingest.chunked(lines, size=4):
+        await importer.import_chunk(chunk)
+    report = importer.finish()
+    assert (report.rows, report.inserted, len(report.errors)) == (6, 5, 1)
+
+    stream = export.iter_export_async(session, "ndjson", yield_per=2)
+    chunks = [chunk async for chunk in stream]
+    assert len(chunks) == 3
+    rows = [json.loads(line) for line in b"".join(chunks).decode().splitlines()]
+    assert [row["city"] for row in rows] == ["Lviv"] + ["Warsaw"] * 5
+
+    (poland,) = [
+        row
+        for row in await locations.get_async(session, level="country")
+        if row.country == "Poland"
+    ]
+    assert poland.stories == 5
+
+
+def _routes(*routers: APIRouter) -> set[tuple[str, str]]:
+    return {
+        (re.sub(r":\w+}", "}", route.path), method)
+        for router in routers
+        for route in router.routes
+        if isinstance(route, APIRoute)
+        for method in route.methods
+    }
+
+
+def test_async_routes_match_sync_routes():
+    # `ASYNC_DATABASE` must not leave a route on the sync database
+    assert _routes(
+        async_shame_route.router,
+        async_shame_route.stats_router,
+        async_auth_route.router,
+    ) == _routes(shame_route.router, shame_route.stats_router, auth_route.router)
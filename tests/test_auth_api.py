@@ -5,6 +5,7 @@ from sqlalchemy.pool import StaticPool
 
 from shame.auth import repository as user_repo
 from shame.auth import schemas
+from shame.auth.cache import token_cache
 from shame.database import Base, get_database
 from shame.app import app
 
@@ -50,6 +51,38 @@ def startup():
 startup()
 
 
+def test_api_current_user_is_cached():
+    client.post(
+        "/signup",
+        json={"username": "cached", "email": "cached@gmail.com", "password": "2222"},
+    )
+    token = client.post(
+        "/login", data={"username": "cached", "password": "2222"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    hits = token_cache.hits
+    first = client.get("/users/me", headers=headers)
+    second = client.get("/users/me", headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    assert first.json()["username"] == "cached"
+    assert token_cache.hits == hits + 1
+
+
+def test_api_top_users():
+    responce = client.get("/users/", params={"limit": 5})
+    assert responce.status_code == 200
+
+    rated = [user["rating"] for user in responce.json()]
+    assert rated == sorted(rated, reverse=True)
+    assert "password_hashed" not in responce.json()[0]
+
+    responce = client.get("/users/me")
+    assert responce.status_code == 401
+
+
 # def test_api_user_login():
 #     responce = client.post("/login")
 #
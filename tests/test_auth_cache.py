@@ -0,0 +1,56 @@
+import time
+
+from shame.auth import schemas
+from shame.auth.cache import TokenCache
+
+
+def make_user(id: int) -> schemas.User:
+    return schemas.User(id=id, username=f"user{id}")
+
+
+def test_cache_hit_and_miss():
+    cache = TokenCache(maxsize=10)
+    assert cache.get("token") is None
+
+    cache.put("token", {"sub": "user1", "exp": time.time() + 60}, make_user(1))
+    entry = cache.get("token")
+
+    assert entry is not None
+    assert entry.user.username == "user1"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_expires_at_token_exp():
+    cache = TokenCache(maxsize=10)
+    cache.put("old", {"sub": "user1", "exp": time.time() - 1}, make_user(1))
+    cache.put("no-exp", {"sub": "user1"}, make_user(1))
+
+    assert cache.get("old") is None
+    assert cache.get("no-exp") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_cache_is_bounded():
+    cache = TokenCache(maxsize=2)
+    exp = time.time() + 60
+    for i in range(3):
+        cache.put(f"token{i}", {"sub": f"user{i}", "exp": exp}, make_user(i))
+
+    assert cache.get("token0") is None
+    assert cache.get("token2") is not None
+    assert cache.stats()["size"] == 2
+
+
+def test_cache_invalidate_user():
+    cache = TokenCache(maxsize=10)
+    exp = time.time() + 60
+    cache.put("a", {"sub": "user1", "exp": exp}, make_user(1))
+    cache.put("b", {"sub": "user1", "exp": exp}, make_user(1))
+    cache.put("c", {"sub": "user2", "exp": exp}, make_user(2))
+
+    cache.invalidate_user(1)
+
+    assert cache.get("a") is None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
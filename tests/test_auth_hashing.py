@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from shame.auth.hashing import HasherSaturated, PasswordHasher, get_context
+
+
+def test_hash_and_verify_in_process_pool():
+    hasher = PasswordHasher(rounds=4, workers=1, max_pending=4)
+    try:
+        hashed = hasher.hash("1111")
+
+        assert hashed.startswith("$2b$04$")
+        assert hasher.verify("1111", hashed)
+        assert not hasher.verify("2222", hashed)
+        assert hasher.stats()["pending"] == 0
+        assert hasher.stats()["completed"] == 3
+    finally:
+        hasher.shutdown()
+
+
+def test_verify_and_update_rehashes_outdated_cost():
+    outdated = get_context(4).hash("1111")
+    hasher = PasswordHasher(rounds=5, workers=0, max_pending=4)
+
+    valid, new_hash = hasher.verify_and_update("1111", outdated)
+    assert valid
+    assert new_hash is not None and new_hash.startswith("$2b$05$")
+
+    valid, new_hash = hasher.verify_and_update("1111", new_hash)
+    assert valid
+    assert new_hash is None
+
+
+def test_async_hash_does_not_block_event_loop():
+    hasher = PasswordHasher(rounds=4, workers=2, max_pending=8)
+
+    async def run():
+        hashes = await asyncio.gather(*(hasher.hash_async(str(i)) for i in range(4)))
+        return await asyncio.gather(
+            *(
+                hasher.verify_and_update_async(str(i), hashed)
+                for i, hashed in enumerate(hashes)
+            )
+        )
+
+    try:
+        assert all(valid for valid, _ in asyncio.run(run()))
+    finally:
+        hasher.shutdown()
+
+
+def test_saturated_hasher_rejects():
+    hasher = PasswordHasher(rounds=4, workers=0, max_pending=0)
+    with pytest.raises(HasherSaturated):
+        hasher.hash("1111")
+    assert hasher.stats()["rejected"] == 1
@@ -7,6 +7,7 @@ from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.pool import StaticPool
 
 from shame.auth import repository, schemas, utils
+from shame import versioning
 from shame.auth.models import User
 from shame.database import Base
 
@@ -136,6 +137,23 @@ def test_repo_update_user(db: Session):
     assert new_db_user.rating == 3
 
 
+def test_repo_update_user_versioned(db: Session):
+    updated = repository.update(
+        db=db, id=0, values=schemas.UserBase(username="tukiNew"), versions={1}
+    )
+    assert updated.version == 2
+
+    with pytest.raises(versioning.VersionConflict):
+        repository.update(
+            db=db, id=0, values=schemas.UserBase(username="stale"), versions={1}
+        )
+    with pytest.raises(NoResultFound):
+        repository.update(db=db, id=42, values=schemas.UserBase(username="nobody"))
+
+    db.expire_all()
+    assert repository.get_by_id(db=db, id=0).username == "tukiNew"
+
+
 def test_repo_delete_user(db: Session):
     db_user = repository.get_by_id(db=db, id=0)
     assert db_user is not None
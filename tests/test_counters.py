@@ -0,0 +1,85 @@
+from typing import Generator
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shame.counters import AgreeBuffer
+from shame.database import Base
+from shame.models import Address, ShameStory
+from shame.auth.models import User
+
+
+DATABASE_URL = "sqlite:///:memory:"
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+SessionTesting = sessionmaker(
+    bind=engine,
+    autocommit=False,
+    autoflush=False,
+)
+
+
+@pytest.fixture()
+def session() -> Generator[Session, None, None]:
+    session = SessionTesting()
+    Base.metadata.create_all(bind=engine)
+
+    session.add(User(id=0, username="tuki", password_hashed="1111"))
+    session.add(
+        Address(id=0, country="Ukraine", state="Lviv", city="Lviv", street="-")
+    )
+    for id in range(5):
+        session.add(
+            ShameStory(id=id, title="T", text="Text", author_id=0, address_id=0)
+        )
+    session.commit()
+
+    yield session
+
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_buffer_collapses_clicks_into_one_delta(session: Session):
+    buffer = AgreeBuffer(shards=4, max_batch=100)
+    for _ in range(50):
+        buffer.increment(1)
+    buffer.increment(2, 3)
+
+    assert buffer.pending() == 2
+    assert buffer.pending(1) == 50
+
+    assert buffer.flush(session) == 2
+    assert buffer.pending() == 0
+    assert session.get_one(ShameStory, 1).agree == 50
+    assert session.get_one(ShameStory, 2).agree == 3
+
+
+def test_buffer_flush_is_bounded(session: Session):
+    buffer = AgreeBuffer(shards=2, max_batch=2)
+    for id in range(5):
+        buffer.increment(id)
+
+    assert buffer.flush(session) == 2
+    assert buffer.pending() == 3
+    assert buffer.drain(session) == 3
+    session.expire_all()
+    assert all(story.agree == 1 for story in session.query(ShameStory))
+
+
+def test_buffer_restores_deltas_of_failed_flush(session: Session):
+    buffer = AgreeBuffer(shards=2, max_batch=10)
+    buffer.increment(1, 2)
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+    with pytest.raises(Exception):
+        buffer.flush(SessionTesting())
+    assert buffer.pending(1) == 2
+
+    Base.metadata.create_all(bind=engine)
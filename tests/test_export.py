@@ -0,0 +1,90 @@
+import csv
+import io
+import json
+from typing import Generator
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shame import export
+from shame.database import Base
+from shame.models import Address, ShameStory
+from shame.auth.models import User
+
+
+DATABASE_URL = "sqlite:///:memory:"
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+SessionTesting = sessionmaker(
+    bind=engine,
+    autocommit=False,
+    autoflush=False,
+)
+
+
+@pytest.fixture()
+def session() -> Generator[Session, None, None]:
+    session = SessionTesting()
+    Base.metadata.create_all(bind=engine)
+
+    session.add(User(id=0, username="tuki", password_hashed="1111"))
+    session.add(
+        Address(
+            id=0,
+            country="Ukraine",
+            state="Lviv",
+            city="Lviv",
+            street="Hrinchenka, 14a",
+        )
+    )
+    for id in range(1, 8):
+        session.add(
+            ShameStory(
+                id=id,
+                title=f"Story {id}",
+                text="Line one,\nline \"two\"",
+                agree=id,
+                author_id=0,
+                address_id=0,
+            )
+        )
+    session.commit()
+
+    yield session
+
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_export_ndjson_in_partitions(session: Session):
+    chunks = list(export.iter_export(session, "ndjson", yield_per=3))
+    assert len(chunks) == 3
+
+    rows = [json.loads(line) for line in b"".join(chunks).decode().splitlines()]
+    assert [row["id"] for row in rows] == list(range(1, 8))
+    assert rows[0]["author_username"] == "tuki"
+    assert rows[0]["city"] == "Lviv"
+    assert rows[0]["text"] == "Line one,\nline \"two\""
+
+
+def test_export_csv(session: Session):
+    data = b"".join(export.iter_export(session, "csv", yield_per=2)).decode()
+    rows = list(csv.DictReader(io.StringIO(data)))
+
+    assert len(rows) == 7
+    assert list(rows[0]) == export.HEADER
+    assert rows[6]["agree"] == "7"
+    assert rows[6]["text"] == "Line one,\nline \"two\""
+
+
+def test_export_empty_csv_has_header(session: Session):
+    session.query(ShameStory).delete()
+    session.commit()
+
+    data = b"".join(export.iter_export(session, "csv")).decode()
+    assert data.strip() == ",".join(export.HEADER)
@@ -0,0 +1,132 @@
+import json
+from typing import Generator
+
+import pytest
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shame import ingest
+from shame.database import Base
+from shame.models import Address, ShameStory
+from shame.auth.models import User
+
+
+DATABASE_URL = "sqlite:///:memory:"
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+SessionTesting = sessionmaker(
+    bind=engine,
+    autocommit=False,
+    autoflush=False,
+)
+
+
+@pytest.fixture()
+def session() -> Generator[Session, None, None]:
+    session = SessionTesting()
+    Base.metadata.create_all(bind=engine)
+
+    session.add(User(id=0, username="tuki", password_hashed="1111"))
+    session.add(
+        Address(
+            id=0,
+            country="Ukraine",
+            state="Lviv",
+            city="Lviv",
+            street="Hrinchenka, 14a",
+        )
+    )
+    session.commit()
+
+    yield session
+
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture()
+def foreign_keys(session: Session) -> Generator[None, None, None]:
+    """SQLite checks foreign keys only when asked to"""
+    session.execute(text("PRAGMA foreign_keys = ON"))
+    session.commit()
+    yield
+    session.execute(text("PRAGMA foreign_keys = OFF"))
+    session.commit()
+
+
+def make_line(i: int, city: str) -> str:
+    return json.dumps(
+        {
+            "shamestory": {"title": f"Story {i}", "text": "Lorem ipsum"},
+            "address": {
+                "country": "Ukraine",
+                "state": city,
+                "city": city,
+                "street": "Hrinchenka, 14a",
+            },
+            "author_id": 0,
+        }
+    )
+
+
+def test_import_lines_in_chunks(session: Session):
+    cities = ["Lviv", "Kyiv", "Odesa"]
+    lines = (make_line(i, cities[i % 3]) for i in range(25))
+
+    report = ingest.import_lines(session, lines, chunk_size=10)
+
+    assert report.rows == 25
+    assert report.inserted == 25
+    assert report.errors == []
+    assert report.rows_per_second > 0
+    assert session.scalar(select(func.count()).select_from(ShameStory)) == 25
+    # Lviv already existed, Kyiv and Odesa were created once each
+    assert session.scalar(select(func.count()).select_from(Address)) == 3
+
+
+def test_import_reports_bad_rows(session: Session):
+    lines = [
+        make_line(0, "Lviv"),
+        "{not json",
+        "",
+        json.dumps({"shamestory": {"title": "No address", "text": "-"}}),
+        make_line(1, "Lviv").replace('"author_id": 0', '"author_id": null'),
+        make_line(2, "Lviv"),
+    ]
+
+    report = ingest.import_lines(session, lines)
+
+    assert report.rows == 5
+    assert report.inserted == 2
+    assert [error.line for error in report.errors] == [2, 4, 5]
+
+
+def test_import_uses_given_author(session: Session):
+    session.add(User(id=7, username="importer", password_hashed="-"))
+    session.commit()
+
+    ingest.import_lines(session, [make_line(0, "Lviv")], author_id=7)
+
+    story = session.scalars(select(ShameStory)).one()
+    assert story.author_id == 7
+    assert story.address_id == 0
+
+
+def test_import_retries_a_failed_chunk_row_by_row(
+    session: Session, foreign_keys: None
+):
+    lines = [make_line(i, "Lviv") for i in range(5)]
+    # no such user: the chunk fails on the foreign key
+    lines[2] = lines[2].replace('"author_id": 0', '"author_id": 99')
+
+    report = ingest.import_lines(session, lines)
+
+    assert report.rows == 5
+    assert report.inserted == 4
+    assert [error.line for error in report.errors] == [3]
+    titles = session.scalars(select(ShameStory.title).order_by(ShameStory.id)).all()
+    assert titles == ["Story 0", "Story 1", "Story 3", "Story 4"]
@@ -0,0 +1,158 @@
+import random
+from typing import Generator
+
+import pytest
+import sqlalchemy
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shame import leaderboard, repository, schemas
+from shame.auth.models import User
+from shame.database import Base
+from shame.leaderboard import Board, Leaderboard
+from shame.models import Address, ShameStory
+
+
+DATABASE_URL = "sqlite:///:memory:"
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+SessionTesting = sessionmaker(
+    bind=engine,
+    autocommit=False,
+    autoflush=False,
+)
+
+
+@pytest.fixture()
+def session() -> Generator[Session, None, None]:
+    session = SessionTesting()
+    Base.metadata.create_all(bind=engine)
+
+    session.add(User(id=1, username="tuki", password_hashed="1111"))
+    session.add(
+        Address(id=1, country="Ukraine", state="Lviv", city="Lviv", street="-")
+    )
+    session.add(
+        Address(id=2, country="Poland", state="Mazovia", city="Warsaw", street="-")
+    )
+    session.commit()
+
+    yield session
+
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture()
+def board(monkeypatch) -> Leaderboard:
+    board = Leaderboard(size=2, capacity=3)
+    monkeypatch.setattr(leaderboard, "top_stories", board)
+    return board
+
+
+def expected(agree: dict[int, int], limit: int) -> list[tuple[int, int]]:
+    ranked = sorted(agree.items(), key=lambda item: (-item[1], item[0]))
+    return ranked[:limit]
+
+
+def test_board_matches_a_full_sort():
+    rng = random.Random(7)
+    agree = {story_id: rng.randrange(50) for story_id in range(200)}
+    rows = expected(agree, 11)
+    board = Board(capacity=10, bound=(-rows[10][1], rows[10][0]))
+    for story_id, count in rows[:10]:
+        board.offer(story_id, count)
+
+    for _ in range(2000):
+        story_id = rng.randrange(250)
+        if rng.random() < 0.1:
+            agree.pop(story_id, None)
+            board.remove(story_id)
+        else:
+            agree[story_id] = agree.get(story_id, 0) + rng.randrange(1, 4)
+            board.offer(story_id, agree[story_id])
+
+        top = board.top(5)
+        if top is not None:
+            assert top == expected(agree, 5)
+    assert len(board) <= 10
+
+
+def test_board_asks_for_reload_once_drained():
+    board = Board(capacity=2, bound=(-1, 3))
+    board.offer(1, 5)
+    board.offer(2, 4)
+
+    board.remove(1)
+
+    assert board.top(1) == [(2, 4)]
+    assert board.top(2) is None
+
+
+def add(session: Session, address_id: int) -> int:
+    return repository.add(
+        session,
+        schemas.CreateShameStory(title="Title", text="Text"),
+        author_id=1,
+        address_id=address_id,
+    ).id
+
+
+def test_leaderboard_loads_and_follows_flushes(session: Session, board: Leaderboard):
+    ids = [add(session, address_id) for address_id in (1, 1, 1, 2, 2)]
+    repository.apply_agree_deltas(session, {ids[0]: 1, ids[1]: 5, ids[3]: 3})
+
+    assert leaderboard.top(session, limit=2) == [(ids[1], 5), (ids[3], 3)]
+    assert leaderboard.top(session, limit=2, country="Poland") == [
+        (ids[3], 3),
+        (ids[4], 0),
+    ]
+    assert leaderboard.top(session, limit=2, country="Chile") == []
+    assert board.loads == 1
+
+    repository.apply_agree_deltas(session, {ids[2]: 9})
+    leaderboard.refresh(session, [ids[2]])
+    board.remove(ids[1])
+
+    assert board.top(2) == [(ids[2], 9), (ids[3], 3)]
+    assert board.top(2, country="Ukraine") == [(ids[2], 9), (ids[0], 1)]
+    assert board.loads == 1
+
+
+def test_catch_up_picks_up_other_flushes_without_reload(
+    session: Session, board: Leaderboard
+):
+    ids = [add(session, address_id) for address_id in (1, 1, 2, 2, 2)]
+    leaderboard.load(session)
+    # flushed by another worker: nothing here refreshes the boards
+    repository.apply_agree_deltas(session, {ids[0]: 2, ids[4]: 7})
+    session.commit()
+    assert board.top(1) != [(ids[4], 7)]
+
+    leaderboard.catch_up(session)
+
+    assert board.top(2) == [(ids[4], 7), (ids[0], 2)]
+    assert board.top(1, country="Ukraine") == [(ids[0], 2)]
+    assert board.loads == 1
+
+
+def test_catch_up_drops_stories_deleted_elsewhere(
+    session: Session, board: Leaderboard
+):
+    ids = [add(session, address_id) for address_id in (1, 1, 2)]
+    repository.apply_agree_deltas(session, {ids[0]: 5, ids[1]: 3, ids[2]: 1})
+    session.commit()
+    leaderboard.load(session)
+    # deleted by another worker: nothing here removes it from the boards
+    session.execute(sqlalchemy.delete(ShameStory).where(ShameStory.id == ids[0]))
+    session.commit()
+
+    leaderboard.catch_up(session)
+
+    assert ids[0] not in board.story_ids()
+    assert board.top(2) == [(ids[1], 3), (ids[2], 1)]
+    assert board.top(1, country="Ukraine") == [(ids[1], 3)]
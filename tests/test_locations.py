@@ -0,0 +1,122 @@
+from typing import Generator
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shame import locations, repository, schemas
+from shame.database import Base
+from shame.models import Address, LocationStats
+from shame.auth.models import User
+
+
+DATABASE_URL = "sqlite:///:memory:"
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+SessionTesting = sessionmaker(
+    bind=engine,
+    autocommit=False,
+    autoflush=False,
+)
+
+PLACES = [
+    ("Ukraine", "Lviv", "Lviv"),
+    ("Ukraine", "Lviv", "Drohobych"),
+    ("Ukraine", "Kyiv", "Kyiv"),
+    ("Poland", "Mazovia", "Warsaw"),
+]
+
+
+@pytest.fixture()
+def session() -> Generator[Session, None, None]:
+    session = SessionTesting()
+    Base.metadata.create_all(bind=engine)
+
+    session.add(User(id=1, username="tuki", password_hashed="1111"))
+    for id, (country, state, city) in enumerate(PLACES, start=1):
+        session.add(
+            Address(id=id, country=country, state=state, city=city, street="-")
+        )
+    session.commit()
+
+    yield session
+
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def add(session: Session, address_id: int) -> int:
+    return repository.add(
+        session,
+        schemas.CreateShameStory(title="Title", text="Text"),
+        author_id=1,
+        address_id=address_id,
+    ).id
+
+
+def snapshot(session: Session) -> set[tuple]:
+    return {
+        (row.level, row.country, row.state, row.city, row.stories, row.agree)
+        for row in session.scalars(select(LocationStats))
+        if row.stories
+    }
+
+
+def test_location_stats_follow_story_writes(session: Session):
+    lviv = add(session, 1)
+    add(session, 1)
+    drohobych = add(session, 2)
+    warsaw = add(session, 4)
+
+    repository.apply_agree_deltas(session, {lviv: 5, drohobych: 2, warsaw: 1})
+    repository.delete(session, warsaw)
+
+    by_country = locations.get(session, level="country")
+    assert [(row.country, row.stories, row.agree) for row in by_country] == [
+        ("Ukraine", 3, 7)
+    ]
+    by_city = locations.get(session, level="city")
+    assert [(row.city, row.stories, row.agree) for row in by_city] == [
+        ("Lviv", 2, 5),
+        ("Drohobych", 1, 2),
+    ]
+    state = locations.get(session, level="state")[0]
+    assert (state.country, state.state, state.city) == ("Ukraine", "Lviv", "")
+
+
+def test_location_stats_rebuild_matches_incremental(session: Session):
+    ids = [add(session, address_id) for address_id in (1, 2, 3, 3, 4)]
+    repository.apply_agree_deltas(session, {ids[0]: 3, ids[2]: 4, ids[3]: -1})
+    repository.delete(session, ids[4])
+    repository.add_many(
+        session,
+        [{"title": "Bulk", "text": "-", "author_id": 1, "address_id": 4}] * 2,
+    )
+    session.commit()
+    incremental = snapshot(session)
+
+    with engine.begin() as connection:
+        locations.rebuild(connection)
+
+    assert snapshot(session) == incremental
+    assert ("country", "Poland", "", "", 2, 0) in incremental
+
+
+def test_location_stats_without_on_conflict(session: Session, monkeypatch):
+    # a dialect `upsert_insert` knows no `ON CONFLICT` for
+    monkeypatch.setattr(locations, "upsert_insert", lambda dialect, table: None)
+    ids = [add(session, address_id) for address_id in (1, 1, 2, 4)]
+    repository.apply_agree_deltas(session, {ids[0]: 3, ids[2]: 4})
+    repository.delete(session, ids[3])
+    session.commit()
+    incremental = snapshot(session)
+
+    with engine.begin() as connection:
+        locations.rebuild(connection)
+
+    assert snapshot(session) == incremental
+    assert ("city", "Ukraine", "Lviv", "Lviv", 2, 3) in incremental
@@ -0,0 +1,198 @@
+import pytest
+import sqlalchemy
+from sqlalchemy import create_engine, event
+
+from shame import migrations, models
+from shame.auth import models as auth_models
+from shame.database import Base
+
+
+@pytest.fixture()
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+    yield engine
+    engine.dispose()
+
+
+def record_statements(engine) -> list[str]:
+    statements: list[str] = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    return statements
+
+
+def test_bootstrap_creates_schema_once(engine):
+    assert migrations.bootstrap(engine).migrated
+
+    names = sqlalchemy.inspect(engine).get_table_names()
+    assert {"Users", "Addresses", "ShameStories", "SchemaVersion"} <= set(names)
+
+    statements = record_statements(engine)
+    assert not migrations.bootstrap(engine).migrated
+    assert statements
+    assert not any(
+        statement.lstrip().upper().startswith(("CREATE", "ALTER", "DROP", "INSERT"))
+        for statement in statements
+    )
+
+
+def test_bootstrap_keeps_data(engine):
+    migrations.bootstrap(engine)
+    with engine.begin() as connection:
+        connection.execute(
+            sqlalchemy.insert(models.Address).values(
+                country="Ukraine", state="Lviv", city="Lviv", street="Kept"
+            )
+        )
+
+    # a new step changes the fingerprint, which reruns every step
+    with engine.begin() as connection:
+        assert migrations.bootstrap_connection(
+            connection,
+            migrations=(*migrations.MIGRATIONS, ("noop", lambda connection: None)),
+        )
+
+    with engine.connect() as connection:
+        assert connection.scalar(sqlalchemy.select(models.Address.street)) == "Kept"
+
+
+def test_bootstrap_upgrades_an_older_schema(engine):
+    with engine.begin() as connection:
+        connection.execute(
+            sqlalchemy.text(
+                'CREATE TABLE "Addresses" (id INTEGER PRIMARY KEY, country VARCHAR,'
+                " state VARCHAR, city VARCHAR, street VARCHAR)"
+            )
+        )
+        connection.execute(
+            sqlalchemy.text(
+                'CREATE TABLE "ShameStories" (id INTEGER PRIMARY KEY,'
+                " title VARCHAR(50), text VARCHAR, agree INTEGER,"
+                " address_id INTEGER, author_id INTEGER)"
+            )
+        )
+        connection.execute(
+            sqlalchemy.text(
+                'INSERT INTO "ShameStories" (title, text, agree, address_id, author_id)'
+                " VALUES ('Old', 'Story before search', 0, 1, 1)"
+            )
+        )
+
+    assert migrations.bootstrap(engine).migrated
+
+    inspector = sqlalchemy.inspect(engine)
+    indexes = {index["name"] for index in inspector.get_indexes("ShameStories")}
+    assert "ix_ShameStories_agree_id" in indexes
+    assert "uq_Addresses_location" in {
+        index["name"] for index in inspector.get_indexes("Addresses")
+    }
+    with engine.connect() as connection:
+        hits = connection.execute(
+            sqlalchemy.text('SELECT rowid FROM "ShameStoriesSearch" WHERE title MATCH :q'),
+            {"q": "old"},
+        ).all()
+    assert len(hits) == 1
+
+
+def test_bootstrap_merges_duplicate_addresses(engine):
+    with engine.begin() as connection:
+        connection.execute(
+            sqlalchemy.text(
+                'CREATE TABLE "Addresses" (id INTEGER PRIMARY KEY, country VARCHAR,'
+                " state VARCHAR, city VARCHAR, street VARCHAR)"
+            )
+        )
+        connection.execute(
+            sqlalchemy.text(
+                'CREATE TABLE "ShameStories" (id INTEGER PRIMARY KEY,'
+                " title VARCHAR(50), text VARCHAR, agree INTEGER,"
+                " address_id INTEGER, author_id INTEGER)"
+            )
+        )
+        connection.execute(
+            sqlalchemy.text(
+                'INSERT INTO "Addresses" (id, country, state, city, street) VALUES'
+                " (1, 'Ukraine', 'Lviv', 'Lviv', 'Shevchenka 1'),"
+                " (2, 'Ukraine', 'Lviv', 'Lviv', ' Shevchenka  1'),"
+                " (3, 'Ukraine', 'Kyiv', 'Kyiv', 'Khreshchatyk'),"
+                " (4, ' Ukraine', 'Kyiv', 'Kyiv ', 'Khreshchatyk'),"
+                " (5, 'Ukraine', 'Kyiv', 'Kyiv', 'Khreshchatyk')"
+            )
+        )
+        connection.execute(
+            sqlalchemy.text(
+                'INSERT INTO "ShameStories" (title, text, agree, address_id, author_id)'
+                " VALUES ('a', '-', 1, 1, 1), ('b', '-', 2, 2, 1),"
+                " ('c', '-', 3, 4, 1), ('d', '-', 4, 5, 1)"
+            )
+        )
+
+    assert migrations.bootstrap(engine).migrated
+
+    with engine.connect() as connection:
+        addresses = connection.execute(
+            sqlalchemy.select(models.Address.id, models.Address.street)
+            .order_by(models.Address.id)
+        ).all()
+        story_addresses = connection.scalars(
+            sqlalchemy.select(models.ShameStory.address_id)
+            .order_by(models.ShameStory.id)
+        ).all()
+        cities = dict(
+            connection.execute(
+                sqlalchemy.select(
+                    models.LocationStats.city, models.LocationStats.stories
+                ).where(models.LocationStats.level == "city")
+            ).all()
+        )
+    assert addresses == [(1, "Shevchenka 1"), (3, "Khreshchatyk")]
+    assert story_addresses == [1, 1, 3, 3]
+    assert cities == {"Lviv": 2, "Kyiv": 2}
+    assert "uq_Addresses_location" in {
+        index["name"] for index in sqlalchemy.inspect(engine).get_indexes("Addresses")
+    }
+
+
+def test_bootstrap_reconciles_ratings_once(engine):
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(
+            sqlalchemy.insert(auth_models.User).values(
+                id=1, username="tuki", password_hashed="-", rating=0
+            )
+        )
+        connection.execute(
+            sqlalchemy.insert(models.ShameStory).values(
+                title="-", text="-", agree=5, author_id=1, address_id=1
+            )
+        )
+    rating = sqlalchemy.select(auth_models.User.rating)
+
+    migrations.bootstrap(engine)
+    with engine.begin() as connection:
+        assert connection.scalar(rating) == 5
+        connection.execute(sqlalchemy.update(auth_models.User).values(rating=99))
+
+    with engine.begin() as connection:
+        assert migrations.bootstrap_connection(
+            connection,
+            migrations=(*migrations.MIGRATIONS, ("noop", lambda connection: None)),
+        )
+    with engine.connect() as connection:
+        assert connection.scalar(rating) == 99
+
+
+def test_fingerprint_tracks_metadata():
+    assert migrations.fingerprint() == migrations.fingerprint()
+
+    metadata = sqlalchemy.MetaData()
+    for table in Base.metadata.tables.values():
+        table.to_metadata(metadata)
+    sqlalchemy.Table(
+        "ShameStories", metadata, sqlalchemy.Column("extra", sqlalchemy.Integer),
+        extend_existing=True,
+    )
+    assert migrations.fingerprint(metadata) != migrations.fingerprint()
@@ -0,0 +1,75 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+
+from shame.pool import PoolMonitor
+
+
+@pytest.fixture()
+def monitored(tmp_path):
+    monitor = PoolMonitor(trace_checkouts=True)
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=monitor.pool_class(QueuePool),
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    monitor.listen(engine)
+    yield monitor, engine
+    engine.dispose()
+
+
+def test_pool_tracks_checkouts_with_stack(monitored):
+    monitor, engine = monitored
+
+    connection = engine.connect()
+    connection.execute(text("SELECT 1"))
+
+    stats = monitor.stats()
+    assert stats["checked_out"] == 1
+    assert stats["size"] == 1
+    held = monitor.checked_out()
+    assert any("test_pool_tracks_checkouts_with_stack" in line for line in held[0]["stack"])
+
+    connection.close()
+
+    assert monitor.stats()["checked_out"] == 0
+    assert monitor.stats()["checkouts"] == 1
+    assert monitor.checked_out() == []
+
+
+def test_pool_counts_waits_and_timeouts(monitored):
+    monitor, engine = monitored
+
+    with engine.connect():
+        with pytest.raises(TimeoutError):
+            engine.connect()
+
+    stats = monitor.stats()
+    assert stats["timeouts"] == 1
+    assert stats["waits"] == 2
+    assert stats["max_wait_seconds"] >= 0.05
+
+
+def test_pool_monitor_survives_dispose(monitored):
+    monitor, engine = monitored
+
+    engine.dispose()
+    with engine.connect():
+        assert monitor.stats()["checked_out"] == 1
+    assert monitor.stats()["waits"] == 1
+
+
+def test_pool_skips_stacks_by_default(tmp_path):
+    monitor = PoolMonitor()
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}")
+    monitor.listen(engine)
+
+    with engine.connect():
+        held = monitor.checked_out()
+    engine.dispose()
+
+    assert [checkout["stack"] for checkout in held] == [[]]
+    assert monitor.stats()["checkouts"] == 1
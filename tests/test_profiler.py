@@ -0,0 +1,83 @@
+import json
+import logging
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+from shame import profiler
+from shame.config.settings import settings
+
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+profiler.install()
+
+app = FastAPI()
+app.add_middleware(profiler.SQLProfilerMiddleware, repeat_threshold=3)
+
+
+@app.get("/queries/{count}")
+def run_queries(count: int):
+    with engine.connect() as connection:
+        for i in range(count):
+            connection.execute(text("SELECT :i"), {"i": i})
+    return {"count": count}
+
+
+@app.get("/async")
+async def run_nothing():
+    return {}
+
+
+client = TestClient(app)
+
+
+def test_profiler_server_timing():
+    responce = client.get("/queries/2")
+    assert responce.status_code == 200
+
+    timing = responce.headers["server-timing"]
+    assert timing.startswith("db;dur=")
+    assert 'desc="2 queries"' in timing
+    assert "sql-1;dur=" in timing
+    assert "SELECT ?" in timing
+
+    responce = client.get("/async")
+    assert 'desc="0 queries"' in responce.headers["server-timing"]
+
+
+def test_profiler_reports_repeated_statements(caplog):
+    with caplog.at_level(logging.WARNING, logger="shame.profiler"):
+        client.get("/queries/2")
+        assert not caplog.records
+
+        client.get("/queries/3")
+
+    report = json.loads(caplog.records[0].getMessage())
+    assert report["event"] == "likely_n_plus_one"
+    assert report["path"] == "/queries/3"
+    assert report["count"] == 3
+
+
+def test_profiler_slow_query_log(caplog, monkeypatch):
+    monkeypatch.setattr(settings, "SLOW_QUERY_THRESHOLD_MS", 1e-9)
+
+    with caplog.at_level(logging.WARNING, logger="shame.sql.slow"):
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+    entry = json.loads(caplog.records[-1].getMessage())
+    assert entry["event"] == "slow_query"
+    assert entry["statement"] == "SELECT 1"
+
+
+def test_profiler_records_nothing_outside_requests():
+    assert profiler.current_profile() is None
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    assert profiler.current_profile() is None
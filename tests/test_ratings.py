@@ -0,0 +1,86 @@
+from typing import Generator
+
+import pytest
+import sqlalchemy
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shame import ratings, repository, schemas
+from shame.auth import repository as user_repo
+from shame.auth.models import User
+from shame.database import Base
+from shame.models import Address
+
+
+DATABASE_URL = "sqlite:///:memory:"
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+SessionTesting = sessionmaker(
+    bind=engine,
+    autocommit=False,
+    autoflush=False,
+)
+
+
+@pytest.fixture()
+def session() -> Generator[Session, None, None]:
+    session = SessionTesting()
+    Base.metadata.create_all(bind=engine)
+
+    for id, username in enumerate(["tuki", "chyvek", "shyno"], start=1):
+        session.add(User(id=id, username=username, password_hashed="-"))
+    session.add(
+        Address(id=1, country="Ukraine", state="Lviv", city="Lviv", street="-")
+    )
+    session.commit()
+
+    yield session
+
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def add(session: Session, author_id: int) -> int:
+    return repository.add(
+        session,
+        schemas.CreateShameStory(title="Title", text="Text"),
+        author_id=author_id,
+        address_id=1,
+    ).id
+
+
+def rating(session: Session) -> dict[str, int]:
+    session.expire_all()
+    users = session.scalars(sqlalchemy.select(User))
+    return {user.username: user.rating for user in users}
+
+
+def test_rating_follows_agree_and_delete(session: Session):
+    first, second, third = add(session, 1), add(session, 1), add(session, 2)
+
+    repository.apply_agree_deltas(session, {first: 3, second: 4, third: 2})
+    repository.apply_agree_deltas(session, {second: 1})
+    assert rating(session) == {"tuki": 8, "chyvek": 2, "shyno": 0}
+
+    repository.delete(session, second)
+    assert rating(session) == {"tuki": 3, "chyvek": 2, "shyno": 0}
+
+    top = user_repo.get_top(session, limit=2)
+    assert [user.username for user in top] == ["tuki", "chyvek"]
+
+
+def test_reconcile_fixes_drift(session: Session):
+    story = add(session, 2)
+    repository.apply_agree_deltas(session, {story: 5})
+    session.execute(sqlalchemy.update(User).values(rating=42))
+    session.commit()
+
+    with engine.begin() as connection:
+        assert ratings.reconcile(connection, batch_size=2) == 3
+        assert ratings.reconcile(connection, batch_size=2) == 0
+
+    assert rating(session) == {"tuki": 0, "chyvek": 5, "shyno": 0}
@@ -0,0 +1,104 @@
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from starlette.requests import Request
+
+from shame import database, models
+from shame.auth import models as auth_models  # noqa: F401, registers `Users`
+from shame.database import Base, get_database
+from shame.replicas import ReplicaSet
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_engine(path, title):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(
+            models.ShameStory.__table__.insert().values(
+                id=1, title=title, text="-", author_id=0, address_id=0
+            )
+        )
+    return engine
+
+
+@pytest.fixture()
+def engines(tmp_path):
+    primary = make_engine(tmp_path / "primary.db", "primary")
+    replica = make_engine(tmp_path / "replica.db", "replica")
+    yield primary, replica
+    primary.dispose()
+    replica.dispose()
+
+
+def request(method: str, token: str | None = None) -> Request:
+    headers = [] if token is None else [(b"authorization", f"Bearer {token}".encode())]
+    return Request(
+        {"type": "http", "method": method, "headers": headers, "client": ("10.0.0.1", 1)}
+    )
+
+
+def read_title(method: str, token: str | None = None) -> str:
+    dependency = get_database(request(method, token))
+    db = next(dependency)
+    try:
+        return db.scalars(select(models.ShameStory.title)).one()
+    finally:
+        dependency.close()
+
+
+def test_replica_set_round_robin_and_fallback(engines, tmp_path):
+    primary, replica = engines
+    broken = create_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    replicas = ReplicaSet(primary, [replica, broken])
+
+    # nothing is probed on the request path: unchecked replicas get no reads
+    assert replicas.engine_for(read_only=True) is primary
+    replicas.check()
+
+    assert replicas.engine_for(read_only=False) is primary
+    assert [replicas.engine_for(read_only=True) for _ in range(4)] == [replica] * 4
+    assert [r["healthy"] for r in replicas.stats()["replicas"]] == [True, False]
+
+    replicas._replicas[0].healthy = False
+    assert replicas.engine_for(read_only=True) is primary
+    assert replicas.stats()["primary_fallback_reads"] == 2
+
+    # back in rotation once a probe passes again
+    replicas.check()
+    assert replicas.engine_for(read_only=True) is replica
+
+
+def test_get_database_routes_reads_to_replica(engines, monkeypatch):
+    primary, replica = engines
+    clock = Clock()
+    replicas = ReplicaSet(primary, [replica], sticky_seconds=5, clock=clock)
+    replicas.check()
+    monkeypatch.setattr(database, "replicas", replicas)
+
+    assert read_title("GET", "alice") == "replica"
+    assert read_title("POST", "alice") == "primary"
+
+    # read-your-writes: alice stays on the primary, bob does not
+    assert read_title("GET", "alice") == "primary"
+    assert read_title("GET", "bob") == "replica"
+    assert replicas.stats()["sticky_reads"] == 1
+    assert not any("alice" in client for client in replicas._sticky)
+
+    clock.now += 5
+    assert read_title("GET", "alice") == "replica"
+
+
+def test_get_database_without_replicas_uses_primary(engines, monkeypatch):
+    primary, _ = engines
+    monkeypatch.setattr(database, "replicas", ReplicaSet(primary))
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(primary))
+
+    assert read_title("GET") == "primary"
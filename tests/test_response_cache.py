@@ -0,0 +1,72 @@
+from shame.cache import ResponseCache, list_key, story_key
+
+
+def test_cache_hit_and_miss():
+    cache = ResponseCache(maxsize=10)
+    assert cache.get(story_key(1)) is None
+
+    put = cache.put(story_key(1), b'{"id":1}', story_ids=[1], generation=cache.generation)
+    entry = cache.get(story_key(1))
+
+    assert entry is not None
+    assert entry.body == b'{"id":1}'
+    assert entry.etag == put.etag
+    assert entry.etag.startswith('"') and entry.etag.endswith('"')
+    assert cache.stats()["hit_ratio"] == 0.5
+
+
+def test_cache_is_bounded():
+    cache = ResponseCache(maxsize=2)
+    for i in range(3):
+        cache.put(story_key(i), b"{}", story_ids=[i], generation=cache.generation)
+
+    assert cache.get(story_key(0)) is None
+    assert cache.get(story_key(2)) is not None
+    assert cache.stats()["size"] == 2
+
+
+def test_cache_invalidate_story_drops_its_pages_only():
+    cache = ResponseCache(maxsize=10)
+    cache.put(story_key(1), b"{}", story_ids=[1], generation=cache.generation)
+    cache.put(list_key(0, 2), b"[]", story_ids=[1, 2], generation=cache.generation)
+    cache.put(list_key(2, 2), b"[]", story_ids=[3, 4], generation=cache.generation)
+
+    cache.invalidate_story(1)
+
+    assert cache.get(story_key(1)) is None
+    assert cache.get(list_key(0, 2)) is None
+    assert cache.get(list_key(2, 2)) is not None
+
+
+def test_cache_invalidate_lists_keeps_stories():
+    cache = ResponseCache(maxsize=10)
+    cache.put(story_key(1), b"{}", story_ids=[1], generation=cache.generation)
+    cache.put(list_key(0, 20), b"[]", story_ids=[1], generation=cache.generation)
+
+    cache.invalidate_lists()
+
+    assert cache.get(story_key(1)) is not None
+    assert cache.get(list_key(0, 20)) is None
+
+
+def test_cache_skips_put_raced_by_invalidation():
+    cache = ResponseCache(maxsize=10)
+    generation = cache.generation
+    cache.invalidate_story(1)
+
+    cache.put(story_key(1), b"{}", story_ids=[1], generation=generation)
+
+    assert cache.get(story_key(1)) is None
+
+
+def test_cache_entries_expire_after_ttl(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr("shame.cache.time.monotonic", lambda: now)
+    cache = ResponseCache(maxsize=10, ttl=5)
+    cache.put(story_key(1), b"{}", story_ids=[1], generation=cache.generation)
+
+    now += 4
+    assert cache.get(story_key(1)) is not None
+    now += 1
+    assert cache.get(story_key(1)) is None
+    assert cache.stats()["size"] == 0
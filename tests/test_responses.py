@@ -0,0 +1,47 @@
+import json
+
+from fastapi.encoders import jsonable_encoder
+
+from shame import models, responses, schemas
+from shame.auth import models as auth_models  # noqa: F401, registers `Users`
+
+
+def story(id: int) -> models.ShameStory:
+    return models.ShameStory(
+        id=id, title=f"Історія {id}", text="Lorem", agree=id, author_id=0
+    )
+
+
+def test_render_matches_response_model():
+    stories = [story(1), story(2)]
+    response = responses.render(list[schemas.ShameStory], stories)
+
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == jsonable_encoder(
+        [schemas.ShameStory.model_validate(s) for s in stories]
+    )
+
+
+def test_render_keeps_expanded_fields():
+    expanded = schemas.ExpandedShameStory(
+        **schemas.ShameStory.model_validate(story(1)).model_dump(),
+        author=schemas.StoryAuthor(id=0, username="tuki"),
+    )
+    body = json.loads(
+        responses.dump(schemas.ShameStoryPage, {"items": [expanded, story(2)]})
+    )
+    assert body["items"][0]["author"] == {"id": 0, "username": "tuki"}
+    assert "author" not in body["items"][1]
+    assert body["next_cursor"] is None
+
+
+def test_adapter_built_once():
+    assert responses.adapter(list[schemas.ShameStory]) is responses.adapter(
+        list[schemas.ShameStory]
+    )
+
+
+def test_fast_json_response_renders_content():
+    response = responses.FastJSONResponse({"title": "Історія", "agree": [1, 2]})
+    assert json.loads(response.body) == {"title": "Історія", "agree": [1, 2]}
+    assert responses.FastJSONResponse(b'{"a":1}').body == b'{"a":1}'
@@ -0,0 +1,138 @@
+import json
+from typing import Generator
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from shame import ingest, repository, schemas, search
+from shame.database import Base
+from shame.models import Address
+from shame.auth.models import User
+from shame.pagination import SearchCursor
+
+
+DATABASE_URL = "sqlite:///:memory:"
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+SessionTesting = sessionmaker(
+    bind=engine,
+    autocommit=False,
+    autoflush=False,
+)
+
+
+@pytest.fixture()
+def session() -> Generator[Session, None, None]:
+    session = SessionTesting()
+    Base.metadata.create_all(bind=engine)
+
+    session.add(User(id=0, username="tuki", password_hashed="1111"))
+    session.add(
+        Address(id=0, country="Ukraine", state="Lviv", city="Lviv", street="-")
+    )
+    session.commit()
+
+    yield session
+
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def add(session: Session, title: str, text: str) -> int:
+    return repository.add(
+        session,
+        schemas.CreateShameStory(title=title, text=text),
+        author_id=0,
+        address_id=0,
+    ).id
+
+
+def hit_ids(session: Session, query: str, **kwargs) -> list[int]:
+    return [row[0].id for row in search.search(session, query, **kwargs)]
+
+
+def test_search_ranks_title_matches_first(session: Session):
+    in_text = add(session, "Bad service", "The coffee was cold and the waiter rude")
+    in_title = add(session, "Cold coffee", "Waited an hour for it")
+    add(session, "Nice park", "Nothing to complain about")
+
+    assert hit_ids(session, "coffee") == [in_title, in_text]
+    assert hit_ids(session, "complain") != []
+    assert hit_ids(session, "tea") == []
+
+
+def test_search_follows_update_and_delete(session: Session):
+    id = add(session, "Rude cashier", "Shouted at everyone")
+    assert hit_ids(session, "cashier") == [id]
+
+    repository.update(
+        session,
+        shamestory_id=id,
+        values=schemas.CreateShameStory(title="Rude driver", text="Shouted"),
+    )
+    assert hit_ids(session, "cashier") == []
+    assert hit_ids(session, "driver") == [id]
+
+    repository.delete(session, shamestory_id=id)
+    assert hit_ids(session, "driver") == []
+
+
+def test_search_keyset_pages(session: Session):
+    ids = {add(session, f"Queue {i}", "Long queue at the office") for i in range(7)}
+
+    seen: list[int] = []
+    cursor = None
+    while True:
+        rows = search.search(session, "queue", limit=3, after=cursor)
+        seen.extend(row[0].id for row in rows)
+        if len(rows) < 3:
+            break
+        cursor = SearchCursor(score=rows[-1].score, id=rows[-1][0].id)
+
+    assert sorted(seen) == sorted(ids)
+    assert len(seen) == len(set(seen))
+
+
+def test_search_quotes_query_syntax(session: Session):
+    id = add(session, "AND OR NOT", 'Text with "quotes" and stars*')
+    # unbalanced quotes and brackets would be FTS5 syntax errors unquoted
+    assert hit_ids(session, 'quotes" (') == [id]
+    assert hit_ids(session, "stars* missing") == []
+    assert hit_ids(session, '"quotes"') == [id]
+    assert hit_ids(session, "NOT") == [id]
+
+
+def test_search_indexes_bulk_import(session: Session):
+    add(session, "Before", "Imported later")
+    lines = [
+        json.dumps(
+            {
+                "shamestory": {"title": f"Imported {i}", "text": "Backfilled story"},
+                "address": {"country": "Ukraine", "state": "Lviv", "city": "Lviv", "street": "-"},
+                "author_id": 0,
+            }
+        )
+        for i in range(5)
+    ]
+    ingest.import_lines(session, lines, chunk_size=2)
+
+    assert len(hit_ids(session, "backfilled", limit=50)) == 5
+    assert len(hit_ids(session, "imported", limit=50)) == 6
+
+
+def test_search_statement_ranks_in_double_precision():
+    statement = search.search_statement(
+        "postgresql", "queue", limit=3, after=SearchCursor(score=-0.1, id=7)
+    )
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    # ORDER BY, the select list and the cursor comparison all use the float8 rank
+    assert sql.count("AS FLOAT(53))") == 3
+
+    with pytest.raises(search.SearchUnsupported):
+        search.search_statement("mysql", "queue", limit=3)
@@ -1,6 +1,6 @@
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
@@ -9,8 +9,10 @@ from shame import models, schemas
 from shame import repository as shame_repo
 from shame.auth import repository as user_repo
 from shame.auth import schemas as user_schemas
+from shame.counters import agree_buffer
 from shame.database import Base, get_database
 from shame.app import app
+from shame.config.settings import settings
 
 
 SQLITE_DB_URL = "sqlite:///:memory:"
@@ -72,6 +74,14 @@ def startup():
 startup()
 
 
+def auth_headers(username: str, password: str) -> dict[str, str]:
+    client.post("/signup", json={"username": username, "password": password})
+    token = client.post(
+        "/login", data={"username": username, "password": password}
+    ).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
 def test_api_runs():
     responce = client.get("/")
     assert responce.status_code == 200
@@ -122,12 +132,307 @@ def test_api_get_shamestories():
     assert item_1["author_id"] == 0
 
 
+def test_api_get_shamestories_feed():
+    responce = client.get("/shamestories/feed", params={"limit": 1})
+    assert responce.status_code == 200
+
+    first_page = responce.json()
+    assert len(first_page["items"]) == 1
+    assert first_page["next_cursor"] is not None
+
+    responce = client.get(
+        "/shamestories/feed",
+        params={"limit": 1, "cursor": first_page["next_cursor"]},
+    )
+    assert responce.status_code == 200
+    assert all(
+        item["id"] != first_page["items"][0]["id"]
+        for item in responce.json()["items"]
+    )
+
+
+def test_api_get_shamestories_expanded():
+    headers = auth_headers("expanded", "7777")
+    story = client.post(
+        "/shamestories/",
+        json={
+            "shamestory": {"title": "Expanded", "text": "With author and address"},
+            "address": {
+                "country": "Ukraine",
+                "state": "Kyiv",
+                "city": "Kyiv",
+                "street": "Khreshchatyk, 1",
+            },
+        },
+        headers=headers,
+    ).json()
+
+    responce = client.get(
+        "/shamestories/author/" + str(story["author_id"]),
+        params={"expand": "author,address"},
+    )
+    assert responce.status_code == 200
+
+    item = responce.json()["items"][0]
+    assert item["author"]["username"] == "expanded"
+    assert "email" not in item["author"]
+    assert item["address"]["street"] == "Khreshchatyk, 1"
+
+    responce = client.get(f"/shamestories/{story['id']}", params={"expand": "address"})
+    assert responce.status_code == 200
+    assert responce.json()["address"]["city"] == "Kyiv"
+    assert responce.json()["author"] is None
+
+    responce = client.get(f"/shamestories/{story['id']}")
+    assert "address" not in responce.json()
+
+    responce = client.get("/shamestories/", params={"expand": "password"})
+    assert responce.status_code == 400
+
+
+def test_api_get_shamestories_batch():
+    ids = [story["id"] for story in client.get("/shamestories/").json()[:2]]
+
+    responce = client.get(
+        "/shamestories/batch", params={"ids": f"{ids[1]},424242,{ids[0]}"}
+    )
+    assert responce.status_code == 200
+    assert [story["id"] for story in responce.json()["items"]] == [ids[1], ids[0]]
+    assert responce.json()["missing"] == [424242]
+
+    responce = client.get("/shamestories/batch", params={"ids": "1,two"})
+    assert responce.status_code == 400
+
+    responce = client.get(
+        "/shamestories/batch", params={"ids": ",".join(map(str, range(1000)))}
+    )
+    assert responce.status_code == 400
+
+
+def test_api_get_shamestories_fields():
+    responce = client.get("/shamestories/", params={"fields": "agree,title,id"})
+    assert responce.status_code == 200
+    assert responce.json()
+    assert all(set(story) == {"id", "title", "agree"} for story in responce.json())
+
+    author_id = client.get("/shamestories/").json()[0]["author_id"]
+    responce = client.get(
+        f"/shamestories/author/{author_id}", params={"fields": "title", "limit": 1}
+    )
+    assert responce.status_code == 200
+    assert [set(story) for story in responce.json()["items"]] == [{"title"}]
+
+    if responce.json()["next_cursor"] is not None:
+        responce = client.get(
+            f"/shamestories/author/{author_id}",
+            params={"fields": "title", "cursor": responce.json()["next_cursor"]},
+        )
+        assert responce.status_code == 200
+
+    responce = client.get("/shamestories/", params={"fields": "id,password"})
+    assert responce.status_code == 400
+
+    responce = client.get(
+        "/shamestories/", params={"fields": "id", "expand": "author"}
+    )
+    assert responce.status_code == 400
+
+
+def test_api_get_shamestories_feed_bad_cursor():
+    responce = client.get("/shamestories/feed", params={"cursor": "not-a-cursor"})
+    assert responce.status_code == 400
+
+
+def test_api_search_shamestories():
+    responce = client.get("/shamestories/search", params={"q": "lorem", "limit": 1})
+    assert responce.status_code == 200
+
+    page = responce.json()
+    assert len(page["items"]) == 1
+    assert "Lorem" in page["items"][0]["title"]
+
+    if page["next_cursor"] is not None:
+        responce = client.get(
+            "/shamestories/search",
+            params={"q": "lorem", "cursor": page["next_cursor"]},
+        )
+        assert responce.status_code == 200
+
+    assert client.get("/shamestories/search", params={"q": ""}).status_code == 422
+
+
 def test_api_get_shamestory_by_id():
     shamestory_id = 1
     responce = client.get(f"/shamestories/{shamestory_id}")
     assert responce.status_code == 200
 
 
+def post_story(headers: dict[str, str], title: str) -> int:
+    responce = client.post(
+        "/shamestories/",
+        json={
+            "shamestory": {"title": title, "text": "Lorem ipsum"},
+            "address": {
+                "country": "Ukraine",
+                "state": "Lviv",
+                "city": "Lviv",
+                "street": "Hrinchenka, 14a",
+            },
+        },
+        headers=headers,
+    )
+    assert responce.status_code == 200
+    return responce.json()["id"]
+
+
+def test_api_get_shamestory_conditional():
+    headers = auth_headers("editor", "6666")
+    shamestory_id = post_story(headers, "Conditional")
+
+    responce = client.get(f"/shamestories/{shamestory_id}")
+    assert responce.status_code == 200
+    etag = responce.headers["etag"]
+    assert "max-age" in responce.headers["cache-control"]
+
+    responce = client.get(
+        f"/shamestories/{shamestory_id}", headers={"If-None-Match": etag}
+    )
+    assert responce.status_code == 304
+    assert responce.content == b""
+
+    client.put(
+        f"/shamestories/{shamestory_id}",
+        json={"title": "Conditional", "text": "Edited"},
+        headers=headers,
+    )
+    responce = client.get(
+        f"/shamestories/{shamestory_id}", headers={"If-None-Match": etag}
+    )
+    assert responce.status_code == 200
+    assert responce.json()["text"] == "Edited"
+    assert responce.headers["etag"] != etag
+
+
+def test_api_patch_shamestory_if_match():
+    headers = auth_headers("patcher", "9999")
+    shamestory_id = post_story(headers, "Patched")
+    etag = client.get(f"/shamestories/{shamestory_id}").headers["etag"]
+
+    responce = client.patch(
+        f"/shamestories/{shamestory_id}",
+        json={"text": "Only the text"},
+        headers={**headers, "If-Match": etag},
+    )
+    assert responce.status_code == 200
+    assert responce.json()["title"] == "Patched"
+    assert responce.json()["text"] == "Only the text"
+    new_etag = responce.headers["etag"]
+    assert new_etag != etag
+    assert client.get(f"/shamestories/{shamestory_id}").headers["etag"] == new_etag
+
+    # a second edit from the first read is a lost update
+    responce = client.patch(
+        f"/shamestories/{shamestory_id}",
+        json={"title": "Stale"},
+        headers={**headers, "If-Match": etag},
+    )
+    assert responce.status_code == 412
+    assert client.get(f"/shamestories/{shamestory_id}").json()["title"] == "Patched"
+
+    responce = client.patch(
+        f"/shamestories/{shamestory_id}",
+        json={"title": "Stranger"},
+        headers=auth_headers("stranger", "1010"),
+    )
+    assert responce.status_code == 403
+
+    responce = client.patch(
+        "/shamestories/424242", json={"title": "Missing"}, headers=headers
+    )
+    assert responce.status_code == 404
+
+    responce = client.patch(f"/shamestories/{shamestory_id}", json={}, headers=headers)
+    assert responce.status_code == 422
+
+    responce = client.patch(
+        f"/shamestories/{shamestory_id}", json={"title": None}, headers=headers
+    )
+    assert responce.status_code == 422
+
+
+def test_api_patch_shamestory_reads_no_row_back():
+    headers = auth_headers("counted", "1212")
+    shamestory_id = post_story(headers, "Counted")
+    client.get("/users/me", headers=headers)
+    statements: list[str] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        responce = client.patch(
+            f"/shamestories/{shamestory_id}", json={"text": "Once"}, headers=headers
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert responce.status_code == 200
+    assert responce.json()["text"] == "Once"
+    # the `UPDATE ... RETURNING` and the search index, no refresh after commit
+    story_statements = [s for s in statements if '"ShameStories' in s]
+    assert [s.split()[0] for s in story_statements] == ["UPDATE", "DELETE", "INSERT"]
+
+
+def test_api_agree_shamestory():
+    headers = auth_headers("agreeing", "3333")
+
+    before = agree_buffer.pending(1)
+    responce = client.post("/shamestories/1/agree", headers=headers)
+    assert responce.status_code == 202
+    assert responce.json() == {"id": 1, "pending": before + 1}
+
+    responce = client.post("/shamestories/999/agree", headers=headers)
+    assert responce.status_code == 404
+
+
+def test_api_import_shamestories():
+    headers = auth_headers("importer", "4444")
+
+    body = "\n".join(
+        [
+            '{"shamestory": {"title": "Imported", "text": "One"},'
+            ' "address": {"country": "Ukraine", "state": "Lviv",'
+            ' "city": "Lviv", "street": "Hrinchenka, 14a"}}',
+            "{broken",
+        ]
+    )
+    responce = client.post(
+        "/shamestories/import",
+        content=body,
+        headers={**headers, "Content-Type": "application/x-ndjson"},
+    )
+    assert responce.status_code == 200
+
+    report = responce.json()
+    assert report["rows"] == 2
+    assert report["inserted"] == 1
+    assert report["errors"][0]["line"] == 2
+
+
+def test_api_export_shamestories():
+    headers = auth_headers("exporter", "5555")
+
+    responce = client.get("/shamestories/export", params={"format": "csv"}, headers=headers)
+    assert responce.status_code == 200
+    assert responce.headers["content-type"].startswith("text/csv")
+    assert responce.text.splitlines()[0].startswith("id,title,text,agree")
+
+    responce = client.get("/shamestories/export", headers=headers)
+    assert responce.status_code == 200
+    assert responce.headers["content-type"] == "application/x-ndjson"
+
+
 # def test_get_shamestories_by_location():
 #     location = schemas.CreateAddress(
 #         country="Ukraine",
@@ -168,3 +473,73 @@ def test_api_delete_shamestory():
     with pytest.raises(NoResultFound):
         found = client.get(f"/shamestories/{shamestory_id}")
         assert found is None
+
+
+def test_api_location_stats():
+    headers = auth_headers("located", "8888")
+    client.post(
+        "/shamestories/",
+        json={
+            "shamestory": {"title": "Located", "text": "Counted per location"},
+            "address": {
+                "country": "Moldova",
+                "state": "Chisinau",
+                "city": "Chisinau",
+                "street": "Stefan cel Mare, 1",
+            },
+        },
+        headers=headers,
+    )
+
+    responce = client.get("/stats/locations", params={"level": "city"})
+    assert responce.status_code == 200
+    assert {
+        "country": "Moldova",
+        "state": "Chisinau",
+        "city": "Chisinau",
+        "stories": 1,
+        "agree": 0,
+    } in responce.json()
+
+    responce = client.get("/stats/locations")
+    moldova = {"country": "Moldova", "state": None, "city": None}
+    assert {**moldova, "stories": 1, "agree": 0} in responce.json()
+
+    responce = client.get("/stats/locations", params={"level": "street"})
+    assert responce.status_code == 422
+
+
+def test_api_top_shamestories():
+    responce = client.get("/shamestories/top", params={"limit": 5})
+    assert responce.status_code == 200
+    agree = [story["agree"] for story in responce.json()]
+    assert agree == sorted(agree, reverse=True)
+
+    responce = client.get("/shamestories/top", params={"country": "Atlantis"})
+    assert responce.json() == []
+
+    responce = client.get("/shamestories/top", params={"limit": 1000})
+    assert responce.status_code == 422
+
+
+def test_api_internal_stats(monkeypatch):
+    responce = client.get("/internal/stats")
+    assert responce.status_code == 404
+
+    monkeypatch.setattr(settings, "INTERNAL_TOKEN", "s3cret")
+    responce = client.get("/internal/stats", headers={"X-Internal-Token": "wrong"})
+    assert responce.status_code == 404
+
+    headers = {"X-Internal-Token": "s3cret"}
+    responce = client.get("/internal/stats", headers=headers)
+    assert responce.status_code == 200
+
+    stats = responce.json()
+    assert {"checkouts", "checked_out", "waits", "timeouts"} <= set(stats["database_pool"])
+    assert stats["response_cache"]["maxsize"] > 0
+
+    responce = client.get(
+        "/internal/pool/checkouts", params={"older_than": 60}, headers=headers
+    )
+    assert responce.status_code == 200
+    assert responce.json()["database_pool"] == []
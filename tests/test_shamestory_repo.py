@@ -1,12 +1,13 @@
 from typing import Generator
 
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.pool import StaticPool
 
-from shame import schemas, repository
+from shame import schemas, repository, versioning
+from shame.pagination import Cursor, decode_cursor, next_cursor
 from shame.database import Base
 from shame.models import Address, ShameStory
 from shame.auth.models import User
@@ -89,6 +90,34 @@ def test_repo_insert_address(session: Session):
     assert db_address.street == address.street
 
 
+def test_repo_upsert_address(session: Session):
+    address = schemas.CreateAddress(
+        country="Ukraine",
+        state="Ternopil",
+        city="Ternopil",
+        street="Ostrozkiy, 53",
+    )
+    assert repository.upsert_address(session, address) == 3
+
+    spaced = schemas.CreateAddress(
+        country=" Ukraine",
+        state="Kyiv",
+        city="Kyiv ",
+        street="Vassylkivska,   5",
+    )
+    new_id = repository.upsert_address(session, spaced)
+    session.commit()
+
+    assert new_id not in (0, 3)
+    assert repository.upsert_address(
+        session,
+        schemas.CreateAddress(
+            country="Ukraine", state="Kyiv", city="Kyiv", street="Vassylkivska, 5"
+        ),
+    ) == new_id
+    assert session.get_one(Address, new_id).street == "Vassylkivska, 5"
+
+
 def test_repo_insert_shamestory(session: Session):
     shamestory = schemas.CreateShameStory(
         title="Lorem Short",
@@ -176,6 +205,184 @@ def test_repo_get_shamestories(session: Session):
     assert example.address.street == "Hrinchenka, 14a"
 
 
+def count_queries(session: Session, load) -> int:
+    statements: list[str] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        load()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return len(statements)
+
+
+def test_repo_get_shamestories_expanded_in_one_query(session: Session):
+    for i in range(1, 11):
+        session.add(User(id=i, username=f"author{i}", password_hashed="1111"))
+        session.add(
+            Address(id=10 + i, country="Ukraine", state="S", city="C", street=f"{i}")
+        )
+    session.commit()
+    for i in range(1, 11):
+        repository.add(
+            session,
+            schemas.CreateShameStory(title=f"Story {i}", text="Expanded"),
+            author_id=i,
+            address_id=10 + i,
+        )
+    session.expunge_all()
+
+    def load_page():
+        page = repository.get(session, limit=20, expand={"author", "address"})
+        assert len(page) == 11
+        for story in page:
+            assert story.author.username
+            assert story.address.street
+
+    assert count_queries(session, load_page) == 1
+
+    session.expunge_all()
+
+    def load_page_lazily():
+        for story in repository.get(session, limit=20):
+            assert story.author.username
+
+    # the N+1 the expanded shape avoids: one query per distinct author
+    assert count_queries(session, load_page_lazily) == 1 + 11
+
+
+def test_repo_get_many(session: Session):
+    ids = [
+        repository.add(
+            session,
+            schemas.CreateShameStory(title=f"Many {i}", text="-"),
+            author_id=0,
+            address_id=3,
+        ).id
+        for i in range(3)
+    ]
+    session.expunge_all()
+    wanted = [ids[2], 999, ids[0], ids[2]]
+
+    held: list = []
+
+    def load():
+        stories = repository.get_many(session, wanted)
+        assert [story.id for story in stories] == [ids[2], ids[0], ids[2]]
+        held.extend(stories)
+
+    assert count_queries(session, load) == 1
+    # held in the identity map now, only the unknown id is looked up
+    assert count_queries(session, load) == 1
+
+    def load_expanded():
+        stories = repository.get_many(session, [ids[0]], expand={"address"})
+        assert stories[0].address.city == "Ternopil"
+        held.extend(stories)
+
+    # the mapped story lacks its address, so it is loaded again
+    assert count_queries(session, load_expanded) == 1
+    assert count_queries(session, load_expanded) == 0
+
+
+def test_repo_get_projected(session: Session):
+    for i in range(5):
+        repository.add(
+            session,
+            schemas.CreateShameStory(title=f"Projected {i}", text="Long text " * 50),
+            author_id=0,
+            address_id=3,
+        )
+
+    statements: list[str] = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        rows = repository.get_projected(session, ["title"], limit=2, address_id=3)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert len(statements) == 1
+    assert '"ShameStories".text' not in statements[0]
+    assert [tuple(row) for row in rows] == [
+        ("Projected 0", 0, rows[0].id),
+        ("Projected 1", 0, rows[1].id),
+    ]
+
+    after = Cursor(agree=rows[-1].agree, id=rows[-1].id)
+    rest = repository.get_projected(session, ["id"], after=after, address_id=3)
+    assert [tuple(row) for row in rest] == [
+        (rows[1].id + i, 0) for i in range(1, 4)
+    ]
+
+
+def test_repo_get_shamestories_keyset(session: Session):
+    for i in range(30):
+        repository.add(
+            session,
+            schemas.CreateShameStory(title="P" * i, text="Lo Ho" * i),
+            author_id=0,
+            address_id=0 if i % 2 else 3,
+        )
+
+    seen: list[int] = []
+    cursor = None
+    while True:
+        page = repository.get(session, limit=7, after=cursor)
+        seen.extend(story.id for story in page)
+        token = next_cursor(page, 7)
+        if token is None:
+            break
+        cursor = decode_cursor(token)
+
+    assert len(seen) == 31
+    assert len(set(seen)) == 31
+    assert seen == sorted(seen)
+
+    by_address = repository.get_by_address(session, address_id=3, limit=5)
+    rest = repository.get_by_address(
+        session,
+        address_id=3,
+        limit=50,
+        after=decode_cursor(next_cursor(by_address, 5) or ""),
+    )
+    assert len(by_address) + len(rest) == 15
+    assert {s.id for s in by_address}.isdisjoint({s.id for s in rest})
+
+
+def test_repo_get_shamestories_keyset_stable_on_ties(session: Session):
+    for i in range(10):
+        repository.add(
+            session,
+            schemas.CreateShameStory(title="T", text="Tie"),
+            author_id=0,
+            address_id=0,
+        )
+
+    first = repository.get_by_author(session, author_id=0, limit=4)
+    token = next_cursor(first, 4)
+    assert token is not None
+
+    # a new story with the same `agree` sorts after every seen id
+    repository.add(
+        session,
+        schemas.CreateShameStory(title="New", text="Inserted between pages"),
+        author_id=0,
+        address_id=0,
+    )
+    rest = repository.get_by_author(
+        session, author_id=0, limit=50, after=decode_cursor(token)
+    )
+    ids = [s.id for s in first] + [s.id for s in rest]
+    assert len(ids) == len(set(ids)) == 12
+
+
 def test_repo_update_shamestory(session: Session):
     """Check updating shamestory though repository"""
 
@@ -200,6 +407,45 @@ def test_repo_update_shamestory(session: Session):
     assert db_shamestory.title == updated.title
 
 
+def test_repo_update_shamestory_versioned(session: Session):
+    assert repository.get_by_id(db=session, shamestory_id=0).version == 1
+
+    updated = repository.update(
+        db=session,
+        shamestory_id=0,
+        values=schemas.UpdateShameStory(title="Patched"),
+        author_id=0,
+        versions={1},
+    )
+    assert updated.title == "Patched"
+    assert updated.text.startswith("Lorem ipsum dolor")
+    assert updated.version == 2
+
+    with pytest.raises(versioning.VersionConflict):
+        repository.update(
+            db=session,
+            shamestory_id=0,
+            values=schemas.UpdateShameStory(title="Stale"),
+            versions={1},
+        )
+    with pytest.raises(repository.NotAuthor):
+        repository.update(
+            db=session,
+            shamestory_id=0,
+            values=schemas.UpdateShameStory(title="Stranger"),
+            author_id=42,
+        )
+    with pytest.raises(NoResultFound):
+        repository.update(
+            db=session,
+            shamestory_id=424242,
+            values=schemas.UpdateShameStory(title="Missing"),
+        )
+
+    db_shamestory = repository.get_by_id(db=session, shamestory_id=0)
+    assert (db_shamestory.title, db_shamestory.version) == ("Patched", 2)
+
+
 def test_repo_delete_shamestory(session: Session):
     id = 0
     to_delete = repository.get_by_id(db=session, shamestory_id=id)
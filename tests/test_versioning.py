@@ -0,0 +1,16 @@
+from shame import versioning
+from shame.cache import make_etag
+
+
+def test_parse_if_match():
+    etag = make_etag(b"{}", version=7)
+    assert etag.startswith('"7.')
+
+    assert versioning.parse_if_match(None) is None
+    assert versioning.parse_if_match(" * ") is None
+    assert versioning.parse_if_match(etag) == {7}
+    assert versioning.parse_if_match(f'{etag}, "3.abc"') == {3, 7}
+    # strong comparison: weak or unversioned tags match nothing
+    assert versioning.parse_if_match(f"W/{etag}") == frozenset()
+    assert versioning.parse_if_match(make_etag(b"{}")) == frozenset()
+    assert versioning.parse_if_match("garbage") == frozenset()